@@ -1,7 +1,15 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
 from django.contrib.auth.models import Group, User  # Стандартные модели Django
+from django.db import transaction
+from django.template.response import TemplateResponse
 
-from .models import CashFlow, Category, OperationType, Status, SubCategory
+from .forms import (BulkCategoryForm, BulkStatusForm, CashFlowAdminForm,
+                    CategoryAdminForm, SubCategoryAdminForm)
+from .models import (ArchivedMonth, Budget, CashFlow, Category, ExchangeRate,
+                     OperationType, RecurringOperation, Status, SubCategory)
+from .services import bulk
+from .services.merge import merge, merge_preview
 
 # Отменяем стандартную регистрацию User
 admin.site.unregister(User)
@@ -17,16 +25,79 @@ class CustomUserAdmin(admin.ModelAdmin):
     filter_horizontal = ("groups", "user_permissions")
 
 
+@admin.action(description="Объединить выбранные в одну")
+def merge_selected(modeladmin, request, queryset):
+    """
+    Объединяет выбранные категории (подкатегории) с одной из них.
+
+    Промежуточная страница показывает, сколько объектов будет перенесено
+    из каждого элемента; перенос выполняется массовыми UPDATE в одной
+    транзакции.
+    """
+    items = list(queryset)
+    if len(items) < 2:
+        modeladmin.message_user(
+            request, "Выберите хотя бы два элемента", level=messages.WARNING
+        )
+        return None
+
+    if request.POST.get("apply"):
+        target = next(
+            (item for item in items if str(item.pk) == request.POST.get("target")),
+            None,
+        )
+        if target is None:
+            modeladmin.message_user(
+                request, "Не выбран элемент для объединения", level=messages.ERROR
+            )
+            return None
+        try:
+            with transaction.atomic():
+                moved = sum(
+                    merge(item, target)["cashflows"]
+                    for item in items
+                    if item.pk != target.pk
+                )
+        except ValueError as e:
+            modeladmin.message_user(request, str(e), level=messages.ERROR)
+            return None
+        modeladmin.message_user(
+            request, f"Объединено с «{target}», перенесено записей ДДС: {moved}"
+        )
+        return None
+
+    return TemplateResponse(
+        request,
+        "admin/cashflow/merge_selected.html",
+        {
+            **modeladmin.admin_site.each_context(request),
+            "title": "Объединение",
+            "opts": modeladmin.model._meta,
+            "items": [(item, merge_preview(item)) for item in items],
+            "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+        },
+    )
+
+
+class OwnerAdminMixin:
+    """Админка видит записи всех пользователей; новая запись — текущего"""
+
+    def get_changeform_initial_data(self, request):
+        return {"owner": request.user.pk, **super().get_changeform_initial_data(request)}
+
+
 @admin.register(Status)
-class StatusAdmin(admin.ModelAdmin):
-    list_display = ("id", "name")
+class StatusAdmin(OwnerAdminMixin, admin.ModelAdmin):
+    list_display = ("id", "name", "owner")
+    list_filter = ("owner",)
     search_fields = ("name",)
     ordering = ("name",)
 
 
 @admin.register(OperationType)
-class OperationTypeAdmin(admin.ModelAdmin):
-    list_display = ("id", "name")
+class OperationTypeAdmin(OwnerAdminMixin, admin.ModelAdmin):
+    list_display = ("id", "name", "is_income", "owner")
+    list_filter = ("owner",)
     search_fields = ("name",)
     ordering = ("name",)
 
@@ -39,20 +110,30 @@ class SubCategoryInline(admin.TabularInline):
 
 
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
-    list_display = ("id", "name")
-    list_filter = ("operation_type",)
+class CategoryAdmin(OwnerAdminMixin, admin.ModelAdmin):
+    form = CategoryAdminForm
+    list_display = ("id", "name", "owner")
+    list_filter = ("owner", "operation_type")
     search_fields = ("name",)
     ordering = ("operation_type", "name")
     inlines = [SubCategoryInline]
+    actions = [merge_selected]
+
+    def save_formset(self, request, form, formset, change):
+        # Подкатегории принадлежат владельцу своей категории
+        for inline_form in formset.forms:
+            inline_form.instance.owner_id = form.instance.owner_id
+        super().save_formset(request, form, formset, change)
 
 
 @admin.register(SubCategory)
-class SubCategoryAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "category", "operation_type")
-    list_filter = ("category", "category__operation_type")
+class SubCategoryAdmin(OwnerAdminMixin, admin.ModelAdmin):
+    form = SubCategoryAdminForm
+    list_display = ("id", "name", "category", "operation_type", "owner")
+    list_filter = ("owner", "category", "category__operation_type")
     search_fields = ("name", "category__name")
     ordering = ("category", "name")
+    actions = [merge_selected]
 
     @admin.display(description="Тип операции")
     def operation_type(self, obj):
@@ -60,7 +141,8 @@ class SubCategoryAdmin(admin.ModelAdmin):
 
 
 @admin.register(CashFlow)
-class CashFlowAdmin(admin.ModelAdmin):
+class CashFlowAdmin(OwnerAdminMixin, admin.ModelAdmin):
+    form = CashFlowAdminForm
     list_display = (
         "date",
         "status",
@@ -68,10 +150,26 @@ class CashFlowAdmin(admin.ModelAdmin):
         "category",
         "subcategory",
         "amount",
+        "currency",
         "comment_short",
+        "owner",
+    )
+    list_filter = (
+        "owner",
+        "status",
+        "operation_type",
+        "category",
+        "subcategory",
+        "currency",
+        "date",
+    )
+    # Короткий комментарий целиком лежит в comment_preview, длинный — в note
+    search_fields = (
+        "comment_preview",
+        "note__comment",
+        "subcategory__name",
+        "category__name",
     )
-    list_filter = ("status", "operation_type", "category", "subcategory", "date")
-    search_fields = ("comment", "subcategory__name", "category__name")
     date_hierarchy = "date"
     ordering = ("-date",)
     fieldsets = (
@@ -79,21 +177,155 @@ class CashFlowAdmin(admin.ModelAdmin):
             None,
             {
                 "fields": (
+                    "owner",
                     "date",
                     "status",
                     "operation_type",
                     "category",
                     "subcategory",
                     "amount",
+                    "currency",
                 )
             },
         ),
         ("Дополнительно", {"fields": ("comment",), "classes": ("collapse",)}),
     )
 
+    actions = ["bulk_set_status", "bulk_recategorize", "bulk_delete"]
+
     @admin.display(description="Комментарий")
     def comment_short(self, obj):
-        return obj.comment[:50] + "..." if len(obj.comment) > 50 else obj.comment
+        # Начало комментария хранится в записи: список не читает CashFlowNote
+        comment = obj.comment_preview
+        return comment[:50] + "..." if len(comment) > 50 else comment
+
+    def get_actions(self, request):
+        # Стандартное удаление загружает каждую запись; вместо него — bulk_delete
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+    def _confirm(self, request, queryset, action: str, title: str, form=None):
+        """
+        Промежуточная страница массового действия.
+
+        Выбранные id (или признак «выбрать все») передаются дальше как есть:
+        при выборе всех записей действие получает выборку по фильтрам
+        списка, а записи не загружаются.
+        """
+        return TemplateResponse(
+            request,
+            "admin/cashflow/bulk_action.html",
+            {
+                **self.admin_site.each_context(request),
+                "title": title,
+                "opts": self.model._meta,
+                "form": form,
+                "count": queryset.count(),
+                "action": action,
+                "select_across": request.POST.get("select_across", "0"),
+                "selected": request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+                "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+            },
+        )
+
+    @admin.action(description="Изменить статус", permissions=["change"])
+    def bulk_set_status(self, request, queryset):
+        form = BulkStatusForm(request.POST if request.POST.get("apply") else None)
+        if not form.is_valid():
+            return self._confirm(
+                request, queryset, "bulk_set_status", "Изменение статуса", form
+            )
+        count = bulk.set_status(queryset, form.cleaned_data["status"])
+        self.message_user(request, f"Статус изменен у записей: {count}")
+        return None
+
+    @admin.action(description="Перенести в категорию", permissions=["change"])
+    def bulk_recategorize(self, request, queryset):
+        form = BulkCategoryForm(request.POST if request.POST.get("apply") else None)
+        if not form.is_valid():
+            return self._confirm(
+                request, queryset, "bulk_recategorize", "Перенос в категорию", form
+            )
+        try:
+            count, skipped = bulk.recategorize(
+                queryset,
+                form.cleaned_data["category"],
+                form.cleaned_data["subcategory"],
+            )
+        except ValueError as e:
+            form.add_error("subcategory", str(e))
+            return self._confirm(
+                request, queryset, "bulk_recategorize", "Перенос в категорию", form
+            )
+        message = f"Перенесено записей: {count}"
+        if skipped:
+            message += f", пропущено {skipped} (подкатегория не относится к категории)"
+        self.message_user(request, message)
+        return None
+
+    @admin.action(description="Удалить выбранные записи ДДС", permissions=["delete"])
+    def bulk_delete(self, request, queryset):
+        if not request.POST.get("apply"):
+            return self._confirm(request, queryset, "bulk_delete", "Удаление записей")
+        count = bulk.delete(queryset)
+        self.message_user(request, f"Удалено записей: {count}")
+        return None
+
+
+@admin.register(RecurringOperation)
+class RecurringOperationAdmin(OwnerAdminMixin, admin.ModelAdmin):
+    list_display = (
+        "name",
+        "frequency",
+        "interval",
+        "amount",
+        "currency",
+        "category",
+        "subcategory",
+        "next_date",
+        "is_active",
+        "owner",
+    )
+    list_filter = ("owner", "is_active", "frequency", "operation_type", "category")
+    search_fields = ("name", "comment")
+    readonly_fields = ("next_date",)
+    ordering = ("name",)
+
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ("currency", "date", "rate")
+    list_filter = ("currency",)
+    date_hierarchy = "date"
+    ordering = ("currency", "-date")
+
+
+@admin.register(Budget)
+class BudgetAdmin(admin.ModelAdmin):
+    list_display = ("month", "category", "subcategory", "limit", "spent", "mode")
+    list_filter = ("mode", "category")
+    readonly_fields = ("spent",)
+    date_hierarchy = "month"
+    ordering = ("-month", "category")
+
+
+@admin.register(ArchivedMonth)
+class ArchivedMonthAdmin(admin.ModelAdmin):
+    """Архивные месяцы создаются только командой archive_cashflows"""
+
+    list_display = ("month", "rows", "path", "created_at")
+    date_hierarchy = "month"
+    ordering = ("-month",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
 # Если нужно добавить Group в админку с кастомными настройками
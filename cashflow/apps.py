@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CashflowConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "cashflow"
+
+    def ready(self) -> None:
+        """Подключаем обработчики сигналов моделей и проверки проекта"""
+        from . import checks, signals  # noqa: F401
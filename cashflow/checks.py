@@ -0,0 +1,20 @@
+from django.contrib.staticfiles import finders
+from django.core.checks import Tags, Warning, register
+
+from .services.assets import ICONS_CDN, ICONS_CSS
+
+
+@register(Tags.staticfiles, deploy=True)
+def check_vendored_icons(app_configs, **kwargs) -> list[Warning]:
+    """Без локальной копии Bootstrap Icons страницы подключают иконки с CDN"""
+    if finders.find(ICONS_CSS):
+        return []
+    return [
+        Warning(
+            f"Не найдена локальная копия Bootstrap Icons ({ICONS_CSS}), "
+            f"страницы подключают {ICONS_CDN}",
+            hint="Выполните python manage.py vendor_icons и добавьте "
+            "static/vendor/bootstrap-icons/ в репозиторий",
+            id="cashflow.W001",
+        )
+    ]
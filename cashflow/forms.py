@@ -2,8 +2,10 @@ from django import forms
 from django.forms import BooleanField, ImageField
 from django.utils import timezone
 
-from cashflow.models import CashFlow, Category, OperationType, SubCategory
-from cashflow.services.validators import CashFlowValidator
+from cashflow.models import (CashFlow, Category, OperationType, OwnedModel,
+                             Status, SubCategory)
+from cashflow.services.validators import (CashFlowValidator, CategoryValidator,
+                                          SubCategoryValidator)
 
 
 class StyleFormMixin:
@@ -18,15 +20,55 @@ class StyleFormMixin:
                 field.widget.attrs["class"] = "form-control"
 
 
-class CashFlowForm(StyleFormMixin, forms.ModelForm):
+class OwnedFormMixin:
+    """
+    Форма данных пользователя: в полях выбора — только справочники
+    владельца, а новый объект получает владельца при сохранении.
+    """
+
+    def __init__(self, *args: any, owner, **kwargs: any) -> None:
+        super().__init__(*args, **kwargs)
+        self.owner = owner
+        self.instance.owner = owner
+        for field in self.fields.values():
+            queryset = getattr(field, "queryset", None)
+            if queryset is not None and issubclass(queryset.model, OwnedModel):
+                field.queryset = queryset.filter(owner=owner)
+
+
+class CommentFormMixin:
+    """
+    Полный комментарий записи ДДС: он хранится вне записи (CashFlowNote),
+    поэтому поле comment объявляется в форме, а не берется из модели.
+    """
+
+    def __init__(self, *args: any, **kwargs: any) -> None:
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.initial.setdefault("comment", self.instance.comment)
+
+    def save(self, commit: bool = True) -> CashFlow:
+        self.instance.comment = self.cleaned_data.get("comment", "")
+        return super().save(commit)
+
+
+class CashFlowForm(CommentFormMixin, OwnedFormMixin, StyleFormMixin, forms.ModelForm):
     """
     Форма для создания и редактирования записей ДДС.
     Использует сервисный слой для валидации.
     """
 
+    comment = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={"rows": 3}),
+        label="Комментарий",
+    )
+
     class Meta:
         model = CashFlow
         fields = "__all__"
+        # Внешний идентификатор заполняется только при импорте
+        exclude = ["owner", "source_reference"]
         widgets = {
             "date": forms.DateInput(
                 attrs={
@@ -36,7 +78,6 @@ class CashFlowForm(StyleFormMixin, forms.ModelForm):
                 format="%Y-%m-%d",
             ),
             "amount": forms.NumberInput(attrs={"min": "0.01", "step": "0.01"}),
-            "comment": forms.Textarea(attrs={"rows": 3}),
         }
 
     def __init__(self, *args: any, **kwargs: any) -> None:
@@ -51,7 +92,7 @@ class CashFlowForm(StyleFormMixin, forms.ModelForm):
             try:
                 category_id = int(self.data.get("category"))
                 self.fields["subcategory"].queryset = SubCategory.objects.filter(
-                    category_id=category_id
+                    category_id=category_id, owner=self.owner
                 ).order_by("name")
             except (ValueError, TypeError):
                 pass
@@ -61,21 +102,88 @@ class CashFlowForm(StyleFormMixin, forms.ModelForm):
             )
 
     def clean(self) -> dict[str, any]:
-        """Основная валидация формы"""
+        """Основная валидация формы (предупреждения о бюджетах — в budget_warnings)"""
         cleaned_data = super().clean()
-        return CashFlowValidator.validate_all(cleaned_data)
+        self.budget_warnings: list[str] = []
+        return CashFlowValidator.validate_all(
+            cleaned_data, self.instance, self.budget_warnings
+        )
+
 
+class CashFlowAdminForm(CommentFormMixin, forms.ModelForm):
+    """Форма записи ДДС в админке"""
+
+    comment = forms.CharField(
+        required=False, widget=forms.Textarea, label="Комментарий"
+    )
 
-class OperationTypeForm(forms.ModelForm):
     class Meta:
-        model = OperationType
+        model = CashFlow
+        fields = "__all__"
+
+    def clean(self) -> dict[str, any]:
+        """Бюджеты с запретом проверяются и при изменении записи в админке"""
+        cleaned_data = super().clean()
+        if all(cleaned_data.get(key) for key in ["date", "amount", "category"]):
+            CashFlowValidator.validate_budget(cleaned_data, self.instance)
+        return cleaned_data
+
+
+class CategoryAdminForm(forms.ModelForm):
+    """
+    Форма категории в админке. Смена типа операции у категории с записями
+    ДДС нарушила бы составной внешний ключ только при COMMIT — проверяем заранее.
+    """
+
+    class Meta:
+        model = Category
+        fields = "__all__"
+
+    def clean_operation_type(self) -> OperationType:
+        return CategoryValidator.validate_operation_type(
+            self.cleaned_data["operation_type"], self.instance
+        )
+
+
+class SubCategoryAdminForm(forms.ModelForm):
+    """Форма подкатегории в админке: перенос с записями ДДС — только объединением"""
+
+    class Meta:
+        model = SubCategory
+        fields = "__all__"
+
+    def clean_category(self) -> Category:
+        return SubCategoryValidator.validate_category(
+            self.cleaned_data["category"], self.instance
+        )
+
+
+class StatusForm(OwnedFormMixin, forms.ModelForm):
+    class Meta:
+        model = Status
         fields = ["name"]
+
+    def clean_name(self) -> str:
+        name: str = self.cleaned_data["name"]
+        if (
+            Status.objects.filter(name__iexact=name, owner=self.owner)
+            .exclude(pk=self.instance.pk)
+            .exists()
+        ):
+            raise forms.ValidationError("Статус с таким названием уже существует")
+        return name
+
+
+class OperationTypeForm(OwnedFormMixin, forms.ModelForm):
+    class Meta:
+        model = OperationType
+        fields = ["name", "is_income"]
         labels = {"name": "Название типа*"}
 
     def clean_name(self) -> str:
         name: str = self.cleaned_data["name"]
         if (
-            OperationType.objects.filter(name__iexact=name)
+            OperationType.objects.filter(name__iexact=name, owner=self.owner)
             .exclude(pk=self.instance.pk)
             .exists()
         ):
@@ -83,7 +191,7 @@ class OperationTypeForm(forms.ModelForm):
         return name
 
 
-class CategoryForm(forms.ModelForm):
+class CategoryForm(OwnedFormMixin, forms.ModelForm):
     class Meta:
         model = Category
         fields = ["name", "operation_type"]
@@ -109,8 +217,13 @@ class CategoryForm(forms.ModelForm):
             )
         return name
 
+    def clean_operation_type(self) -> OperationType:
+        return CategoryValidator.validate_operation_type(
+            self.cleaned_data["operation_type"], self.instance
+        )
+
 
-class SubCategoryForm(forms.ModelForm):
+class SubCategoryForm(OwnedFormMixin, forms.ModelForm):
     class Meta:
         model = SubCategory
         fields = ["name", "category"]
@@ -118,11 +231,62 @@ class SubCategoryForm(forms.ModelForm):
 
     def __init__(self, *args: any, **kwargs: any) -> None:
         super().__init__(*args, **kwargs)
-        # Всегда показываем все категории
-        self.fields["category"].queryset = Category.objects.all().select_related(
-            "operation_type"
-        )
+        # Всегда показываем все категории владельца
+        self.fields["category"].queryset = Category.objects.filter(
+            owner=self.owner
+        ).select_related("operation_type")
 
         # Если форма привязана к существующему объекту
         if self.instance and self.instance.pk:
             self.fields["category"].initial = self.instance.category
+
+    def clean_category(self) -> Category:
+        return SubCategoryValidator.validate_category(
+            self.cleaned_data["category"], self.instance
+        )
+
+
+class MergeForm(StyleFormMixin, forms.Form):
+    """Выбор категории или подкатегории, в которую переносятся записи"""
+
+    target = forms.ModelChoiceField(
+        queryset=Category.objects.none(), label="Перенести в*"
+    )
+
+    def __init__(
+        self, *args: any, source: Category | SubCategory, **kwargs: any
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        # Объединять можно только справочники одного типа операции
+        if isinstance(source, Category):
+            queryset = Category.objects.filter(operation_type=source.operation_type_id)
+        else:
+            queryset = SubCategory.objects.filter(
+                category__operation_type=source.category.operation_type_id
+            ).select_related("category")
+        self.fields["target"].queryset = (
+            queryset.filter(owner=source.owner_id)
+            .exclude(pk=source.pk)
+            .order_by("name")
+        )
+
+
+class BulkStatusForm(forms.Form):
+    """Новый статус для массового изменения записей ДДС в админке"""
+
+    status = forms.ModelChoiceField(queryset=Status.objects.all(), label="Статус")
+
+
+class BulkCategoryForm(forms.Form):
+    """Новая категория (и подкатегория) для массового переноса записей ДДС"""
+
+    category = forms.ModelChoiceField(
+        queryset=Category.objects.select_related("operation_type"), label="Категория"
+    )
+    subcategory = forms.ModelChoiceField(
+        queryset=SubCategory.objects.select_related("category"),
+        required=False,
+        label="Подкатегория",
+        help_text="Если не указана, переносятся только записи, подкатегория "
+        "которых относится к выбранной категории",
+    )
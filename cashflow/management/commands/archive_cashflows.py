@@ -0,0 +1,62 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from cashflow.services.archive import archive_month, months_to_archive
+from cashflow.services.reports import parse_date, shift_months
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит записи ДДС старше указанной даты (целыми месяцами) в сжатые "
+        "файлы Parquet, оставляя в базе итоги по месяцам. Отчеты продолжают "
+        "учитывать архивные периоды"
+    )
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument(
+            "--before", help="Архивировать месяцы раньше даты (YYYY-MM-DD)"
+        )
+        group.add_argument(
+            "--older-than-months",
+            type=int,
+            help="Архивировать месяцы старше N месяцев от текущего",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать месяцы, которые будут архивированы",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            if options["before"]:
+                before = parse_date(options["before"])
+            else:
+                today = timezone.now().date().replace(day=1)
+                before = shift_months(today, -options["older_than_months"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        months = months_to_archive(before)
+        if not months:
+            self.stdout.write("Нет записей для архивации")
+            return
+        total = 0
+        for month in months:
+            if options["dry_run"]:
+                self.stdout.write(f"{month:%m.%Y}")
+                continue
+            try:
+                rows = archive_month(month)
+            except (ValueError, ImproperlyConfigured) as e:
+                raise CommandError(str(e))
+            total += rows
+            self.stdout.write(f"{month:%m.%Y}: {rows} записей")
+        if not options["dry_run"]:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Архивировано месяцев: {len(months)}, записей: {total}"
+                )
+            )
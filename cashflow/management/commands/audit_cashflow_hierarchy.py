@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from cashflow.services.hierarchy import audit, repair, validate_constraints
+
+KINDS = {
+    "subcategory": "подкатегория из другой категории",
+    "category": "категория другого типа операции",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Проверяет иерархию «тип операции → категория → подкатегория» во всех "
+        "записях ДДС (запрос на каждый вид нарушения) и исправляет ее (--fix)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Взять категорию из подкатегории, тип операции — из категории",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=20, help="Число id записей в отчете"
+        )
+
+    def handle(self, *args, **options):
+        report = audit(limit=options["limit"])
+        for kind, label in KINDS.items():
+            found = report[kind]
+            if not found["count"]:
+                self.stdout.write(f"{label}: нет")
+                continue
+            ids = ", ".join(map(str, found["ids"]))
+            self.stdout.write(
+                self.style.WARNING(f"{label}: {found['count']} (id: {ids})")
+            )
+
+        if not options["fix"]:
+            return
+        fixed = repair()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Исправлено записей: категория — {fixed['subcategory']}, "
+                f"тип операции — {fixed['category']}"
+            )
+        )
+        if validate_constraints():
+            self.stdout.write(self.style.SUCCESS("Внешние ключи иерархии проверены"))
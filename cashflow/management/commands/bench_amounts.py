@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models.functions import TruncMonth
+from django.test.utils import override_settings
+
+from cashflow.models import CashFlow
+from cashflow.services.currency import amount_sum
+
+STORAGES = ("decimal", "minor")
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает скорость агрегатов по суммам ДДС в режимах хранения "
+        "decimal (NUMERIC) и minor (целые копейки)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--currency", help="Валюта отчета (по умолчанию базовая)")
+
+    def handle(self, *args, **options):
+        repeat = options["repeat"]
+        currency = options["currency"]
+        queries = {
+            "итог": lambda: CashFlow.objects.aggregate(total=amount_sum(currency)),
+            "по валютам": lambda: list(
+                CashFlow.objects.order_by()
+                .values("currency")
+                .annotate(total=amount_sum(convert=False))
+            ),
+            "категории × месяцы": lambda: list(
+                CashFlow.objects.order_by()
+                .values("category_id", month=TruncMonth("date"))
+                .annotate(total=amount_sum(currency))
+            ),
+        }
+
+        rows = CashFlow.objects.count()
+        self.stdout.write(f"Записей: {rows}, повторов: {repeat}")
+        for name, query in queries.items():
+            results = {}
+            for storage in STORAGES:
+                with override_settings(CASHFLOW_AMOUNT_STORAGE=storage):
+                    results[storage] = query()
+                    started = time.perf_counter()
+                    for _ in range(repeat):
+                        query()
+                    elapsed = (time.perf_counter() - started) / repeat
+                self.stdout.write(
+                    f"{name}, {storage}: {elapsed * 1000:.2f} мс/запрос "
+                    f"({rows / elapsed / 1e6:.2f} млн записей/с)"
+                )
+            if results["decimal"] != results["minor"]:
+                self.stderr.write(f"{name}: результаты режимов различаются")
@@ -0,0 +1,118 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test.client import AsyncRequestFactory, RequestFactory
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает пропускную способность конкурентных запросов "
+        "под WSGI (пул потоков) и ASGI (event loop)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--wsgi-path",
+            action="append",
+            dest="wsgi_paths",
+            help="URL для прогона под WSGI (можно указать несколько раз)",
+        )
+        parser.add_argument(
+            "--asgi-path",
+            action="append",
+            dest="asgi_paths",
+            help="URL для прогона под ASGI (можно указать несколько раз)",
+        )
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=20)
+
+    def handle(self, *args, **options):
+        wsgi_paths = options["wsgi_paths"] or [
+            "/api/cashflows/",
+            "/get-categories/1/",
+        ]
+        asgi_paths = options["asgi_paths"] or [
+            "/api/async/cashflows/",
+            "/get-categories/1/",
+        ]
+        total = options["requests"]
+        concurrency = options["concurrency"]
+
+        self.stdout.write(f"Запросов: {total}, конкурентность: {concurrency}")
+        for path in wsgi_paths:
+            elapsed, statuses = self.run_wsgi(path, total, concurrency)
+            self.report("WSGI", path, total, elapsed, statuses)
+        for path in asgi_paths:
+            elapsed, statuses = asyncio.run(self.run_asgi(path, total, concurrency))
+            self.report("ASGI", path, total, elapsed, statuses)
+
+    def report(self, mode, path, total, elapsed, statuses):
+        codes = ", ".join(
+            f"{code}: {count}" for code, count in sorted(statuses.items())
+        )
+        self.stdout.write(
+            f"{mode} {path}: {total / elapsed:.1f} req/s "
+            f"({elapsed * 1000 / total:.2f} мс/запрос, коды ответов: {codes})"
+        )
+
+    @staticmethod
+    def run_wsgi(path, total, concurrency):
+        """Прогоняет запросы через WSGIHandler в пуле из concurrency потоков"""
+        handler = WSGIHandler()
+        factory = RequestFactory()
+
+        def call(_):
+            status = []
+            response = handler(
+                factory.get(path).environ,
+                lambda code, headers, exc_info=None: status.append(code),
+            )
+            b"".join(response)
+            response.close()
+            return int(status[0].split()[0])
+
+        statuses = {}
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for code in executor.map(call, range(total)):
+                statuses[code] = statuses.get(code, 0) + 1
+        return time.perf_counter() - started, statuses
+
+    @staticmethod
+    async def run_asgi(path, total, concurrency):
+        """Прогоняет запросы через ASGIHandler с ограничением конкурентности"""
+        handler = ASGIHandler()
+        factory = AsyncRequestFactory()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call():
+            messages = [{"type": "http.request", "body": b"", "more_body": False}]
+            disconnected = asyncio.Event()
+            status = []
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    status.append(message["status"])
+
+            async with semaphore:
+                await handler(factory.get(path).scope, receive, send)
+            disconnected.set()
+            return status[0]
+
+        started = time.perf_counter()
+        codes = await asyncio.gather(*(call() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+        statuses = {}
+        for code in codes:
+            statuses[code] = statuses.get(code, 0) + 1
+        return elapsed, statuses
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cashflow.services.anomalies import METHODS, detect_anomalies
+
+
+class Command(BaseCommand):
+    help = "Ищет аномальные суммы и всплески частоты операций по подкатегориям"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--method", choices=METHODS, default="mad")
+        parser.add_argument(
+            "--window", type=int, default=30, help="Число предыдущих операций в окне"
+        )
+        parser.add_argument("--threshold", type=float, help="Порог оценки")
+        parser.add_argument("--min-periods", type=int, default=5)
+        parser.add_argument(
+            "--since-id",
+            type=int,
+            help="Проверять только записи с id больше указанного (инкрементально)",
+        )
+        parser.add_argument("--history-days", type=int, default=365)
+        parser.add_argument("--frequency-factor", type=float, default=3.0)
+
+    def handle(self, *args, **options):
+        try:
+            result = detect_anomalies(
+                method=options["method"],
+                window=options["window"],
+                threshold=options["threshold"],
+                min_periods=options["min_periods"],
+                since_id=options["since_id"],
+                history_days=options["history_days"],
+                frequency_factor=options["frequency_factor"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for item in result["outliers"]:
+            score = f"{item['score']:.1f}" if item["score"] is not None else "inf"
+            self.stdout.write(
+                f"#{item['id']} {item['date']} подкатегория {item['subcategory']}: "
+                f"{item['amount']:.2f} {result['currency']} "
+                f"(ожидалось ~{item['expected']:.2f}, оценка {score})"
+            )
+        for item in result["frequency"]:
+            self.stdout.write(
+                f"{item['date']} подкатегория {item['subcategory']}: "
+                f"{item['count']} операций (обычно {item['typical']:g})"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Проверено записей: {result['checked']}, "
+                f"выбросов: {len(result['outliers'])}, "
+                f"всплесков частоты: {len(result['frequency'])}. "
+                f"Последний id: {result['last_id']}"
+            )
+        )
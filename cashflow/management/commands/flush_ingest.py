@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from cashflow.services.ingest import get_buffer
+
+
+class Command(BaseCommand):
+    help = (
+        "Фиксирует записи ДДС из журналов буфера записи, оставшихся после "
+        "остановки или сбоя воркеров (журналы работающих воркеров не трогает)"
+    )
+
+    def handle(self, *args, **options):
+        created = get_buffer().recover()
+        self.stdout.write(self.style.SUCCESS(f"Зафиксировано записей: {created}"))
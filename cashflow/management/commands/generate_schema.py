@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from cashflow.services import schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует схему OpenAPI в CASHFLOW_SCHEMA_DIR для текущей версии кода "
+        "(запускать при деплое)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Перегенерировать, даже если схема этой версии уже есть",
+        )
+
+    def handle(self, *args, **options):
+        version, generated = schema.write(force=options["force"])
+        path = schema.schema_path(version, "json")
+        if generated:
+            self.stdout.write(self.style.SUCCESS(f"Схема {version} сохранена: {path}"))
+        else:
+            self.stdout.write(f"Схема {version} актуальна: {path}")
@@ -0,0 +1,74 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from cashflow.services.imports import import_records, records_from_csv
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортирует записи ДДС из CSV (date, amount, status, operation_type, "
+        "category, subcategory, currency, comment, source_reference). Повторный "
+        "импорт того же файла не создает дублей"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к CSV-файлу")
+        parser.add_argument(
+            "--owner", required=True, help="Имя пользователя — владельца записей"
+        )
+        parser.add_argument("--encoding", default="utf-8-sig")
+        parser.add_argument("--delimiter", help="Разделитель CSV (по умолчанию — авто)")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--skip-invalid",
+            action="store_true",
+            help="Загрузить корректные строки, даже если в файле есть ошибки",
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            owner = User.objects.get(**{User.USERNAME_FIELD: options["owner"]})
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['owner']} не найден")
+        try:
+            with open(options["path"], encoding=options["encoding"]) as file:
+                records, errors = records_from_csv(
+                    file.read(), owner, options["delimiter"]
+                )
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for number, error in errors.items():
+            self.stdout.write(self.style.ERROR(f"Строка {number}: {error}"))
+        if errors and not options["skip_invalid"]:
+            raise CommandError(
+                f"Ошибок в файле: {len(errors)}. Ничего не загружено "
+                "(используйте --skip-invalid, чтобы загрузить корректные строки)"
+            )
+
+        try:
+            result = import_records(records, batch_size=options["batch_size"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Строк: {result['received']}, создано записей: {result['created']}, "
+                f"пропущено дублей: {result['duplicates']}"
+            )
+        )
+        for index, error in result["rejected"].items():
+            record = records[index]
+            self.stdout.write(
+                self.style.ERROR(
+                    f"Не загружена операция {record.date:%d.%m.%Y} на "
+                    f"{record.amount} {record.currency}: {error}"
+                )
+            )
+        if result["repeated"]:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Повторяющихся строк в файле: {result['repeated']} — загружена "
+                    "одна из одинаковых строк (различите их колонкой source_reference)"
+                )
+            )
@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from cashflow.services.recurring import materialize
+
+
+class Command(BaseCommand):
+    help = (
+        "Создает записи ДДС по всем наступившим регулярным операциям. "
+        "Идемпотентна и безопасна при параллельном запуске с нескольких хостов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--date",
+            help="Создать операции по указанную дату включительно (YYYY-MM-DD), "
+            "по умолчанию — сегодня",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        if options["date"]:
+            try:
+                until = datetime.strptime(options["date"], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError("Некорректный формат даты. Используйте YYYY-MM-DD")
+            if until > today:
+                raise CommandError("Дата не может быть в будущем")
+        else:
+            until = today
+
+        result = materialize(until, batch_size=options["batch_size"])
+        for template, error in result["errors"].items():
+            self.stdout.write(self.style.ERROR(f"{template}: {error}"))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Создано операций: {result['created']} "
+                f"по {result['templates']} шаблонам"
+            )
+        )
@@ -0,0 +1,151 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Холодный старт воркера в отдельном интерпретаторе: загрузка настроек,
+# django.setup() (готовность приложений), импорт модуля точки входа и
+# первый запрос. Время импортов пишет сам Python (-X importtime) в stderr.
+PROBE = """
+import json, os, sys, time
+started = time.perf_counter()
+import django
+from django.conf import settings
+settings.INSTALLED_APPS
+timings = {"settings": time.perf_counter() - started}
+django.setup(set_prefix=False)
+timings["apps_ready"] = time.perf_counter() - started
+entry, path = sys.argv[1], sys.argv[2]
+if entry == "wsgi":
+    import io
+    from config.wsgi import application
+    timings["entry_import"] = time.perf_counter() - started
+    environ = {
+        "REQUEST_METHOD": "GET",
+        "PATH_INFO": path,
+        "QUERY_STRING": "",
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "80",
+        "wsgi.input": io.BytesIO(),
+        "wsgi.url_scheme": "http",
+    }
+    status = []
+    response = application(environ, lambda code, headers, exc_info=None: status.append(code))
+    b"".join(response)
+    response.close()
+    code = int(status[0].split()[0])
+else:
+    import asyncio
+    from config.asgi import application
+    timings["entry_import"] = time.perf_counter() - started
+    status = []
+    async def call():
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+        async def receive():
+            if messages:
+                return messages.pop()
+            # Клиент не отключается: ASGIHandler сам отменит ожидание после ответа
+            await asyncio.Event().wait()
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+            "query_string": b"", "root_path": "", "headers": [],
+            "client": ("127.0.0.1", 0), "server": ("localhost", 80),
+        }
+        await application(scope, receive, send)
+    asyncio.run(call())
+    code = status[0]
+timings["first_request"] = time.perf_counter() - started
+print(json.dumps({"timings": timings, "status": code, "modules": len(sys.modules)}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Профилирует холодный старт воркера: время импорта по модулям, "
+        "готовность приложений и время до первого ответа (WSGI и ASGI)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--entry",
+            choices=["wsgi", "asgi"],
+            action="append",
+            dest="entries",
+            help="Точка входа (по умолчанию обе)",
+        )
+        parser.add_argument("--path", default="/api/", help="URL первого запроса")
+        parser.add_argument(
+            "--top", type=int, default=15, help="Число самых дорогих пакетов в отчете"
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        for entry in options["entries"] or ["wsgi", "asgi"]:
+            runs = [
+                self.probe(entry, options["path"]) for _ in range(options["repeat"])
+            ]
+            # Лучший из повторов: меньше всего шума от диска и планировщика
+            best = min(runs, key=lambda run: run["timings"]["first_request"])
+            timings = best["timings"]
+            self.stdout.write(
+                self.style.MIGRATE_HEADING(
+                    f"{entry.upper()} {options['path']} (код ответа {best['status']}, "
+                    f"модулей загружено: {best['modules']})"
+                )
+            )
+            previous = 0.0
+            for stage, label in [
+                ("settings", "настройки"),
+                ("apps_ready", "готовность приложений (django.setup)"),
+                ("entry_import", f"импорт config.{entry}"),
+                ("first_request", "первый запрос"),
+            ]:
+                self.stdout.write(
+                    f"  {label}: +{(timings[stage] - previous) * 1000:.1f} мс "
+                    f"(всего {timings[stage] * 1000:.1f} мс)"
+                )
+                previous = timings[stage]
+            self.stdout.write("  самые дорогие пакеты (собственное время импорта):")
+            for package, micros in best["packages"][: options["top"]]:
+                self.stdout.write(f"    {package}: {micros / 1000:.1f} мс")
+
+    @staticmethod
+    def probe(entry: str, path: str) -> dict[str, any]:
+        """Запускает чистый интерпретатор и собирает время этапов и импортов"""
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE, entry, path],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode:
+            errors = [
+                line
+                for line in result.stderr.splitlines()
+                if not line.startswith("import time:")
+            ]
+            raise CommandError(
+                f"Воркер {entry} не запустился:\n" + "\n".join(errors[-20:])
+            )
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        packages: dict[str, int] = {}
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            own, _, name = line[len("import time:") :].split("|")
+            if not own.strip().isdigit():
+                continue
+            package = name.strip().split(".")[0]
+            packages[package] = packages.get(package, 0) + int(own)
+        probe["packages"] = sorted(packages.items(), key=lambda item: -item[1])
+        return probe
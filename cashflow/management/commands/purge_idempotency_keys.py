@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cashflow.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Удаляет устаревшие ключи идемпотентности API (запускать по cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours", type=int, default=24, help="Срок хранения ключа, часов"
+        )
+
+    def handle(self, *args, **options):
+        border = timezone.now() - timedelta(hours=options["hours"])
+        count, _ = IdempotencyKey.objects.filter(created_at__lt=border).delete()
+        self.stdout.write(self.style.SUCCESS(f"Удалено ключей: {count}"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cashflow.models import Budget
+from cashflow.services.budgets import recalculate
+from cashflow.services.reports import parse_month
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает счетчики израсходованных сумм бюджетов по таблице ДДС "
+        "(после массовых изменений в обход ORM-сигналов)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--month",
+            help="Пересчитать только бюджеты месяца (YYYY-MM), по умолчанию — все",
+        )
+
+    def handle(self, *args, **options):
+        budgets = Budget.objects.all()
+        if options["month"]:
+            try:
+                budgets = budgets.filter(month=parse_month(options["month"]))
+            except ValueError as e:
+                raise CommandError(str(e))
+        count = recalculate(budgets)
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано бюджетов: {count}"))
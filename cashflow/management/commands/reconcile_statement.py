@@ -0,0 +1,95 @@
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from cashflow.models import CashFlow
+from cashflow.services.reconciliation import load_statement, reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверяет банковскую выписку (CSV) с записями ДДС: сопоставляет строки "
+        "по дате (с окном) и сумме (с допуском), ранжируя кандидатов по "
+        "сходству назначения платежа с комментарием"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к CSV-файлу выписки")
+        parser.add_argument(
+            "--owner", required=True, help="Имя пользователя — владельца записей ДДС"
+        )
+        parser.add_argument(
+            "--window", type=int, default=3, help="Допустимое расхождение дат, дней"
+        )
+        parser.add_argument(
+            "--tolerance", default="0", help="Допустимое расхождение сумм"
+        )
+        parser.add_argument("--currency", help="Валюта выписки, по умолчанию базовая")
+        parser.add_argument("--encoding", default="utf-8-sig")
+        parser.add_argument("--delimiter", help="Разделитель CSV (по умолчанию — авто)")
+        parser.add_argument("--date-column", default="date")
+        parser.add_argument("--amount-column", default="amount")
+        parser.add_argument("--description-column", default="description")
+        parser.add_argument(
+            "--json", action="store_true", help="Вывести полный результат в JSON"
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            owner = User.objects.get(**{User.USERNAME_FIELD: options["owner"]})
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['owner']} не найден")
+        try:
+            with open(options["path"], encoding=options["encoding"]) as file:
+                content = file.read()
+            lines = load_statement(
+                content,
+                date_column=options["date_column"],
+                amount_column=options["amount_column"],
+                description_column=options["description_column"],
+                delimiter=options["delimiter"],
+            )
+            result = reconcile(
+                lines,
+                window=options["window"],
+                tolerance=Decimal(options["tolerance"]),
+                currency=options["currency"],
+                queryset=CashFlow.objects.filter(owner=owner),
+            )
+        except (OSError, UnicodeDecodeError, InvalidOperation, ValueError) as e:
+            raise CommandError(str(e))
+
+        if options["json"]:
+            self.stdout.write(
+                json.dumps(result, cls=DjangoJSONEncoder, ensure_ascii=False)
+            )
+            return
+
+        for item in result["ambiguous"]:
+            ids = ", ".join(f"#{c['cashflow_id']}" for c in item["candidates"])
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Строка {item['line']} ({item['date']}, {item['amount']}): "
+                    f"несколько кандидатов: {ids}"
+                )
+            )
+        for item in result["unmatched"]:
+            self.stdout.write(
+                self.style.ERROR(
+                    f"Строка {item['line']} ({item['date']}, {item['amount']}, "
+                    f"{item['description']}): не найдена"
+                )
+            )
+        summary = result["summary"]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Строк выписки: {summary['lines']}, сопоставлено: {summary['matched']}, "
+                f"неоднозначно: {summary['ambiguous']}, "
+                f"не найдено: {summary['unmatched']}. "
+                f"Записей ДДС за период без пары в выписке: {summary['unmatched_ledger']}"
+            )
+        )
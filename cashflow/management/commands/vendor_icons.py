@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from cashflow.services.assets import ICONS_VERSION, vendor_icons
+
+
+class Command(BaseCommand):
+    help = (
+        "Скачивает Bootstrap Icons в static/vendor/bootstrap-icons/ "
+        "(после этого шаблоны подключают локальную копию вместо CDN)"
+    )
+
+    def handle(self, *args, **options):
+        written = vendor_icons()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Bootstrap Icons {ICONS_VERSION}: записано файлов {len(written)}"
+            )
+        )
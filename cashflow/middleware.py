@@ -0,0 +1,156 @@
+import mimetypes
+import os
+from functools import lru_cache
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.http import http_date
+
+from .services import compression
+
+# Ответы короче этого не сжимаются: заголовки gzip дороже выигрыша
+MIN_SIZE = 200
+# Собранные файлы с отпечатком содержимого в имени не меняются никогда
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# Файлы без отпечатка браузер перепроверяет (If-Modified-Since)
+REVALIDATE_CACHE = "public, no-cache"
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Сжатие ответов (brotli или gzip — по Accept-Encoding).
+
+    В отличие от GZipMiddleware, потоковые ответы сжимаются с
+    выталкиванием каждой части, поток событий (text/event-stream) не
+    сжимается, а brotli выбирается, если установлен пакет brotli.
+
+    Длина gzip маскируется случайным заголовком (BREACH). Ответ, в который
+    шаблон вставил CSRF-токен (CsrfViewMiddleware ставит в нем cookie
+    токена), brotli не сжимается: замаскировать длину brotli нечем.
+    """
+
+    def process_response(self, request, response):
+        if (
+            response.has_header("Content-Encoding")
+            or response.status_code in (204, 304)
+            or not compression.is_compressible(response.get("Content-Type", ""))
+            or "no-transform" in response.get("Cache-Control", "")
+        ):
+            return response
+        if not response.streaming and len(response.content) < MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        codings = compression.available()
+        if settings.CSRF_COOKIE_NAME in response.cookies:
+            codings = ("gzip",)
+        encoding = compression.negotiate(
+            request.headers.get("Accept-Encoding", ""), codings
+        )
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            compressor = compression.StreamCompressor(encoding)
+            if response.is_async:
+                response.streaming_content = compressor.aiterate(
+                    response.streaming_content
+                )
+            else:
+                response.streaming_content = compressor.iterate(
+                    response.streaming_content
+                )
+            # Размер сжатого потока заранее неизвестен
+            del response.headers["Content-Length"]
+        else:
+            content = compression.compress(response.content, encoding)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response.headers["Content-Length"] = str(len(content))
+
+        # Тело изменилось: сильный ETag становится слабым (RFC 9110, 8.8.1),
+        # If-None-Match по-прежнему с ним совпадает
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+
+@lru_cache(maxsize=1)
+def _hashed_names() -> frozenset[str]:
+    """Имена собранных файлов с отпечатком содержимого (из манифеста)"""
+    return frozenset(getattr(staticfiles_storage, "hashed_files", {}).values())
+
+
+class StaticFilesMiddleware(MiddlewareMixin):
+    """
+    Раздача собранной статики (collectstatic) из STATIC_ROOT.
+
+    Если рядом с файлом лежит сжатая копия (.br, .gz — их создает
+    CompressedManifestStaticFilesStorage), отдается она. Файлы с отпечатком
+    содержимого в имени кэшируются браузером навсегда (immutable): новая
+    версия файла получает новое имя. Если статику раздает веб-сервер,
+    запросы к ней сюда не доходят; без собранной статики (DEBUG,
+    runserver) запрос передается дальше.
+    """
+
+    def __init__(self, get_response) -> None:
+        super().__init__(get_response)
+        self.prefix = urlsplit(settings.STATIC_URL).path
+
+    def process_request(self, request):
+        if request.method not in ("GET", "HEAD") or not request.path.startswith(
+            self.prefix
+        ):
+            return None
+        name = unquote(request.path[len(self.prefix) :])
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        response = get_conditional_response(request, last_modified=int(stat.st_mtime))
+        if response is None:
+            response = self._file_response(request, name, path)
+        response["Last-Modified"] = http_date(stat.st_mtime)
+        response["Cache-Control"] = (
+            IMMUTABLE_CACHE if name in _hashed_names() else REVALIDATE_CACHE
+        )
+        return response
+
+    def _file_response(self, request, name: str, path: str) -> FileResponse:
+        content_type, _ = mimetypes.guess_type(name)
+        encoding = None
+        variants = {
+            coding: f"{path}.{suffix}"
+            for coding, suffix in (("br", "br"), ("gzip", "gz"))
+            if os.path.isfile(f"{path}.{suffix}")
+        }
+        if variants:
+            # Готовые копии отдаются и без пакета brotli
+            encoding = compression.negotiate(
+                request.headers.get("Accept-Encoding", ""), tuple(variants)
+            )
+            if encoding:
+                path = variants[encoding]
+        response = FileResponse(
+            open(path, "rb"), content_type=content_type or "application/octet-stream"
+        )
+        # Имя файла в Content-Disposition для статики не нужно
+        del response.headers["Content-Disposition"]
+        if variants:
+            patch_vary_headers(response, ("Accept-Encoding",))
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        return response
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:29
+
+from django.db import migrations, models
+
+
+def mark_income_types(apps, schema_editor):
+    """Типы «Пополнение» считаем поступлениями"""
+    OperationType = apps.get_model("cashflow", "OperationType")
+    OperationType.objects.filter(name__iexact="Пополнение").update(is_income=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cashflow", "0002_alter_category_unique_together_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DataVersion",
+            fields=[
+                (
+                    "name",
+                    models.CharField(
+                        max_length=50,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Имя",
+                    ),
+                ),
+                ("version", models.BigIntegerField(default=0, verbose_name="Версия")),
+            ],
+            options={
+                "verbose_name": "Версия данных",
+                "verbose_name_plural": "Версии данных",
+            },
+        ),
+        migrations.AddField(
+            model_name="operationtype",
+            name="is_income",
+            field=models.BooleanField(
+                default=False,
+                help_text="Операции этого типа увеличивают остаток денежных средств",
+                verbose_name="Поступление",
+            ),
+        ),
+        migrations.RunPython(mark_income_types, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,140 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cashflow", "0003_operationtype_is_income_dataversion"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecurringOperation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=200, verbose_name="Название")),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=12, verbose_name="Сумма"
+                    ),
+                ),
+                ("comment", models.TextField(blank=True, verbose_name="Комментарий")),
+                (
+                    "frequency",
+                    models.CharField(
+                        choices=[
+                            ("daily", "Ежедневно"),
+                            ("weekly", "Еженедельно"),
+                            ("monthly", "Ежемесячно"),
+                            ("yearly", "Ежегодно"),
+                        ],
+                        default="monthly",
+                        max_length=10,
+                        verbose_name="Периодичность",
+                    ),
+                ),
+                (
+                    "interval",
+                    models.PositiveSmallIntegerField(
+                        default=1,
+                        help_text="Например, 3 — раз в три месяца",
+                        verbose_name="Интервал",
+                    ),
+                ),
+                ("start_date", models.DateField(verbose_name="Дата начала")),
+                (
+                    "end_date",
+                    models.DateField(
+                        blank=True, null=True, verbose_name="Дата окончания"
+                    ),
+                ),
+                (
+                    "next_date",
+                    models.DateField(
+                        blank=True,
+                        editable=False,
+                        help_text="Дата первой еще не созданной операции",
+                        null=True,
+                        verbose_name="Следующая операция",
+                    ),
+                ),
+                (
+                    "is_active",
+                    models.BooleanField(default=True, verbose_name="Активен"),
+                ),
+                (
+                    "category",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to="cashflow.category",
+                        verbose_name="Категория",
+                    ),
+                ),
+                (
+                    "operation_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to="cashflow.operationtype",
+                        verbose_name="Тип операции",
+                    ),
+                ),
+                (
+                    "status",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to="cashflow.status",
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "subcategory",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to="cashflow.subcategory",
+                        verbose_name="Подкатегория",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Регулярная операция",
+                "verbose_name_plural": "Регулярные операции",
+            },
+        ),
+        migrations.AddField(
+            model_name="cashflow",
+            name="recurring",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="occurrences",
+                to="cashflow.recurringoperation",
+                verbose_name="Регулярная операция",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="cashflow",
+            constraint=models.UniqueConstraint(
+                fields=("recurring", "date"), name="unique_recurring_occurrence"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recurringoperation",
+            index=models.Index(
+                fields=["is_active", "next_date"], name="cashflow_re_is_acti_63c1e8_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:33
+
+from django.db import migrations, models
+
+import cashflow.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cashflow", "0004_recurringoperation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cashflow",
+            name="currency",
+            field=models.CharField(
+                default=cashflow.models.default_currency,
+                help_text="Код валюты ISO 4217, например RUB, USD",
+                max_length=3,
+                verbose_name="Валюта",
+            ),
+        ),
+        migrations.AddField(
+            model_name="recurringoperation",
+            name="currency",
+            field=models.CharField(
+                default=cashflow.models.default_currency,
+                help_text="Код валюты ISO 4217, например RUB, USD",
+                max_length=3,
+                verbose_name="Валюта",
+            ),
+        ),
+        migrations.CreateModel(
+            name="ExchangeRate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("currency", models.CharField(max_length=3, verbose_name="Валюта")),
+                ("date", models.DateField(verbose_name="Действует с")),
+                (
+                    "rate",
+                    models.DecimalField(
+                        decimal_places=8,
+                        help_text="Стоимость единицы валюты в базовой валюте",
+                        max_digits=18,
+                        verbose_name="Курс",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Курс валюты",
+                "verbose_name_plural": "Курсы валют",
+                "ordering": ["currency", "-date"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("currency", "date"), name="unique_exchange_rate"
+                    )
+                ],
+            },
+        ),
+    ]
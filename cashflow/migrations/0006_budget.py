@@ -0,0 +1,104 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cashflow", "0005_currency_exchangerate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Budget",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "month",
+                    models.DateField(
+                        help_text="Любая дата месяца; хранится первое число",
+                        verbose_name="Месяц",
+                    ),
+                ),
+                (
+                    "limit",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=14, verbose_name="Лимит"
+                    ),
+                ),
+                (
+                    "mode",
+                    models.CharField(
+                        choices=[("warn", "Предупреждать"), ("block", "Запрещать")],
+                        default="warn",
+                        max_length=10,
+                        verbose_name="При превышении",
+                    ),
+                ),
+                (
+                    "spent",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        editable=False,
+                        max_digits=14,
+                        verbose_name="Израсходовано",
+                    ),
+                ),
+                (
+                    "category",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="budgets",
+                        to="cashflow.category",
+                        verbose_name="Категория",
+                    ),
+                ),
+                (
+                    "subcategory",
+                    models.ForeignKey(
+                        blank=True,
+                        help_text="Если не указана, лимит действует на всю категорию",
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="budgets",
+                        to="cashflow.subcategory",
+                        verbose_name="Подкатегория",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Бюджет",
+                "verbose_name_plural": "Бюджеты",
+                "ordering": ["-month", "category"],
+                "indexes": [
+                    models.Index(
+                        fields=["category", "month"],
+                        name="cashflow_bu_categor_6d28a5_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(("subcategory__isnull", True)),
+                        fields=("category", "month"),
+                        name="unique_category_budget",
+                    ),
+                    models.UniqueConstraint(
+                        condition=models.Q(("subcategory__isnull", False)),
+                        fields=("subcategory", "month"),
+                        name="unique_subcategory_budget",
+                    ),
+                ],
+            },
+        ),
+    ]
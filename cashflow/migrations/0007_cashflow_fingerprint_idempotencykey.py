@@ -0,0 +1,85 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:43
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cashflow", "0006_budget"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cashflow",
+            name="fingerprint",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="Хеш содержимого импортированной записи для защиты от дублей",
+                max_length=64,
+                null=True,
+                unique=True,
+                verbose_name="Отпечаток",
+            ),
+        ),
+        migrations.AddField(
+            model_name="cashflow",
+            name="source_reference",
+            field=models.CharField(
+                blank=True,
+                help_text="Номер операции в банке или во внешней системе",
+                max_length=100,
+                verbose_name="Внешний идентификатор",
+            ),
+        ),
+        migrations.CreateModel(
+            name="IdempotencyKey",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=255, verbose_name="Ключ")),
+                ("scope", models.CharField(max_length=100, verbose_name="Операция")),
+                (
+                    "request_hash",
+                    models.CharField(max_length=64, verbose_name="Хеш запроса"),
+                ),
+                (
+                    "response_status",
+                    models.PositiveSmallIntegerField(
+                        blank=True, null=True, verbose_name="Код ответа"
+                    ),
+                ),
+                (
+                    "response_body",
+                    models.JSONField(
+                        blank=True,
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                        null=True,
+                        verbose_name="Ответ",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Создан"),
+                ),
+            ],
+            options={
+                "verbose_name": "Ключ идемпотентности",
+                "verbose_name_plural": "Ключи идемпотентности",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("scope", "key"), name="unique_idempotency_key"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,111 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cashflow", "0007_cashflow_fingerprint_idempotencykey"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedMonth",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateField(unique=True, verbose_name="Месяц")),
+                ("path", models.CharField(max_length=255, verbose_name="Файл")),
+                ("rows", models.PositiveIntegerField(verbose_name="Записей")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Архивирован"),
+                ),
+            ],
+            options={
+                "verbose_name": "Архивный месяц",
+                "verbose_name_plural": "Архивные месяцы",
+                "ordering": ["-month"],
+            },
+        ),
+        migrations.CreateModel(
+            name="CashFlowRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateField(verbose_name="Месяц")),
+                ("currency", models.CharField(max_length=3, verbose_name="Валюта")),
+                ("count", models.PositiveIntegerField(verbose_name="Записей")),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=16, verbose_name="Сумма"
+                    ),
+                ),
+                (
+                    "amount_base",
+                    models.DecimalField(
+                        decimal_places=2,
+                        max_digits=20,
+                        verbose_name="Сумма в базовой валюте",
+                    ),
+                ),
+                (
+                    "category",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to="cashflow.category",
+                        verbose_name="Категория",
+                    ),
+                ),
+                (
+                    "operation_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to="cashflow.operationtype",
+                        verbose_name="Тип операции",
+                    ),
+                ),
+                (
+                    "status",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to="cashflow.status",
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "subcategory",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to="cashflow.subcategory",
+                        verbose_name="Подкатегория",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Итог архива",
+                "verbose_name_plural": "Итоги архива",
+                "ordering": ["-month"],
+                "indexes": [
+                    models.Index(fields=["month"], name="cashflow_ca_month_0d4c0d_idx")
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:00
+
+from django.db import migrations, models
+from django.db.models import BigIntegerField, F
+from django.db.models.functions import Cast, Round
+
+
+def fill_amount_minor(apps, schema_editor):
+    """Копейки для существующих записей — одним UPDATE"""
+    CashFlow = apps.get_model("cashflow", "CashFlow")
+    CashFlow.objects.update(
+        amount_minor=Cast(Round(F("amount") * 100), BigIntegerField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cashflow", "0008_archivedmonth_cashflowrollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cashflow",
+            name="amount_minor",
+            field=models.BigIntegerField(
+                default=0,
+                editable=False,
+                help_text="Копия суммы в целых копейках для агрегатов (CASHFLOW_AMOUNT_STORAGE)",
+                verbose_name="Сумма в копейках",
+            ),
+        ),
+        migrations.RunPython(fill_amount_minor, migrations.RunPython.noop),
+    ]
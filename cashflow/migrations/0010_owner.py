@@ -0,0 +1,145 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+OWNED_MODELS = [
+    "status",
+    "operationtype",
+    "category",
+    "subcategory",
+    "recurringoperation",
+    "cashflow",
+    "cashflowrollup",
+]
+
+
+def assign_owner(apps, schema_editor):
+    """
+    Существующий учет переходит к первому суперпользователю (или первому
+    пользователю). Колонку owner_id в архивные файлы добавляет
+    archive.add_owner_column после migrate: миграция файлы не трогает.
+    """
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+    models_with_rows = [
+        apps.get_model("cashflow", name)
+        for name in OWNED_MODELS
+        if apps.get_model("cashflow", name).objects.exists()
+    ]
+    if not models_with_rows:
+        return
+    owner = (
+        User.objects.filter(is_superuser=True).order_by("pk").first()
+        or User.objects.order_by("pk").first()
+    )
+    if owner is None:
+        raise RuntimeError(
+            "Существующим записям нужен владелец: создайте пользователя "
+            "(python manage.py create_admin) и повторите миграцию"
+        )
+    for model in models_with_rows:
+        model.objects.update(owner=owner)
+
+
+def owner_field(null: bool = False) -> models.ForeignKey:
+    return models.ForeignKey(
+        null=null,
+        on_delete=django.db.models.deletion.CASCADE,
+        related_name="+",
+        to=settings.AUTH_USER_MODEL,
+        verbose_name="Владелец",
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cashflow", "0009_cashflow_amount_minor"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        *(
+            migrations.AddField(
+                model_name=name, name="owner", field=owner_field(null=True)
+            )
+            for name in OWNED_MODELS
+        ),
+        migrations.RunPython(assign_owner, migrations.RunPython.noop),
+        *(
+            migrations.AlterField(model_name=name, name="owner", field=owner_field())
+            for name in OWNED_MODELS
+        ),
+        migrations.RemoveIndex(
+            model_name="cashflowrollup",
+            name="cashflow_ca_month_0d4c0d_idx",
+        ),
+        migrations.AlterUniqueTogether(
+            name="category",
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name="subcategory",
+            unique_together=set(),
+        ),
+        migrations.AlterField(
+            model_name="operationtype",
+            name="name",
+            field=models.CharField(max_length=100, verbose_name="Тип операции"),
+        ),
+        migrations.AlterField(
+            model_name="status",
+            name="name",
+            field=models.CharField(max_length=100, verbose_name="Название статуса"),
+        ),
+        migrations.AddIndex(
+            model_name="cashflow",
+            index=models.Index(
+                fields=["owner", "date"], name="cashflow_ca_owner_i_27bbae_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cashflow",
+            index=models.Index(
+                fields=["owner", "subcategory", "date"],
+                name="cashflow_ca_owner_i_d196ad_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cashflowrollup",
+            index=models.Index(
+                fields=["owner", "month"], name="cashflow_ca_owner_i_da0561_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recurringoperation",
+            index=models.Index(
+                fields=["owner", "is_active"], name="cashflow_re_owner_i_13ca3e_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="category",
+            constraint=models.UniqueConstraint(
+                fields=("owner", "name"), name="unique_category_name"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="operationtype",
+            constraint=models.UniqueConstraint(
+                fields=("owner", "name"), name="unique_operation_type_name"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="status",
+            constraint=models.UniqueConstraint(
+                fields=("owner", "name"), name="unique_status_name"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="subcategory",
+            constraint=models.UniqueConstraint(
+                fields=("owner", "name"), name="unique_subcategory_name"
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cashflow", "0010_owner"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cashflow",
+            name="ingest_token",
+            field=models.UUIDField(
+                blank=True,
+                editable=False,
+                help_text="Выдается записи, принятой через буфер записи: повторная загрузка журнала после сбоя не создает дублей",
+                null=True,
+                unique=True,
+                verbose_name="Идентификатор приема",
+            ),
+        ),
+    ]
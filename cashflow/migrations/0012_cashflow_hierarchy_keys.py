@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Составные внешние ключи записей ДДС: подкатегория принадлежит категории
+# записи, категория — ее типу операции. Django не описывает составные
+# внешние ключи, поэтому они создаются SQL (только PostgreSQL). Как и
+# обычные внешние ключи Django, проверка откладывается до фиксации
+# транзакции: объединение справочников меняет звенья по очереди.
+# NOT VALID — существующие записи не проверяются при миграции, их находит
+# и исправляет команда audit_cashflow_hierarchy --fix, которая затем
+# выполняет VALIDATE CONSTRAINT.
+FOREIGN_KEYS = {
+    "cashflow_subcategory_in_category": (
+        ("subcategory_id", "category_id"),
+        "cashflow_subcategory",
+        ("id", "category_id"),
+    ),
+    "cashflow_category_in_operation_type": (
+        ("category_id", "operation_type_id"),
+        "cashflow_category",
+        ("id", "operation_type_id"),
+    ),
+}
+
+
+def add_foreign_keys(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    table = apps.get_model("cashflow", "CashFlow")._meta.db_table
+    for name, (columns, target, target_columns) in FOREIGN_KEYS.items():
+        schema_editor.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {name} "
+            f"FOREIGN KEY ({', '.join(columns)}) "
+            f"REFERENCES {target} ({', '.join(target_columns)}) "
+            "DEFERRABLE INITIALLY DEFERRED NOT VALID"
+        )
+
+
+def remove_foreign_keys(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    table = apps.get_model("cashflow", "CashFlow")._meta.db_table
+    for name in FOREIGN_KEYS:
+        schema_editor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cashflow", "0011_cashflow_ingest_token"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="category",
+            constraint=models.UniqueConstraint(
+                fields=("id", "operation_type"), name="category_operation_type_key"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="subcategory",
+            constraint=models.UniqueConstraint(
+                fields=("id", "category"), name="subcategory_category_key"
+            ),
+        ),
+        migrations.RunPython(add_foreign_keys, remove_foreign_keys),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Length, Substr
+
+# Комментарии записей ДДС переносятся из основной таблицы: в записи остается
+# начало комментария, а длинный комментарий целиком — в CashFlowNote. Колонка
+# comment удаляется следующей миграцией: в PostgreSQL нельзя менять таблицу
+# в транзакции, где остались отложенные проверки внешних ключей.
+PREVIEW_LENGTH = 64
+BATCH_SIZE = 1000
+
+
+def move_comments(apps, schema_editor):
+    CashFlow = apps.get_model("cashflow", "CashFlow")
+    CashFlowNote = apps.get_model("cashflow", "CashFlowNote")
+    CashFlow.objects.exclude(comment="").update(
+        comment_preview=Substr("comment", 1, PREVIEW_LENGTH)
+    )
+    long_comments = (
+        CashFlow.objects.annotate(length=Length("comment"))
+        .filter(length__gt=PREVIEW_LENGTH)
+        .values_list("id", "comment")
+    )
+    notes = []
+    for pk, comment in long_comments.iterator(chunk_size=BATCH_SIZE):
+        notes.append(CashFlowNote(cashflow_id=pk, comment=comment))
+        if len(notes) == BATCH_SIZE:
+            CashFlowNote.objects.bulk_create(notes)
+            notes = []
+    CashFlowNote.objects.bulk_create(notes)
+
+
+def restore_comments(apps, schema_editor):
+    CashFlow = apps.get_model("cashflow", "CashFlow")
+    CashFlowNote = apps.get_model("cashflow", "CashFlowNote")
+    CashFlow.objects.update(comment=F("comment_preview"))
+    CashFlow.objects.filter(note__isnull=False).update(
+        comment=Subquery(
+            CashFlowNote.objects.filter(cashflow_id=OuterRef("pk")).values("comment")
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cashflow", "0012_cashflow_hierarchy_keys"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CashFlowNote",
+            fields=[
+                (
+                    "cashflow",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="note",
+                        serialize=False,
+                        to="cashflow.cashflow",
+                        verbose_name="Запись ДДС",
+                    ),
+                ),
+                ("comment", models.TextField(verbose_name="Комментарий")),
+            ],
+            options={
+                "verbose_name": "Комментарий записи ДДС",
+                "verbose_name_plural": "Комментарии записей ДДС",
+            },
+        ),
+        migrations.AddField(
+            model_name="cashflow",
+            name="comment_preview",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="Комментарий длиннее этого хранится целиком в CashFlowNote",
+                max_length=64,
+                verbose_name="Начало комментария",
+            ),
+        ),
+        migrations.RunPython(move_comments, restore_comments),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:25
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cashflow", "0013_cashflow_note"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="cashflow",
+            name="comment",
+        ),
+    ]
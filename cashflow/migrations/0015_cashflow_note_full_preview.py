@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:56
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Length
+
+# Заметка CashFlowNote создается и для комментария длиной ровно в начало
+# комментария: тогда по неполному comment_preview видно, что заметки нет, и
+# чтение comment не ищет ее. До этого такие комментарии хранились без заметки.
+PREVIEW_LENGTH = 64
+BATCH_SIZE = 1000
+
+
+def add_notes(apps, schema_editor):
+    CashFlow = apps.get_model("cashflow", "CashFlow")
+    CashFlowNote = apps.get_model("cashflow", "CashFlowNote")
+    full_previews = (
+        CashFlow.objects.annotate(length=Length("comment_preview"))
+        .filter(length=PREVIEW_LENGTH, note__isnull=True)
+        .values_list("id", "comment_preview")
+    )
+    notes = []
+    for pk, comment in full_previews.iterator(chunk_size=BATCH_SIZE):
+        notes.append(CashFlowNote(cashflow_id=pk, comment=comment))
+        if len(notes) == BATCH_SIZE:
+            CashFlowNote.objects.bulk_create(notes)
+            notes = []
+    CashFlowNote.objects.bulk_create(notes)
+
+
+def remove_notes(apps, schema_editor):
+    CashFlowNote = apps.get_model("cashflow", "CashFlowNote")
+    CashFlowNote.objects.annotate(length=Length("comment")).filter(
+        length=PREVIEW_LENGTH, comment=F("cashflow__comment_preview")
+    ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cashflow", "0014_remove_cashflow_comment"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="cashflow",
+            name="comment_preview",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="Комментарий такой длины и длиннее хранится целиком в CashFlowNote",
+                max_length=64,
+                verbose_name="Начало комментария",
+            ),
+        ),
+        migrations.RunPython(add_notes, remove_notes),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cashflow", "0015_cashflow_note_full_preview"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cashflowrollup",
+            name="last_date",
+            field=models.DateField(
+                blank=True,
+                help_text="Пусто у итогов, созданных до появления поля",
+                null=True,
+                verbose_name="Последняя операция",
+            ),
+        ),
+    ]
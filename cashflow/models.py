@@ -1,15 +1,68 @@
+from decimal import ROUND_HALF_UP, Decimal
 from typing import List
 
-from django.db import models
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 
+# Длина начала комментария, которое хранится в самой записи ДДС
+COMMENT_PREVIEW_LENGTH = 64
 
-class Status(models.Model):
-    """Модель для хранения статусов операций (Бизнес, Личное, Налог и др.)"""
 
-    name: str = models.CharField(
-        max_length=100, unique=True, verbose_name="Название статуса"
+def default_currency() -> str:
+    """Валюта новых записей по умолчанию — базовая валюта учета"""
+    return settings.CASHFLOW_BASE_CURRENCY
+
+
+def to_minor_units(amount: Decimal | str | int) -> int:
+    """Сумма в копейках (целое) с округлением до копеек по правилам бухучета"""
+    return int(
+        (Decimal(str(amount)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP)
+    )
+
+
+def from_minor_units(minor: int) -> Decimal:
+    """Сумма из копеек в Decimal с двумя знаками"""
+    return (Decimal(int(minor)) / 100).quantize(Decimal("0.01"))
+
+
+def full_comment() -> Coalesce:
+    """Выражение с полным комментарием записи ДДС (для values и аннотаций)"""
+    return Coalesce("note__comment", "comment_preview", output_field=models.TextField())
+
+
+def needs_note(comment: str) -> bool:
+    """
+    Хранится ли комментарий целиком в CashFlowNote. Заметка есть у каждого
+    комментария, заполняющего comment_preview полностью, поэтому по
+    короткому началу комментария видно, что читать CashFlowNote не нужно.
+    """
+    return len(comment) >= COMMENT_PREVIEW_LENGTH
+
+
+class OwnedModel(models.Model):
+    """
+    Данные пользователя: у каждого пользователя свой учет (записи ДДС,
+    справочники, шаблоны), и все представления отбирают записи владельца.
+    """
+
+    owner: models.ForeignKey = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Владелец",
     )
 
+    class Meta:
+        abstract = True
+
+
+class Status(OwnedModel):
+    """Модель для хранения статусов операций (Бизнес, Личное, Налог и др.)"""
+
+    name: str = models.CharField(max_length=100, verbose_name="Название статуса")
+
     def __str__(self) -> str:
         """Строковое представление статуса"""
         return self.name
@@ -17,13 +70,20 @@ class Status(models.Model):
     class Meta:
         verbose_name: str = "Статус"
         verbose_name_plural: str = "Статусы"
+        # Названия уникальны в учете владельца; индекс начинается с владельца
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "name"], name="unique_status_name")
+        ]
 
 
-class OperationType(models.Model):
+class OperationType(OwnedModel):
     """Модель для хранения типов операций (Пополнение, Списание)"""
 
-    name: str = models.CharField(
-        max_length=100, unique=True, verbose_name="Тип операции"
+    name: str = models.CharField(max_length=100, verbose_name="Тип операции")
+    is_income: bool = models.BooleanField(
+        default=False,
+        verbose_name="Поступление",
+        help_text="Операции этого типа увеличивают остаток денежных средств",
     )
 
     def __str__(self) -> str:
@@ -33,9 +93,14 @@ class OperationType(models.Model):
     class Meta:
         verbose_name: str = "Тип операции"
         verbose_name_plural: str = "Типы операций"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "name"], name="unique_operation_type_name"
+            )
+        ]
 
 
-class Category(models.Model):
+class Category(OwnedModel):
     """
     Модель категорий операций, связанная с типами операций.
     Пример: категория "Маркетинг" для типа "Списание"
@@ -56,11 +121,19 @@ class Category(models.Model):
     class Meta:
         verbose_name: str = "Категория"
         verbose_name_plural: str = "Категории"
-        # Обеспечиваем уникальность комбинации имени и типа операции
-        unique_together: tuple = ("name",)
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "name"], name="unique_category_name"
+            ),
+            # Ключ, на который ссылается составной внешний ключ записей ДДС
+            # (категория, тип операции), см. миграцию 0012
+            models.UniqueConstraint(
+                fields=["id", "operation_type"], name="category_operation_type_key"
+            ),
+        ]
 
 
-class SubCategory(models.Model):
+class SubCategory(OwnedModel):
     """Модель подкатегорий, связанных с категориями"""
 
     name: str = models.CharField(max_length=100, verbose_name="Название подкатегории")
@@ -78,11 +151,101 @@ class SubCategory(models.Model):
     class Meta:
         verbose_name: str = "Подкатегория"
         verbose_name_plural: str = "Подкатегории"
-        # Обеспечиваем уникальность комбинации имени и категории
-        unique_together: tuple = ("name",)
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "name"], name="unique_subcategory_name"
+            ),
+            # Ключ для составного внешнего ключа записей ДДС (подкатегория, категория)
+            models.UniqueConstraint(
+                fields=["id", "category"], name="subcategory_category_key"
+            ),
+        ]
+
+
+class RecurringOperation(OwnedModel):
+    """
+    Шаблон регулярной операции (аренда, зарплата, подписки).
+
+    Записи ДДС по шаблону создаются командой materialize_recurring.
+    """
+
+    DAILY = "daily"
+    WEEKLY = "weekly"
+    MONTHLY = "monthly"
+    YEARLY = "yearly"
+    FREQUENCY_CHOICES = [
+        (DAILY, "Ежедневно"),
+        (WEEKLY, "Еженедельно"),
+        (MONTHLY, "Ежемесячно"),
+        (YEARLY, "Ежегодно"),
+    ]
+
+    name: str = models.CharField(max_length=200, verbose_name="Название")
+    status: models.ForeignKey = models.ForeignKey(
+        Status, on_delete=models.PROTECT, verbose_name="Статус"
+    )
+    operation_type: models.ForeignKey = models.ForeignKey(
+        OperationType, on_delete=models.PROTECT, verbose_name="Тип операции"
+    )
+    category: models.ForeignKey = models.ForeignKey(
+        Category, on_delete=models.PROTECT, verbose_name="Категория"
+    )
+    subcategory: models.ForeignKey = models.ForeignKey(
+        SubCategory, on_delete=models.PROTECT, verbose_name="Подкатегория"
+    )
+    amount: models.DecimalField = models.DecimalField(
+        max_digits=12, decimal_places=2, verbose_name="Сумма"
+    )
+    currency: str = models.CharField(
+        max_length=3,
+        default=default_currency,
+        verbose_name="Валюта",
+        help_text="Код валюты ISO 4217, например RUB, USD",
+    )
+    comment: models.TextField = models.TextField(blank=True, verbose_name="Комментарий")
+    frequency: str = models.CharField(
+        max_length=10,
+        choices=FREQUENCY_CHOICES,
+        default=MONTHLY,
+        verbose_name="Периодичность",
+    )
+    interval: int = models.PositiveSmallIntegerField(
+        default=1, verbose_name="Интервал", help_text="Например, 3 — раз в три месяца"
+    )
+    start_date: models.DateField = models.DateField(verbose_name="Дата начала")
+    end_date: models.DateField = models.DateField(
+        null=True, blank=True, verbose_name="Дата окончания"
+    )
+    next_date: models.DateField = models.DateField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Следующая операция",
+        help_text="Дата первой еще не созданной операции",
+    )
+    is_active: bool = models.BooleanField(default=True, verbose_name="Активен")
+
+    def __str__(self) -> str:
+        """Строковое представление шаблона"""
+        return f"{self.name} ({self.get_frequency_display().lower()})"
+
+    def save(self, *args: any, **kwargs: any) -> None:
+        """Для нового шаблона первая операция — в дату начала"""
+        if self.next_date is None:
+            self.next_date = self.start_date
+        super().save(*args, **kwargs)
+
+    class Meta:
+        verbose_name: str = "Регулярная операция"
+        verbose_name_plural: str = "Регулярные операции"
+        indexes = [
+            # materialize_recurring выбирает наступившие шаблоны всех владельцев
+            models.Index(fields=["is_active", "next_date"]),
+            models.Index(fields=["owner", "is_active"]),
+        ]
 
 
-class CashFlow(models.Model):
+class CashFlow(OwnedModel):
     """
     Основная модель для хранения записей о движении денежных средств.
     Содержит все необходимые поля и связи со справочниками.
@@ -104,13 +267,407 @@ class CashFlow(models.Model):
     amount: models.DecimalField = models.DecimalField(
         max_digits=12, decimal_places=2, verbose_name="Сумма"
     )
-    comment: models.TextField = models.TextField(blank=True, verbose_name="Комментарий")
+    amount_minor: int = models.BigIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Сумма в копейках",
+        help_text="Копия суммы в целых копейках для агрегатов (CASHFLOW_AMOUNT_STORAGE)",
+    )
+    currency: str = models.CharField(
+        max_length=3,
+        default=default_currency,
+        verbose_name="Валюта",
+        help_text="Код валюты ISO 4217, например RUB, USD",
+    )
+    comment_preview: str = models.CharField(
+        max_length=COMMENT_PREVIEW_LENGTH,
+        blank=True,
+        editable=False,
+        verbose_name="Начало комментария",
+        help_text="Комментарий такой длины и длиннее хранится целиком в CashFlowNote",
+    )
+    recurring: models.ForeignKey = models.ForeignKey(
+        RecurringOperation,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="occurrences",
+        verbose_name="Регулярная операция",
+    )
+    source_reference: str = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name="Внешний идентификатор",
+        help_text="Номер операции в банке или во внешней системе",
+    )
+    fingerprint: str = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        unique=True,
+        editable=False,
+        verbose_name="Отпечаток",
+        help_text="Хеш содержимого импортированной записи для защиты от дублей",
+    )
+    ingest_token = models.UUIDField(
+        null=True,
+        blank=True,
+        unique=True,
+        editable=False,
+        verbose_name="Идентификатор приема",
+        help_text="Выдается записи, принятой через буфер записи: повторная загрузка "
+        "журнала после сбоя не создает дублей",
+    )
 
     def __str__(self) -> str:
         """Строковое представление записи ДДС"""
         return f"{self.date} - {self.amount} ({self.status})"
 
+    @property
+    def comment(self) -> str:
+        """
+        Комментарий записи. Короткий комментарий целиком лежит в
+        comment_preview, длинный читается из CashFlowNote отдельным
+        запросом (или заранее через select_related("note")).
+        """
+        if "_comment" in self.__dict__:
+            return self._comment
+        if not needs_note(self.comment_preview):
+            return self.comment_preview
+        try:
+            return self.note.comment
+        except CashFlowNote.DoesNotExist:
+            return self.comment_preview
+
+    @comment.setter
+    def comment(self, value: str) -> None:
+        """Новый комментарий сохраняется вместе с записью (save)"""
+        self._comment = value or ""
+        self.comment_preview = self._comment[:COMMENT_PREVIEW_LENGTH]
+
+    def save(self, *args: any, **kwargs: any) -> None:
+        """
+        Сохраняет запись в одной транзакции с обработчиками post_save,
+        которые обновляют счетчики бюджетов, и с полным комментарием.
+        """
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if "_comment" not in self.__dict__:
+                return
+            comment = self.__dict__.pop("_comment")
+            if not needs_note(comment):
+                if not adding:
+                    CashFlowNote.objects.filter(cashflow=self).delete()
+            elif adding:
+                self.note = CashFlowNote.objects.create(cashflow=self, comment=comment)
+            else:
+                self.note, _ = CashFlowNote.objects.update_or_create(
+                    cashflow=self, defaults={"comment": comment}
+                )
+
+    def delete(self, *args: any, **kwargs: any) -> tuple[int, dict[str, int]]:
+        """Удаляет запись в одной транзакции с обновлением счетчиков бюджетов"""
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
     class Meta:
         verbose_name: str = "Запись ДДС"
         verbose_name_plural: str = "Записи ДДС"
         ordering: List[str] = ["-date"]
+        constraints = [
+            # Одна операция на дату по каждому шаблону: повторный запуск
+            # materialize_recurring не создает дублей
+            models.UniqueConstraint(
+                fields=["recurring", "date"], name="unique_recurring_occurrence"
+            )
+        ]
+        # Все выборки ДДС ограничены владельцем: индексы начинаются с него,
+        # поэтому запросы одного пользователя не зависят от размера таблицы
+        indexes = [
+            models.Index(fields=["owner", "date"]),
+            models.Index(fields=["owner", "subcategory", "date"]),
+        ]
+
+
+class CashFlowNote(models.Model):
+    """
+    Полный комментарий записи ДДС (сюда же — другие произвольные данные
+    записи).
+
+    Длинный текст хранится отдельно, чтобы не раздувать строки CashFlow,
+    которые читают списки, отчеты и агрегаты: в самой записи остается
+    начало комментария (comment_preview), а строка здесь есть только у
+    записей с комментарием длиннее него.
+    """
+
+    cashflow: models.OneToOneField = models.OneToOneField(
+        CashFlow,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="note",
+        verbose_name="Запись ДДС",
+    )
+    comment: models.TextField = models.TextField(verbose_name="Комментарий")
+
+    def __str__(self) -> str:
+        """Строковое представление комментария"""
+        return self.comment[:COMMENT_PREVIEW_LENGTH]
+
+    @classmethod
+    def create_for(cls, records: list[CashFlow], batch_size: int = 1000) -> None:
+        """
+        Сохраняет полные комментарии записей, вставленных bulk_create (у
+        записей должен быть заполнен pk; записи без pk пропускаются).
+        """
+        cls.objects.bulk_create(
+            [
+                cls(cashflow_id=record.pk, comment=record.comment)
+                for record in records
+                if record.pk and needs_note(record.comment)
+            ],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+
+    class Meta:
+        verbose_name: str = "Комментарий записи ДДС"
+        verbose_name_plural: str = "Комментарии записей ДДС"
+
+
+class Budget(models.Model):
+    """
+    Лимит расходов по категории (или подкатегории) на месяц.
+
+    spent — сумма операций месяца в базовой валюте, поддерживается
+    инкрементально при каждой записи ДДС, поэтому проверка лимита при
+    создании операции не суммирует таблицу.
+    """
+
+    WARN = "warn"
+    BLOCK = "block"
+    MODE_CHOICES = [
+        (WARN, "Предупреждать"),
+        (BLOCK, "Запрещать"),
+    ]
+
+    category: models.ForeignKey = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        verbose_name="Категория",
+        related_name="budgets",
+    )
+    subcategory: models.ForeignKey = models.ForeignKey(
+        SubCategory,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name="Подкатегория",
+        related_name="budgets",
+        help_text="Если не указана, лимит действует на всю категорию",
+    )
+    month: models.DateField = models.DateField(
+        verbose_name="Месяц", help_text="Любая дата месяца; хранится первое число"
+    )
+    limit: models.DecimalField = models.DecimalField(
+        max_digits=14, decimal_places=2, verbose_name="Лимит"
+    )
+    mode: str = models.CharField(
+        max_length=10, choices=MODE_CHOICES, default=WARN, verbose_name="При превышении"
+    )
+    spent: models.DecimalField = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name="Израсходовано",
+    )
+
+    def __str__(self) -> str:
+        """Строковое представление бюджета"""
+        target = self.subcategory or self.category
+        return f"{target} {self.month:%m.%Y}: {self.limit}"
+
+    def save(self, *args: any, **kwargs: any) -> None:
+        """Месяц бюджета хранится первым числом месяца"""
+        self.month = self.month.replace(day=1)
+        super().save(*args, **kwargs)
+
+    class Meta:
+        verbose_name: str = "Бюджет"
+        verbose_name_plural: str = "Бюджеты"
+        ordering: List[str] = ["-month", "category"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["category", "month"],
+                condition=models.Q(subcategory__isnull=True),
+                name="unique_category_budget",
+            ),
+            models.UniqueConstraint(
+                fields=["subcategory", "month"],
+                condition=models.Q(subcategory__isnull=False),
+                name="unique_subcategory_budget",
+            ),
+        ]
+        # Проверка лимита при записи ДДС ищет бюджеты по (категория, месяц)
+        indexes = [models.Index(fields=["category", "month"])]
+
+
+class IdempotencyKey(models.Model):
+    """
+    Ключ идемпотентности запроса к API (заголовок Idempotency-Key).
+
+    Хранит отпечаток тела запроса и ответ, чтобы повтор запроса с тем же
+    ключом вернул сохраненный ответ, а не выполнил операцию еще раз.
+    """
+
+    key: str = models.CharField(max_length=255, verbose_name="Ключ")
+    scope: str = models.CharField(max_length=100, verbose_name="Операция")
+    request_hash: str = models.CharField(max_length=64, verbose_name="Хеш запроса")
+    response_status: int = models.PositiveSmallIntegerField(
+        null=True, blank=True, verbose_name="Код ответа"
+    )
+    response_body = models.JSONField(
+        null=True, blank=True, encoder=DjangoJSONEncoder, verbose_name="Ответ"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
+
+    def __str__(self) -> str:
+        """Строковое представление ключа"""
+        return f"{self.scope}: {self.key}"
+
+    class Meta:
+        verbose_name: str = "Ключ идемпотентности"
+        verbose_name_plural: str = "Ключи идемпотентности"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["scope", "key"], name="unique_idempotency_key"
+            )
+        ]
+
+
+class DataVersion(models.Model):
+    """
+    Счетчик версий данных.
+
+    Увеличивается при каждом изменении отслеживаемых таблиц и служит
+    дешевым ключом инвалидации кэшей (прогнозы, отчеты).
+    """
+
+    name: str = models.CharField(max_length=50, primary_key=True, verbose_name="Имя")
+    version: int = models.BigIntegerField(default=0, verbose_name="Версия")
+
+    def __str__(self) -> str:
+        """Строковое представление версии"""
+        return f"{self.name}: {self.version}"
+
+    class Meta:
+        verbose_name: str = "Версия данных"
+        verbose_name_plural: str = "Версии данных"
+
+
+class ExchangeRate(models.Model):
+    """
+    Курс валюты к базовой валюте учета, действующий с указанной даты.
+
+    Для операции берется последний курс на дату операции или раньше.
+    """
+
+    currency: str = models.CharField(max_length=3, verbose_name="Валюта")
+    date: models.DateField = models.DateField(verbose_name="Действует с")
+    rate: models.DecimalField = models.DecimalField(
+        max_digits=18,
+        decimal_places=8,
+        verbose_name="Курс",
+        help_text="Стоимость единицы валюты в базовой валюте",
+    )
+
+    def __str__(self) -> str:
+        """Строковое представление курса"""
+        return f"{self.currency} {self.date}: {self.rate}"
+
+    def save(self, *args: any, **kwargs: any) -> None:
+        """Код валюты хранится в верхнем регистре"""
+        self.currency = self.currency.upper()
+        super().save(*args, **kwargs)
+
+    class Meta:
+        verbose_name: str = "Курс валюты"
+        verbose_name_plural: str = "Курсы валют"
+        ordering: List[str] = ["currency", "-date"]
+        constraints = [
+            # Индекс (валюта, дата) обслуживает и поиск курса на дату операции
+            models.UniqueConstraint(
+                fields=["currency", "date"], name="unique_exchange_rate"
+            )
+        ]
+
+
+class ArchivedMonth(models.Model):
+    """
+    Месяц, записи ДДС которого перенесены из базы в архивный файл Parquet.
+
+    Новые записи в архивный месяц не добавляются (см. CashFlowValidator).
+    """
+
+    month: models.DateField = models.DateField(unique=True, verbose_name="Месяц")
+    path: str = models.CharField(max_length=255, verbose_name="Файл")
+    rows: int = models.PositiveIntegerField(verbose_name="Записей")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Архивирован")
+
+    def __str__(self) -> str:
+        """Строковое представление архивного месяца"""
+        return f"{self.month:%m.%Y}: {self.rows}"
+
+    class Meta:
+        verbose_name: str = "Архивный месяц"
+        verbose_name_plural: str = "Архивные месяцы"
+        ordering: List[str] = ["-month"]
+
+
+class CashFlowRollup(OwnedModel):
+    """
+    Итоги архивных записей ДДС за месяц по справочникам и валюте.
+
+    Остаются в базе после архивации: по ним строятся сводки без чтения
+    архивных файлов, а ссылки защищают справочники от удаления.
+    """
+
+    month: models.DateField = models.DateField(verbose_name="Месяц")
+    status: models.ForeignKey = models.ForeignKey(
+        Status, on_delete=models.PROTECT, verbose_name="Статус"
+    )
+    operation_type: models.ForeignKey = models.ForeignKey(
+        OperationType, on_delete=models.PROTECT, verbose_name="Тип операции"
+    )
+    category: models.ForeignKey = models.ForeignKey(
+        Category, on_delete=models.PROTECT, verbose_name="Категория"
+    )
+    subcategory: models.ForeignKey = models.ForeignKey(
+        SubCategory, on_delete=models.PROTECT, verbose_name="Подкатегория"
+    )
+    currency: str = models.CharField(max_length=3, verbose_name="Валюта")
+    count: int = models.PositiveIntegerField(verbose_name="Записей")
+    amount: models.DecimalField = models.DecimalField(
+        max_digits=16, decimal_places=2, verbose_name="Сумма"
+    )
+    amount_base: models.DecimalField = models.DecimalField(
+        max_digits=20, decimal_places=2, verbose_name="Сумма в базовой валюте"
+    )
+    last_date: models.DateField = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name="Последняя операция",
+        help_text="Пусто у итогов, созданных до появления поля",
+    )
+
+    def __str__(self) -> str:
+        """Строковое представление итога"""
+        return f"{self.month:%m.%Y} {self.subcategory}: {self.amount} {self.currency}"
+
+    class Meta:
+        verbose_name: str = "Итог архива"
+        verbose_name_plural: str = "Итоги архива"
+        ordering: List[str] = ["-month"]
+        indexes = [models.Index(fields=["owner", "month"])]
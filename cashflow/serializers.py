@@ -1,28 +1,97 @@
 from django.core.exceptions import ValidationError
 from rest_framework import serializers
 
-from .models import CashFlow, Category, OperationType, Status, SubCategory
+from .models import (CashFlow, Category, OperationType, OwnedModel, Status,
+                     SubCategory)
 from .services.validators import (BaseValidator, CashFlowValidator,
                                   CategoryValidator, OperationTypeValidator,
                                   SubCategoryValidator)
 
 
-class CashFlowSerializer(serializers.ModelSerializer):
+class OwnedSerializerMixin(serializers.Serializer):
+    """
+    Данные пользователя: владелец — текущий пользователь запроса, ссылки
+    принимаются только на справочники владельца.
+    """
+
+    owner = serializers.HiddenField(default=serializers.CurrentUserDefault())
+
+    def get_fields(self) -> dict[str, serializers.Field]:
+        fields = super().get_fields()
+        request = self.context.get("request")
+        if request is None:
+            return fields
+        for field in fields.values():
+            queryset = getattr(field, "queryset", None)
+            if queryset is not None and issubclass(queryset.model, OwnedModel):
+                field.queryset = queryset.filter(owner=request.user)
+        return fields
+
+
+class CashFlowSerializer(OwnedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для денежных потоков с комплексной валидацией"""
 
+    # Полный комментарий хранится вне записи (CashFlowNote); в списках
+    # его загружает select_related("note")
+    comment = serializers.CharField(
+        required=False, allow_blank=True, label="Комментарий"
+    )
+    # Заполняется, только если выборка аннотирована пересчитанной суммой
+    converted_amount = serializers.DecimalField(
+        max_digits=20, decimal_places=2, read_only=True
+    )
+
     class Meta:
         model = CashFlow
-        fields = "__all__"
+        # Копия суммы в копейках и начало комментария — детали хранения, в API
+        # сумма передается в amount, комментарий — в comment
+        exclude = ["amount_minor", "comment_preview"]
 
     def validate(self, data: dict[str, any]) -> dict[str, any]:
         """Основная валидация через сервисный слой"""
+        self.budget_warnings: list[str] = []
         try:
-            return CashFlowValidator.validate_all(data)
+            return CashFlowValidator.validate_all(
+                data, self.instance, self.budget_warnings
+            )
         except ValidationError as e:
-            raise serializers.ValidationError(e.message_dict or str(e))
+            raise serializers.ValidationError(
+                e.message_dict if hasattr(e, "error_dict") else e.messages
+            )
+
+    def save(self, **kwargs: any) -> CashFlow:
+        """
+        Сохраняет запись. Бюджеты с запретом повторно проверяются при
+        сохранении по заблокированным счетчикам: превышение из-за
+        параллельной записи — ошибка 400.
+        """
+        try:
+            return super().save(**kwargs)
+        except ValidationError as e:
+            raise serializers.ValidationError(e.messages)
+
+    def to_representation(self, instance: CashFlow) -> dict[str, any]:
+        """Добавляет в ответ на создание/изменение предупреждения о бюджетах"""
+        data = super().to_representation(instance)
+        if getattr(self, "budget_warnings", None):
+            data["budget_warnings"] = self.budget_warnings
+        return data
 
 
-class StatusSerializer(serializers.ModelSerializer):
+class UsageSerializerMixin(serializers.Serializer):
+    """Статистика использования элемента справочника (если выборка аннотирована)"""
+
+    operations_count = serializers.IntegerField(read_only=True)
+    operations_total = serializers.DecimalField(
+        max_digits=20, decimal_places=2, read_only=True
+    )
+    operations_unconverted = serializers.IntegerField(read_only=True)
+    last_used = serializers.DateField(read_only=True)
+
+
+class StatusSerializer(
+    OwnedSerializerMixin, UsageSerializerMixin, serializers.ModelSerializer
+):
     """Сериализатор статусов с проверкой уникальности"""
 
     class Meta:
@@ -32,12 +101,16 @@ class StatusSerializer(serializers.ModelSerializer):
     def validate_name(self, value: str) -> str:
         """Делегируем проверку уникальности сервисному слою"""
         try:
-            return BaseValidator.validate_unique_name(Status, value, self.instance)
+            return BaseValidator.validate_unique_name(
+                Status, value, self.context["request"].user, self.instance
+            )
         except ValidationError as e:
             raise serializers.ValidationError(str(e))
 
 
-class OperationTypeSerializer(serializers.ModelSerializer):
+class OperationTypeSerializer(
+    OwnedSerializerMixin, UsageSerializerMixin, serializers.ModelSerializer
+):
     """Сериализатор типов операций"""
 
     class Meta:
@@ -47,12 +120,16 @@ class OperationTypeSerializer(serializers.ModelSerializer):
     def validate_name(self, value: str) -> str:
         """Валидация имени через сервисный слой"""
         try:
-            return OperationTypeValidator.validate_name(value, self.instance)
+            return OperationTypeValidator.validate_name(
+                value, self.context["request"].user, self.instance
+            )
         except ValidationError as e:
             raise serializers.ValidationError(str(e))
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(
+    OwnedSerializerMixin, UsageSerializerMixin, serializers.ModelSerializer
+):
     """Сериализатор категорий с расширенной валидацией"""
 
     operation_type_name = serializers.CharField(
@@ -79,8 +156,16 @@ class CategorySerializer(serializers.ModelSerializer):
 
         return attrs
 
+    def validate_operation_type(self, value: OperationType) -> OperationType:
+        try:
+            return CategoryValidator.validate_operation_type(value, self.instance)
+        except ValidationError as e:
+            raise serializers.ValidationError(e.messages)
+
 
-class SubCategorySerializer(serializers.ModelSerializer):
+class SubCategorySerializer(
+    OwnedSerializerMixin, UsageSerializerMixin, serializers.ModelSerializer
+):
     """Сериализатор подкатегорий с проверкой связей"""
 
     category_name = serializers.CharField(source="category.name", read_only=True)
@@ -107,3 +192,9 @@ class SubCategorySerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError({"name": str(e)})
 
         return attrs
+
+    def validate_category(self, value: Category) -> Category:
+        try:
+            return SubCategoryValidator.validate_category(value, self.instance)
+        except ValidationError as e:
+            raise serializers.ValidationError(e.messages)
@@ -0,0 +1,345 @@
+"""
+Поиск аномальных сумм и частоты операций по подкатегориям.
+
+Записи загружаются в массивы NumPy, сортируются по (подкатегория, дата, id),
+и все статистики считаются векторно по скользящему окну из предыдущих
+операций той же подкатегории. Python-циклов по строкам нет. Суммы
+сравниваются в базовой валюте (по курсу на дату операции), поэтому
+операции одной подкатегории в разных валютах сопоставимы.
+"""
+
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import numpy as np
+from django.db.models import FloatField, Min, QuerySet
+from django.db.models.functions import Cast
+from numpy.lib.stride_tricks import sliding_window_view
+
+from ..models import CashFlow
+from .currency import base_currency, converted_amount, ensure_rates
+
+# Коэффициент для перевода MAD в оценку стандартного отклонения
+MAD_SCALE = 0.6745
+# Размер блока строк для расчета скользящей медианы (ограничивает память)
+CHUNK_SIZE = 500_000
+METHODS = ("mad", "zscore")
+
+
+@dataclass
+class AmountSeries:
+    """Суммы операций в базовой валюте, отсортированные по (подкатегория, дата, id)"""
+
+    ids: np.ndarray
+    subcategories: np.ndarray
+    days: np.ndarray
+    amounts: np.ndarray
+
+    @classmethod
+    def load(cls, queryset: QuerySet, chunk_size: int = 100_000) -> "AmountSeries":
+        """
+        Загружает записи в массивы; сортировка выполняется в NumPy.
+
+        Raises:
+            ValueError: Если для какой-либо операции нет курса валюты
+        """
+        ensure_rates(queryset)
+        rows = queryset.order_by().values_list(
+            "id", "subcategory_id", "date", Cast(converted_amount(), FloatField())
+        )
+        ids, subcategories, days, amounts = [], [], [], []
+        for chunk in _chunks(rows.iterator(chunk_size=chunk_size), chunk_size):
+            columns = list(zip(*chunk))
+            ids.append(np.array(columns[0], dtype=np.int64))
+            subcategories.append(np.array(columns[1], dtype=np.int64))
+            days.append(np.array(columns[2], dtype="datetime64[D]").astype(np.int32))
+            amounts.append(np.array(columns[3], dtype=np.float64))
+        if not ids:
+            empty = np.empty(0, dtype=np.int64)
+            return cls(empty, empty, empty.astype(np.int32), empty.astype(np.float64))
+
+        series = cls(
+            *(np.concatenate(parts) for parts in (ids, subcategories, days, amounts))
+        )
+        order = np.lexsort((series.ids, series.days, series.subcategories))
+        return cls(
+            series.ids[order],
+            series.subcategories[order],
+            series.days[order],
+            series.amounts[order],
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def group_starts(self) -> np.ndarray:
+        """Индекс начала группы (подкатегории) для каждой строки"""
+        if not len(self):
+            return np.empty(0, dtype=np.int64)
+        is_start = np.r_[True, self.subcategories[1:] != self.subcategories[:-1]]
+        starts = np.flatnonzero(is_start)
+        lengths = np.diff(np.r_[starts, len(self)])
+        return np.repeat(starts, lengths)
+
+
+def _chunks(iterator, size: int):
+    chunk = []
+    for row in iterator:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def rolling_zscore(
+    amounts: np.ndarray, group_starts: np.ndarray, window: int, min_periods: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    z-оценка каждой суммы относительно среднего и стандартного отклонения
+    предыдущих window операций той же группы.
+
+    Считается через накопленные суммы за O(n). Для устойчивости суммы
+    предварительно центрируются по среднему группы.
+
+    Returns:
+        Кортеж (оценка, ожидаемое значение); для строк с историей короче
+        min_periods оценка равна NaN.
+    """
+    n = len(amounts)
+    if not n:
+        return np.empty(0), np.empty(0)
+    index = np.arange(n)
+    starts_unique, inverse = np.unique(group_starts, return_inverse=True)
+    group_sums = np.add.reduceat(amounts, starts_unique)
+    group_sizes = np.diff(np.r_[starts_unique, n])
+    centered = amounts - (group_sums / np.maximum(group_sizes, 1))[inverse]
+
+    cumsum = np.r_[0.0, np.cumsum(centered)]
+    cumsum_sq = np.r_[0.0, np.cumsum(centered**2)]
+    lower = np.maximum(group_starts, index - window)
+    count = index - lower
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = (cumsum[index] - cumsum[lower]) / count
+        variance = (cumsum_sq[index] - cumsum_sq[lower]) / count - mean**2
+        std = np.sqrt(np.maximum(variance, 0))
+        deviation = centered - mean
+        score = np.where(
+            std > 0, deviation / std, np.where(deviation == 0, 0.0, np.inf)
+        )
+    score[count < min_periods] = np.nan
+    expected = amounts - deviation
+    return np.abs(score), expected
+
+
+def rolling_mad(
+    amounts: np.ndarray, group_starts: np.ndarray, window: int, min_periods: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Робастная оценка 0.6745 * |x - медиана| / MAD по предыдущим window
+    операциям той же группы.
+
+    Окна строятся через sliding_window_view без копирования. Для строк с
+    полным окном медиана берется из окон, отсортированных блоками по
+    CHUNK_SIZE (сортировка коротких строк быстрее np.median); строки в начале
+    группы (неполное окно) считаются через np.nanmedian с маской.
+    """
+    n = len(amounts)
+    score = np.full(n, np.nan)
+    expected = np.full(n, np.nan)
+    if not n:
+        return score, expected
+
+    padded = np.r_[np.full(window, np.nan), amounts]
+    windows = sliding_window_view(padded, window)[
+        :n
+    ]  # windows[i] = amounts[i-window:i]
+    position = np.arange(n) - group_starts
+
+    def apply(rows: np.ndarray, values: np.ndarray, median_func) -> None:
+        median = median_func(values, axis=1)
+        mad = median_func(np.abs(values - median[:, None]), axis=1)
+        deviation = amounts[rows] - median
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score[rows] = np.where(
+                mad > 0,
+                MAD_SCALE * np.abs(deviation) / mad,
+                np.where(deviation == 0, 0.0, np.inf),
+            )
+        expected[rows] = median
+
+    full = np.flatnonzero(position >= window)
+    for begin in range(0, len(full), CHUNK_SIZE):
+        rows = full[begin : begin + CHUNK_SIZE]
+        apply(rows, windows[rows], _sorted_median)
+
+    partial = np.flatnonzero((position < window) & (position >= min_periods))
+    for begin in range(0, len(partial), CHUNK_SIZE):
+        rows = partial[begin : begin + CHUNK_SIZE]
+        # В окне оставляем только значения своей группы
+        mask = np.arange(window)[None, :] >= (window - position[rows])[:, None]
+        apply(rows, np.where(mask, windows[rows], np.nan), np.nanmedian)
+
+    return score, expected
+
+
+def _sorted_median(values: np.ndarray, axis: int = 1) -> np.ndarray:
+    """Медиана по строкам через сортировку на месте (values изменяется)"""
+    values.sort(axis=axis)
+    middle = values.shape[axis] // 2
+    if values.shape[axis] % 2:
+        return values[:, middle]
+    return (values[:, middle - 1] + values[:, middle]) / 2
+
+
+def frequency_anomalies(
+    series: AmountSeries, factor: float, min_count: int
+) -> list[dict[str, any]]:
+    """
+    Дни, в которые операций по подкатегории в factor раз больше обычного.
+
+    Обычная частота — медиана количества операций в день по дням, когда
+    операции по подкатегории были.
+    """
+    if not len(series):
+        return []
+    # Пары (подкатегория, день) без упаковки в одно число: дни до 1970 года
+    # отрицательны, а id подкатегорий не ограничены
+    pairs, counts = np.unique(
+        np.column_stack((series.subcategories, series.days.astype(np.int64))),
+        axis=0,
+        return_counts=True,
+    )
+    subcategories, days = pairs[:, 0], pairs[:, 1]
+
+    # Медиана дневного количества операций в каждой подкатегории
+    order = np.lexsort((counts, subcategories))
+    sorted_counts = counts[order]
+    sorted_subcategories = subcategories[order]
+    starts = np.flatnonzero(
+        np.r_[True, sorted_subcategories[1:] != sorted_subcategories[:-1]]
+    )
+    lengths = np.diff(np.r_[starts, len(sorted_counts)])
+    medians = (
+        sorted_counts[starts + (lengths - 1) // 2]
+        + sorted_counts[starts + lengths // 2]
+    ) / 2
+    typical = np.repeat(medians, lengths)[np.argsort(order)]
+
+    flagged = np.flatnonzero((counts >= min_count) & (counts > factor * typical))
+    epoch = date(1970, 1, 1)
+    return [
+        {
+            "subcategory": int(subcategories[i]),
+            "date": epoch + timedelta(days=int(days[i])),
+            "count": int(counts[i]),
+            "typical": float(typical[i]),
+        }
+        for i in flagged
+    ]
+
+
+def detect_anomalies(
+    queryset: QuerySet | None = None,
+    method: str = "mad",
+    window: int = 30,
+    threshold: float | None = None,
+    min_periods: int = 5,
+    since_id: int | None = None,
+    history_days: int = 365,
+    frequency_factor: float = 3.0,
+    frequency_min_count: int = 3,
+) -> dict[str, any]:
+    """
+    Находит выбросы в суммах и всплески частоты операций.
+
+    Args:
+        queryset: Выборка ДДС (по умолчанию — все записи)
+        method: mad (скользящая медиана/MAD) или zscore (скользящее среднее)
+        window: Число предыдущих операций подкатегории в окне
+        threshold: Порог оценки (по умолчанию 3.5 для mad и 3 для zscore)
+        min_periods: Минимальная длина истории для оценки
+        since_id: Инкрементальный режим — проверять только записи с id больше
+            указанного; история берется по их подкатегориям за history_days
+        history_days: Глубина истории для инкрементального режима
+        frequency_factor: Во сколько раз дневное число операций должно
+            превышать обычное, чтобы считаться аномальным
+        frequency_min_count: Минимальное число операций в аномальный день
+
+    Raises:
+        ValueError: Если параметры некорректны или для какой-либо операции
+            нет курса валюты
+
+    Returns:
+        Словарь с выбросами (outliers, суммы в базовой валюте currency),
+        аномалиями частоты (frequency), числом проверенных записей (checked)
+        и максимальным id (last_id)
+    """
+    if method not in METHODS:
+        raise ValueError(f"Недопустимый метод: {method}")
+    if window < 1 or min_periods < 1:
+        raise ValueError("Окно и минимальная история должны быть положительными")
+    if threshold is None:
+        threshold = 3.5 if method == "mad" else 3.0
+
+    queryset = queryset if queryset is not None else CashFlow.objects.all()
+    if since_id is not None:
+        new_rows = queryset.filter(id__gt=since_id)
+        first_date = new_rows.aggregate(first=Min("date"))["first"]
+        if first_date is None:
+            return {
+                "outliers": [],
+                "frequency": [],
+                "checked": 0,
+                "last_id": since_id,
+                "currency": base_currency(),
+            }
+        queryset = queryset.filter(
+            subcategory__in=new_rows.values("subcategory"),
+            date__gte=first_date - timedelta(days=history_days),
+        )
+
+    series = AmountSeries.load(queryset)
+    group_starts = series.group_starts()
+    kernel = rolling_mad if method == "mad" else rolling_zscore
+    score, expected = kernel(series.amounts, group_starts, window, min_periods)
+
+    checked = np.ones(len(series), dtype=bool)
+    if since_id is not None:
+        checked = series.ids > since_id
+    flagged = np.flatnonzero(checked & (score > threshold))
+    flagged = flagged[np.argsort(-score[flagged], kind="stable")]
+
+    epoch = date(1970, 1, 1)
+    outliers = [
+        {
+            "id": int(series.ids[i]),
+            "subcategory": int(series.subcategories[i]),
+            "date": epoch + timedelta(days=int(series.days[i])),
+            "amount": float(series.amounts[i]),
+            "expected": float(expected[i]),
+            "score": float(score[i]) if np.isfinite(score[i]) else None,
+        }
+        for i in flagged
+    ]
+
+    frequency = frequency_anomalies(series, frequency_factor, frequency_min_count)
+    if since_id is not None:
+        new_days = set(
+            zip(series.subcategories[checked].tolist(), series.days[checked].tolist())
+        )
+        frequency = [
+            item
+            for item in frequency
+            if (item["subcategory"], (item["date"] - epoch).days) in new_days
+        ]
+
+    return {
+        "outliers": outliers,
+        "frequency": frequency,
+        "checked": int(checked.sum()),
+        "last_id": int(series.ids.max()) if len(series) else since_id,
+        "currency": base_currency(),
+    }
@@ -0,0 +1,495 @@
+"""
+Архив старых записей ДДС в файлах Parquet.
+
+Записи архивируются целыми месяцами: месяц выгружается в сжатый (zstd)
+колоночный файл CASHFLOW_ARCHIVE_DIR/cashflow_YYYY-MM.parquet, в базе
+остаются итоги CashFlowRollup по справочникам и валюте, а сами записи
+удаляются одним DELETE. Сумма каждой записи сохраняется и в базовой
+валюте (по курсу на дату операции), поэтому при чтении архива курсы
+нужны, только если отчет строится в другой валюте.
+
+Отчеты читают архив прозрачно (ArchiveFilter): открываются только файлы
+месяцев из запрошенного периода, фильтры по владельцу, дате, статусу и
+типу операции передаются в читатель Parquet, а группировка выполняется в
+Arrow без построчной обработки в Python. Итоги без деления месяца на дни
+(остаток прогноза, статистика справочников, снимок потока событий) берутся
+из CashFlowRollup без чтения файлов; выборки отдельных записей за период с
+архивными месяцами отклоняются (ensure_not_archived).
+
+Для работы архива нужен пакет pyarrow (poetry install -E archive).
+"""
+
+import logging
+import os
+import tempfile
+from dataclasses import dataclass, replace
+from datetime import date
+from decimal import Decimal
+from functools import partial
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Count, Max
+
+from ..models import (ArchivedMonth, CashFlow, CashFlowNote, CashFlowRollup,
+                      full_comment)
+from .currency import (RateCache, amount_sum, base_currency, converted_amount,
+                       ensure_rates)
+from .reports import parse_date, shift_months
+from .versioning import CASHFLOWS, bump_version
+
+logger = logging.getLogger(__name__)
+
+# Число записей, выгружаемых из базы и записываемых в файл за один раз
+CHUNK_SIZE = 50_000
+
+COLUMNS = [
+    "id",
+    "date",
+    "status_id",
+    "operation_type_id",
+    "category_id",
+    "subcategory_id",
+    "amount",
+    "currency",
+    "amount_base",
+    "comment",
+    "recurring_id",
+    "source_reference",
+    "fingerprint",
+    "owner_id",
+]
+REFERENCE_COLUMNS = ["status_id", "operation_type_id", "category_id", "subcategory_id"]
+
+
+def _pyarrow():
+    """Модули pyarrow (импортируются только при работе с архивом)"""
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise ImproperlyConfigured(
+            "Для архива записей ДДС нужен пакет pyarrow: poetry install -E archive"
+        )
+    return pyarrow
+
+
+def _schema():
+    pa = _pyarrow()
+    return pa.schema(
+        [
+            ("id", pa.int64()),
+            ("date", pa.date32()),
+            ("status_id", pa.int64()),
+            ("operation_type_id", pa.int64()),
+            ("category_id", pa.int64()),
+            ("subcategory_id", pa.int64()),
+            ("amount", pa.decimal128(12, 2)),
+            ("currency", pa.string()),
+            ("amount_base", pa.decimal128(20, 2)),
+            ("comment", pa.string()),
+            ("recurring_id", pa.int64()),
+            ("source_reference", pa.string()),
+            ("fingerprint", pa.string()),
+            ("owner_id", pa.int64()),
+        ]
+    )
+
+
+def archive_path(month: date) -> str:
+    """Путь к архивному файлу месяца"""
+    return os.path.join(
+        settings.CASHFLOW_ARCHIVE_DIR, f"cashflow_{month:%Y-%m}.parquet"
+    )
+
+
+def is_archived(day: date) -> bool:
+    """Перенесен ли месяц даты в архив (один запрос по уникальному индексу)"""
+    return ArchivedMonth.objects.filter(month=day.replace(day=1)).exists()
+
+
+def ensure_not_archived(start_date: date | None, end_date: date | None) -> None:
+    """
+    Проверяет, что в периоде нет архивных месяцев (для выборок отдельных
+    записей: их архивные записи в базе не хранятся).
+
+    Raises:
+        ValueError: Если период затрагивает архивные месяцы
+    """
+    months = ArchiveFilter(start_date=start_date, end_date=end_date).months()
+    if months:
+        raise ValueError(
+            "Записи за {} перенесены в архив: используйте сводную таблицу или "
+            "сравнение периодов".format(
+                ", ".join(f"{archived.month:%m.%Y}" for archived in months)
+            )
+        )
+
+
+def months_to_archive(before: date) -> list[date]:
+    """Месяцы с записями ДДС, целиком лежащие раньше даты before"""
+    return list(
+        CashFlow.objects.filter(date__lt=before.replace(day=1))
+        .order_by()
+        .dates("date", "month")
+    )
+
+
+def _write_month(month: date, path: str) -> int:
+    """Выгружает записи месяца в файл порциями. Возвращает число записей"""
+    pa = _pyarrow()
+    schema = _schema()
+    queryset = (
+        CashFlow.objects.filter(date__gte=month, date__lt=shift_months(month, 1))
+        .annotate(amount_base=converted_amount(), comment=full_comment())
+        .order_by("date", "id")
+        .values_list(*COLUMNS)
+    )
+    rows = 0
+    with pa.parquet.ParquetWriter(path, schema, compression="zstd") as writer:
+        chunk = []
+        for row in queryset.iterator(chunk_size=CHUNK_SIZE):
+            chunk.append(row)
+            if len(chunk) == CHUNK_SIZE:
+                writer.write_table(_to_table(chunk, schema))
+                rows += len(chunk)
+                chunk = []
+        if chunk:
+            writer.write_table(_to_table(chunk, schema))
+            rows += len(chunk)
+    return rows
+
+
+def _to_table(rows: list[tuple], schema):
+    pa = _pyarrow()
+    columns = list(zip(*rows))
+    return pa.table(
+        [
+            pa.array(column, type=schema.field(i).type)
+            for i, column in enumerate(columns)
+        ],
+        schema=schema,
+    )
+
+
+def archive_month(month: date) -> int:
+    """
+    Переносит записи месяца в архивный файл и оставляет итоги в базе.
+
+    Файл пишется во временный путь и переименовывается последним шагом
+    транзакции, которая создает итоги и удаляет записи: при ошибке записи
+    остаются в базе, а повторный запуск перезапишет файл.
+
+    Raises:
+        ValueError: Если месяц уже в архиве или для записи в иностранной
+            валюте нет курса на ее дату
+
+    Returns:
+        Число перенесенных записей
+    """
+    month = month.replace(day=1)
+    if is_archived(month):
+        raise ValueError(f"Месяц {month:%m.%Y} уже в архиве")
+    records = CashFlow.objects.filter(date__gte=month, date__lt=shift_months(month, 1))
+    ensure_rates(records, base_currency())
+
+    path = archive_path(month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.tmp"
+    try:
+        with transaction.atomic():
+            # Блокируем записи месяца, чтобы файл и итоги совпадали
+            list(records.select_for_update().values_list("id", flat=True))
+            rows = _write_month(month, temporary)
+            rollups = (
+                records.order_by()
+                .values("owner_id", *REFERENCE_COLUMNS, "currency")
+                .annotate(
+                    count=Count("id"),
+                    amount_total=amount_sum(convert=False),
+                    amount_base=amount_sum(),
+                    last_date=Max("date"),
+                )
+            )
+            CashFlowRollup.objects.bulk_create(
+                [
+                    CashFlowRollup(
+                        month=month,
+                        count=rollup.pop("count"),
+                        amount=rollup.pop("amount_total"),
+                        **rollup,
+                    )
+                    for rollup in rollups
+                ],
+                batch_size=1000,
+            )
+            ArchivedMonth.objects.create(month=month, path=path, rows=rows)
+            CashFlowNote.objects.filter(
+                cashflow_id__in=records.values("pk")
+            )._raw_delete(records.db)
+            records._raw_delete(records.db)
+            bump_version(CASHFLOWS)
+            os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return rows
+
+
+def archive_before(before: date) -> dict[date, int]:
+    """Архивирует все полные месяцы раньше даты before"""
+    return {month: archive_month(month) for month in months_to_archive(before)}
+
+
+def _replace_file(path: str, table) -> None:
+    """
+    Записывает таблицу во временный файл рядом с path и подменяет им path
+    (os.replace атомарен: читатели видят старый или новый файл целиком).
+    """
+    pa = _pyarrow()
+    descriptor, temporary = tempfile.mkstemp(
+        dir=os.path.dirname(path), suffix=".parquet.tmp"
+    )
+    os.close(descriptor)
+    try:
+        pa.parquet.write_table(table, temporary, compression="zstd")
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def remap_files(
+    months: list[date], field: str, source_id: int, values: dict[str, int]
+) -> None:
+    """
+    Заменяет ссылку на справочник в архивных файлах месяцев months.
+
+    Замена идемпотентна; месяцы блокируются в базе, поэтому параллельные
+    замены в одном файле выполняются по очереди.
+    """
+    pa = _pyarrow()
+    pc = pa.compute
+    with transaction.atomic():
+        for archived in ArchivedMonth.objects.select_for_update().filter(
+            month__in=months
+        ):
+            table = pa.parquet.read_table(archived.path)
+            mask = pc.equal(table[field], source_id)
+            if not pc.any(mask).as_py():
+                continue
+            for column, value in values.items():
+                index = table.schema.get_field_index(column)
+                table = table.set_column(
+                    index,
+                    column,
+                    pc.if_else(mask, pa.scalar(value, pa.int64()), table[column]),
+                )
+            _replace_file(archived.path, table)
+
+
+def _remap_files_on_commit(
+    months: list[date], field: str, source_id: int, values: dict[str, int]
+) -> None:
+    """Обработчик on_commit: ошибка уже не откатит объединение и пишется в лог"""
+    try:
+        remap_files(months, field, source_id, values)
+    except Exception:
+        logger.exception(
+            "Архивные файлы за %s не переписаны: повторите "
+            "archive.remap_files(months, %r, %s, %r)",
+            ", ".join(f"{month:%m.%Y}" for month in months),
+            field,
+            source_id,
+            values,
+        )
+
+
+def remap(field: str, source_id: int, values: dict[str, int]) -> int:
+    """
+    Заменяет ссылку на справочник в итогах и архивных файлах (при
+    объединении категорий и подкатегорий).
+
+    Итоги меняются в текущей транзакции, а файлы месяцев, в итогах которых
+    встречается source_id, переписываются после ее фиксации: при откате
+    объединения архив остается прежним.
+
+    Args:
+        field: Колонка ссылки, например category_id
+        values: Новые значения колонок для затронутых записей
+
+    Returns:
+        Число месяцев, файлы которых будут переписаны
+    """
+    rollups = CashFlowRollup.objects.filter(**{field: source_id})
+    months = sorted(set(rollups.values_list("month", flat=True)))
+    rollups.update(**values)
+    if not months:
+        return 0
+    # Без pyarrow объединение откатывается сразу, а не после фиксации
+    _pyarrow()
+    transaction.on_commit(
+        partial(_remap_files_on_commit, months, field, source_id, values)
+    )
+    return len(months)
+
+
+def add_owner_column() -> int:
+    """
+    Добавляет колонку owner_id в архивные файлы, записанные до появления
+    владельцев (миграция 0010 назначает владельца только итогам в базе).
+    Владелец берется из итогов месяца — до миграции он у месяца один.
+
+    Вызывается после migrate (сигнал post_migrate); повторный вызов ничего
+    не меняет.
+
+    Returns:
+        Число дополненных файлов
+    """
+    archived = list(ArchivedMonth.objects.order_by("month"))
+    if not archived:
+        return 0
+    pa = _pyarrow()
+    updated = 0
+    for month in archived:
+        if "owner_id" in pa.parquet.read_schema(month.path).names:
+            continue
+        owners = set(
+            CashFlowRollup.objects.filter(month=month.month).values_list(
+                "owner_id", flat=True
+            )
+        )
+        if len(owners) > 1:
+            raise ValueError(
+                f"У архива за {month.month:%m.%Y} нет колонки owner_id, "
+                "а итоги месяца принадлежат разным владельцам"
+            )
+        owner = owners.pop() if owners else None
+        table = pa.parquet.read_table(month.path)
+        table = table.append_column(
+            "owner_id", pa.array([owner] * table.num_rows, pa.int64())
+        )
+        _replace_file(month.path, table)
+        updated += 1
+    return updated
+
+
+@dataclass(frozen=True)
+class ArchiveFilter:
+    """Фильтры отчета для чтения архивных записей (owner — id владельца)"""
+
+    start_date: date | None = None
+    end_date: date | None = None
+    status: int | None = None
+    operation_type: int | None = None
+    owner: int | None = None
+
+    @classmethod
+    def from_params(cls, params, owner: int | None = None) -> "ArchiveFilter | None":
+        """
+        Фильтры из параметров запроса (как у filter_cashflows) для записей
+        владельца owner.
+
+        Returns:
+            None, если архивных месяцев в периоде нет — тогда архив не читается
+        """
+        archive = cls(
+            start_date=parse_date(params.get("start_date")),
+            end_date=parse_date(params.get("end_date")),
+            status=int(params["status"]) if params.get("status") else None,
+            operation_type=(
+                int(params["operation_type"]) if params.get("operation_type") else None
+            ),
+            owner=owner,
+        )
+        return archive if archive.months() else None
+
+    def restrict(self, start: date, end: date) -> "ArchiveFilter":
+        """Те же фильтры для периода [start, end] внутри текущего"""
+        return replace(
+            self,
+            start_date=max(filter(None, [start, self.start_date])),
+            end_date=min(filter(None, [end, self.end_date])),
+        )
+
+    def months(self) -> list[ArchivedMonth]:
+        """Архивные месяцы, пересекающиеся с периодом"""
+        months = ArchivedMonth.objects.order_by("month")
+        if self.start_date:
+            months = months.filter(month__gte=self.start_date.replace(day=1))
+        if self.end_date:
+            months = months.filter(month__lte=self.end_date)
+        return list(months)
+
+    def read(self, columns: list[str] | None = None):
+        """Архивные записи периода (pyarrow.Table) или None, если их нет"""
+        months = self.months()
+        if not months:
+            return None
+        pa = _pyarrow()
+        field = pa.dataset.field
+        conditions = []
+        if self.start_date:
+            conditions.append(field("date") >= self.start_date)
+        if self.end_date:
+            conditions.append(field("date") <= self.end_date)
+        if self.status is not None:
+            conditions.append(field("status_id") == self.status)
+        if self.operation_type is not None:
+            conditions.append(field("operation_type_id") == self.operation_type)
+        if self.owner is not None:
+            conditions.append(field("owner_id") == self.owner)
+        condition = None
+        for expression in conditions:
+            condition = expression if condition is None else condition & expression
+        dataset = pa.dataset.dataset(
+            [month.path for month in months], schema=_schema(), format="parquet"
+        )
+        return dataset.to_table(columns=columns, filter=condition)
+
+    def totals(
+        self, keys: list[str], currency: str, by_month: bool = False
+    ) -> dict[tuple, Decimal]:
+        """
+        Суммы архивных записей в валюте currency по значениям колонок keys
+        (и по месяцу, если by_month — он добавляется последним в ключ).
+
+        Raises:
+            ValueError: Если для пересчета в валюту отчета нет курса
+        """
+        base = base_currency()
+        converted = currency != base
+        group = keys + (["currency", "date"] if converted else [])
+        table = self.read(
+            columns=list(dict.fromkeys(group + ["date", "amount", "amount_base"]))
+        )
+        if table is None or not table.num_rows:
+            return {}
+        pa = _pyarrow()
+        if by_month:
+            table = table.append_column(
+                "month", pa.compute.floor_temporal(table["date"], unit="month")
+            )
+            group = keys + ["month"] + (["currency", "date"] if converted else [])
+        grouped = table.group_by(group).aggregate(
+            [("amount", "sum"), ("amount_base", "sum")]
+        )
+
+        result_keys = keys + (["month"] if by_month else [])
+        totals: dict[tuple, Decimal] = {}
+        rates = RateCache() if converted else None
+        for row in grouped.to_pylist():
+            key = tuple(row[name] for name in result_keys)
+            if not converted:
+                value = row["amount_base_sum"]
+            elif row["currency"] == currency:
+                value = row["amount_sum"]
+            else:
+                value = (
+                    row["amount_base_sum"] / rates.rate(currency, row["date"])
+                ).quantize(Decimal("0.01"))
+            totals[key] = totals.get(key, Decimal("0")) + value
+        return totals
@@ -0,0 +1,98 @@
+"""
+Сторонние статические файлы, хранящиеся в проекте (static/vendor/).
+
+Bootstrap Icons подключаются с локальной копии: она проходит через
+collectstatic (отпечаток в имени, сжатые копии, кэширование навсегда), и
+страницы не зависят от CDN. Копию создает команда vendor_icons: пакет
+скачивается из реестра npm, проверяется по контрольной сумме реестра и
+распаковывается в static/vendor/bootstrap-icons/. Пока копии нет, шаблоны
+ссылаются на CDN.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+import tarfile
+import urllib.request
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+
+ICONS_VERSION = "1.8.0"
+ICONS_PACKAGE = "bootstrap-icons"
+ICONS_DIR = "vendor/bootstrap-icons"
+ICONS_CSS = f"{ICONS_DIR}/bootstrap-icons.css"
+ICONS_CDN = (
+    f"https://cdn.jsdelivr.net/npm/{ICONS_PACKAGE}@{ICONS_VERSION}"
+    "/font/bootstrap-icons.css"
+)
+NPM_REGISTRY = "https://registry.npmjs.org"
+# Таймаут запросов к реестру npm, секунд
+TIMEOUT = 30
+
+
+@lru_cache(maxsize=1)
+def icons_css_url() -> str:
+    """
+    Адрес CSS иконок: локальная копия, если она есть, иначе CDN. Копия,
+    добавленная без повторного collectstatic, отсутствует в манифесте
+    статики — тогда тоже CDN, а не ошибка на каждой странице.
+    """
+    if not finders.find(ICONS_CSS):
+        return ICONS_CDN
+    try:
+        return static(ICONS_CSS)
+    except ValueError:
+        return ICONS_CDN
+
+
+def _download(url: str) -> bytes:
+    with urllib.request.urlopen(url, timeout=TIMEOUT) as response:
+        return response.read()
+
+
+def _verify(data: bytes, integrity: str) -> None:
+    """Проверка пакета по полю dist.integrity реестра (sha512-<base64>)"""
+    algorithm, _, expected = integrity.partition("-")
+    actual = base64.b64encode(hashlib.new(algorithm, data).digest()).decode()
+    if actual != expected:
+        raise ValueError(f"Контрольная сумма пакета не совпадает ({integrity})")
+
+
+def vendor_icons(target: str | None = None) -> list[str]:
+    """
+    Скачивает Bootstrap Icons ICONS_VERSION в static/vendor/bootstrap-icons/.
+
+    Args:
+        target: Каталог назначения (по умолчанию BASE_DIR/static/ICONS_DIR)
+
+    Returns:
+        Список записанных файлов
+    """
+    target = target or os.path.join(settings.BASE_DIR, "static", ICONS_DIR)
+    meta = json.loads(_download(f"{NPM_REGISTRY}/{ICONS_PACKAGE}/{ICONS_VERSION}"))
+    data = _download(meta["dist"]["tarball"])
+    _verify(data, meta["dist"]["integrity"])
+
+    written = []
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as archive:
+        for member in archive.getmembers():
+            name = member.name.removeprefix("package/font/")
+            if not member.isfile() or name == member.name:
+                continue
+            # Нужны только стили и шрифты woff/woff2
+            if name != "bootstrap-icons.css" and not (
+                name.startswith("fonts/") and name.endswith((".woff", ".woff2"))
+            ):
+                continue
+            path = os.path.join(target, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(archive.extractfile(member).read())
+            written.append(path)
+    icons_css_url.cache_clear()
+    return written
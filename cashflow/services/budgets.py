@@ -0,0 +1,316 @@
+"""
+Бюджеты (лимиты расходов) по категориям и подкатегориям на месяц.
+
+Budget.spent — счетчик суммы операций месяца в базовой валюте. Он
+обновляется одним UPDATE в транзакции каждой записи ДДС (см. signals),
+поэтому проверка лимита при создании операции — один запрос по индексу
+(категория, месяц), без суммирования таблицы ДДС. В транзакции записи
+строки подходящих бюджетов блокируются (select_for_update) до проверки
+лимита и увеличения счетчика: параллельная запись ждет и проверяет уже
+увеличенный счетчик, поэтому две записи не превысят бюджет с запретом
+вместе. Массовые операции в
+обход сигналов (bulk_create, queryset.update) пересчитывают счетчики
+функцией recalculate. Счетчики месяцев, записи которых перенесены в
+архив, не пересчитываются.
+"""
+
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q, QuerySet
+from django.db.models.functions import TruncMonth
+
+from ..models import ArchivedMonth, Budget, CashFlow
+from .currency import RateCache, amount_sum
+from .reports import shift_months
+
+CENT = Decimal("0.01")
+
+
+def month_start(day: date) -> date:
+    """Первое число месяца"""
+    return day.replace(day=1)
+
+
+def spent_for(budget: Budget) -> Decimal:
+    """Сумма операций бюджета за его месяц в базовой валюте (один запрос)"""
+    month = month_start(budget.month)
+    queryset = CashFlow.objects.filter(
+        category_id=budget.category_id,
+        date__gte=month,
+        date__lt=shift_months(month, 1),
+    )
+    if budget.subcategory_id:
+        queryset = queryset.filter(subcategory_id=budget.subcategory_id)
+    total = queryset.aggregate(total=amount_sum())["total"]
+    return (total or Decimal("0")).quantize(CENT)
+
+
+def matching_budgets(
+    category_id: int, subcategory_id: int | None, day: date
+) -> QuerySet:
+    """Бюджеты, в которые попадает операция: на категорию и на ее подкатегорию"""
+    return Budget.objects.filter(
+        category_id=category_id, month=month_start(day)
+    ).filter(Q(subcategory__isnull=True) | Q(subcategory_id=subcategory_id))
+
+
+def apply_change(
+    category_id: int, subcategory_id: int | None, day: date, amount: Decimal | None
+) -> None:
+    """Прибавляет сумму (в базовой валюте) к счетчикам подходящих бюджетов"""
+    if amount:
+        matching_budgets(category_id, subcategory_id, day).update(
+            spent=F("spent") + amount
+        )
+
+
+def _applies(budget: dict[str, any], previous: dict[str, any]) -> bool:
+    """Учтена ли прежняя версия редактируемой записи в счетчике бюджета"""
+    return (
+        previous["category_id"] == budget["category_id"]
+        and month_start(previous["date"]) == budget["month"]
+        and budget["subcategory_id"] in (None, previous["subcategory_id"])
+    )
+
+
+def check_limits(
+    category_id: int,
+    subcategory_id: int | None,
+    day: date,
+    amount: Decimal,
+    previous: dict[str, any] | None = None,
+    lock: bool = False,
+) -> list[str]:
+    """
+    Проверяет, не превысит ли операция бюджеты своего месяца.
+
+    Args:
+        amount: Сумма операции в базовой валюте
+        previous: Для редактируемой записи — ее сохраненные category_id,
+            subcategory_id, date и сумма amount в базовой валюте
+        lock: Заблокировать строки бюджетов до конца транзакции (проверка
+            при сохранении записи, перед изменением счетчиков)
+
+    Returns:
+        Предупреждения по бюджетам с режимом «Предупреждать»
+
+    Raises:
+        ValidationError: Если операция увеличивает расход сверх бюджета
+            с режимом «Запрещать»
+    """
+    warnings, errors = [], []
+    budgets = matching_budgets(category_id, subcategory_id, day)
+    if lock:
+        budgets = budgets.select_for_update(of=("self",)).order_by("pk")
+    budgets = budgets.values(
+        "category_id",
+        "subcategory_id",
+        "month",
+        "limit",
+        "mode",
+        "spent",
+        "category__name",
+        "subcategory__name",
+    )
+    for budget in budgets:
+        projected = budget["spent"] + amount
+        if previous and previous["amount"] is not None and _applies(budget, previous):
+            projected -= previous["amount"]
+        if projected <= budget["limit"] or projected <= budget["spent"]:
+            continue
+        message = "Превышен бюджет «{}» за {:%m.%Y}: {} из {}".format(
+            budget["subcategory__name"] or budget["category__name"],
+            budget["month"],
+            projected,
+            budget["limit"],
+        )
+        if budget["mode"] == Budget.BLOCK:
+            errors.append(message)
+        else:
+            warnings.append(message)
+    if errors:
+        raise ValidationError(errors)
+    return warnings
+
+
+def lock_limits(records: list[CashFlow]) -> dict[tuple, Budget]:
+    """
+    Бюджеты с запретом, в которые попадают записи пачки, по (категория,
+    подкатегория, месяц). Строки блокируются до конца транзакции вставки,
+    как при сохранении одной записи.
+    """
+    return {
+        (budget.category_id, budget.subcategory_id, budget.month): budget
+        for budget in Budget.objects.filter(
+            mode=Budget.BLOCK,
+            category_id__in={record.category_id for record in records},
+            month__in={month_start(record.date) for record in records},
+        )
+        .select_related("category", "subcategory")
+        .select_for_update(of=("self",))
+        .order_by("pk")
+    }
+
+
+def check_batch(records: list[CashFlow], limits: dict[tuple, Budget]) -> dict[str, str]:
+    """
+    Проверяет пачку записей перед массовой вставкой в обход сигналов: месяц
+    не перенесен в архив и бюджеты с запретом не превышены (в том числе
+    предыдущими записями этой же пачки).
+
+    Args:
+        limits: Заблокированные бюджеты с запретом (lock_limits)
+
+    Returns:
+        Причины отказа по ingest_token
+    """
+    archived = set(
+        ArchivedMonth.objects.filter(
+            month__in={month_start(record.date) for record in records}
+        ).values_list("month", flat=True)
+    )
+    spent = {key: budget.spent for key, budget in limits.items()}
+    if limits:
+        rates = RateCache(list({record.currency for record in records}))
+
+    reasons = {}
+    for record in records:
+        token = str(record.ingest_token)
+        month = month_start(record.date)
+        if month in archived:
+            reasons[token] = f"Записи за {month:%m.%Y} перенесены в архив"
+            continue
+        keys = [
+            key
+            for key in dict.fromkeys(
+                [
+                    (record.category_id, None, month),
+                    (record.category_id, record.subcategory_id, month),
+                ]
+            )
+            if key in limits
+        ]
+        if not keys:
+            continue
+        try:
+            amount = rates.convert(record.amount, record.currency, record.date)
+        except ValueError as e:
+            reasons[token] = str(e)
+            continue
+        exceeded = [key for key in keys if spent[key] + amount > limits[key].limit]
+        if exceeded:
+            budget = limits[exceeded[0]]
+            reasons[token] = "Превышен бюджет «{}» за {:%m.%Y}: {} из {}".format(
+                (budget.subcategory or budget.category).name,
+                budget.month,
+                spent[exceeded[0]] + amount,
+                budget.limit,
+            )
+            continue
+        for key in keys:
+            spent[key] += amount
+    return reasons
+
+
+def recalculate(budgets: QuerySet | None = None) -> int:
+    """
+    Пересчитывает счетчики бюджетов по таблице ДДС.
+
+    Суммы по (категория, подкатегория, месяц) считаются одним группирующим
+    запросом по всем бюджетам сразу. Бюджеты архивных месяцев пропускаются:
+    их записей в таблице ДДС уже нет.
+
+    Returns:
+        Число пересчитанных бюджетов
+    """
+    archived = set(ArchivedMonth.objects.values_list("month", flat=True))
+    budgets = [
+        budget
+        for budget in (Budget.objects.all() if budgets is None else budgets)
+        if budget.month not in archived
+    ]
+    if not budgets:
+        return 0
+
+    months = [budget.month for budget in budgets]
+    cells = (
+        CashFlow.objects.filter(
+            category_id__in={budget.category_id for budget in budgets},
+            date__gte=min(months),
+            date__lt=shift_months(max(months), 1),
+        )
+        .order_by()
+        .annotate(month=TruncMonth("date"))
+        .values_list("category_id", "subcategory_id", "month")
+        .annotate(total=amount_sum())
+    )
+    by_category: dict[tuple, Decimal] = defaultdict(Decimal)
+    by_subcategory: dict[tuple, Decimal] = defaultdict(Decimal)
+    for category_id, subcategory_id, month, total in cells:
+        by_category[category_id, month] += total or 0
+        by_subcategory[subcategory_id, month] += total or 0
+
+    for budget in budgets:
+        if budget.subcategory_id:
+            spent = by_subcategory[budget.subcategory_id, budget.month]
+        else:
+            spent = by_category[budget.category_id, budget.month]
+        budget.spent = spent.quantize(CENT)
+    Budget.objects.bulk_update(budgets, ["spent"], batch_size=1000)
+    return len(budgets)
+
+
+def budget_report(month: date, owner) -> dict[str, any]:
+    """
+    Бюджет и факт за месяц по всем бюджетам владельца (по категориям владельца).
+
+    Факт берется из счетчиков, поэтому отчет не обращается к таблице ДДС.
+    В итоги бюджеты подкатегорий входят, только если у их категории нет
+    своего бюджета (иначе расход учитывался бы дважды).
+    """
+    rows = []
+    totals = {"limit": Decimal("0"), "spent": Decimal("0")}
+    budgets = list(
+        Budget.objects.filter(month=month_start(month), category__owner=owner)
+        .select_related("category", "subcategory")
+        .order_by("category__name", "subcategory__name")
+    )
+    covered = {budget.category_id for budget in budgets if not budget.subcategory_id}
+    for budget in budgets:
+        remaining = budget.limit - budget.spent
+        if not budget.subcategory_id or budget.category_id not in covered:
+            totals["limit"] += budget.limit
+            totals["spent"] += budget.spent
+        rows.append(
+            {
+                "id": budget.pk,
+                "category": {"id": budget.category_id, "name": budget.category.name},
+                "subcategory": (
+                    {"id": budget.subcategory_id, "name": budget.subcategory.name}
+                    if budget.subcategory_id
+                    else None
+                ),
+                "mode": budget.mode,
+                "limit": str(budget.limit),
+                "spent": str(budget.spent),
+                "remaining": str(remaining),
+                "percent": (
+                    str((budget.spent * 100 / budget.limit).quantize(Decimal("0.1")))
+                    if budget.limit
+                    else None
+                ),
+                "exceeded": remaining < 0,
+            }
+        )
+    return {
+        "month": month_start(month).strftime("%Y-%m"),
+        "rows": rows,
+        "totals": {
+            "limit": str(totals["limit"]),
+            "spent": str(totals["spent"]),
+            "remaining": str(totals["limit"] - totals["spent"]),
+        },
+    }
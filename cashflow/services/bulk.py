@@ -0,0 +1,113 @@
+"""
+Массовые изменения записей ДДС.
+
+Каждая операция — один UPDATE или DELETE по условию выборки, без загрузки
+записей в Python, поэтому работает и для «выбрать все» в админке на
+миллионах строк. Сигналы при этом не отправляются: счетчики затронутых
+бюджетов пересчитываются, а кэши инвалидируются явно. Новый статус или
+категория применяются только к записям их владельца.
+"""
+
+from django.db import transaction
+from django.db.models import Count, QuerySet
+
+from ..models import (Budget, CashFlow, CashFlowNote, Category, Status,
+                      SubCategory)
+from . import budgets, events
+from .versioning import CASHFLOWS, bump_version
+
+
+def _affected_budgets(
+    queryset: QuerySet, category_ids: set[int] = frozenset()
+) -> list[Budget]:
+    """Бюджеты месяцев и категорий, в которые попадают записи выборки"""
+    months = list(queryset.order_by().dates("date", "month"))
+    categories = set(
+        queryset.order_by().values_list("category_id", flat=True).distinct()
+    )
+    return list(
+        Budget.objects.filter(
+            category_id__in=categories | set(category_ids), month__in=months
+        )
+    )
+
+
+def _finish(counts: dict[int, int], affected: list[Budget] | None = None) -> None:
+    """Пересчитывает бюджеты и сообщает каждому владельцу число его записей"""
+    if affected:
+        budgets.recalculate(affected)
+    if any(counts.values()):
+        bump_version(CASHFLOWS)
+    for owner_id, count in counts.items():
+        if count:
+            events.publish({"type": "cashflow.bulk", "owner": owner_id, "count": count})
+
+
+def set_status(queryset: QuerySet, status: Status) -> int:
+    """Меняет статус записей выборки. Возвращает число измененных записей"""
+    with transaction.atomic():
+        count = queryset.filter(owner_id=status.owner_id).update(status=status)
+        _finish({status.owner_id: count})
+    return count
+
+
+def recategorize(
+    queryset: QuerySet, category: Category, subcategory: SubCategory | None = None
+) -> tuple[int, int]:
+    """
+    Переносит записи выборки в категорию (и подкатегорию).
+
+    Тип операции берется из категории. Если подкатегория не указана,
+    переносятся только записи, чья подкатегория принадлежит новой
+    категории, — проверка выполняется в том же UPDATE подзапросом к
+    SubCategory.category. Записи других владельцев пропускаются.
+
+    Raises:
+        ValueError: Если подкатегория не относится к категории
+
+    Returns:
+        Число перенесенных и пропущенных записей
+    """
+    values = {"category": category, "operation_type_id": category.operation_type_id}
+    if subcategory is not None:
+        if not SubCategory.objects.filter(
+            pk=subcategory.pk, category=category
+        ).exists():
+            raise ValueError("Подкатегория не относится к выбранной категории")
+        values["subcategory"] = subcategory
+
+    with transaction.atomic():
+        selected = queryset.count()
+        queryset = queryset.filter(owner_id=category.owner_id)
+        if subcategory is None:
+            own = SubCategory.objects.filter(category=category).values("pk")
+            queryset = queryset.filter(subcategory__in=own)
+        affected = _affected_budgets(queryset, {category.pk})
+        count = queryset.update(**values)
+        _finish({category.owner_id: count}, affected)
+    return count, selected - count
+
+
+def delete(queryset: QuerySet) -> int:
+    """
+    Удаляет записи выборки одним DELETE (без загрузки объектов и сигналов).
+
+    Returns:
+        Число удаленных записей
+    """
+    with transaction.atomic():
+        affected = _affected_budgets(queryset)
+        counts = dict(
+            queryset.order_by()
+            .values_list("owner_id")
+            .annotate(count=Count("id"))
+        )
+        # Комментарии удаляются первыми: _raw_delete не каскадирует
+        CashFlowNote.objects.filter(cashflow_id__in=queryset.values("pk"))._raw_delete(
+            CashFlow.objects.db
+        )
+        count = CashFlow.objects.filter(pk__in=queryset.values("pk"))._raw_delete(
+            CashFlow.objects.db
+        )
+        _finish(counts, affected)
+    return count
@@ -0,0 +1,155 @@
+"""
+Сжатие ответов и статики: gzip и brotli.
+
+brotli сжимает JSON и HTML заметно лучше gzip, но нужен пакет brotli
+(poetry install -E compression); без него используется только gzip.
+Потоковые ответы сжимаются по частям: после каждой части кодировщик
+сбрасывает буфер (flush), поэтому клиент получает данные сразу, а не
+после заполнения окна сжатия.
+
+Защита от BREACH (подбор секрета в ответе по длине сжатого тела): в
+заголовок gzip, как в GZipMiddleware, добавляется имя файла случайной
+длины — и для целых, и для потоковых ответов. В формате brotli такого
+поля нет, поэтому ответы с CSRF-токеном сжимаются только gzip (см.
+CompressionMiddleware).
+"""
+
+import gzip
+import secrets
+from functools import lru_cache
+
+from django.utils.text import StreamingBuffer, compress_string
+
+# Типы содержимого, которые имеет смысл сжимать
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/yaml",
+    "image/svg+xml",
+)
+# Поток событий не сжимается: прокси и браузеры буферизуют сжатый поток
+UNCOMPRESSED_TYPES = ("text/event-stream",)
+# Расширения статических файлов, для которых создаются сжатые копии
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".json", ".map", ".svg", ".txt", ".xml")
+# Сжатая копия сохраняется, только если она меньше исходника хотя бы на 5%
+MIN_RATIO = 0.95
+# Случайные байты в заголовке gzip — защита от BREACH, как в GZipMiddleware
+MAX_RANDOM_BYTES = 100
+
+
+@lru_cache(maxsize=1)
+def _brotli():
+    """Модуль brotli или None, если пакет не установлен"""
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def available() -> tuple[str, ...]:
+    """Поддерживаемые кодировки в порядке предпочтения"""
+    return ("br", "gzip") if _brotli() else ("gzip",)
+
+
+def is_compressible(content_type: str) -> bool:
+    """Стоит ли сжимать ответ с таким Content-Type"""
+    content_type = content_type.split(";")[0].strip().lower()
+    return not content_type.startswith(UNCOMPRESSED_TYPES) and content_type.startswith(
+        COMPRESSIBLE_TYPES
+    )
+
+
+def negotiate(accept_encoding: str, codings: tuple[str, ...] = ()) -> str | None:
+    """
+    Кодировка ответа по заголовку Accept-Encoding: первая из codings (по
+    умолчанию available()), которую клиент принимает (q > 0). None —
+    отдавать без сжатия.
+    """
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding.strip()] = quality
+    for coding in codings or available():
+        if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+
+def compress(data: bytes, encoding: str, static: bool = False) -> bytes:
+    """
+    Сжимает данные целиком. Для статики (static) — с максимальной
+    степенью сжатия: файл сжимается один раз при сборке.
+    """
+    if encoding == "br":
+        return _brotli().compress(data, quality=11 if static else 5)
+    if static:
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return compress_string(data, max_random_bytes=MAX_RANDOM_BYTES)
+
+
+def _random_filename() -> bytes:
+    """Имя файла случайной длины для заголовка gzip (маскирует длину ответа)"""
+    return b"a" * secrets.randbelow(MAX_RANDOM_BYTES)
+
+
+class StreamCompressor:
+    """Сжатие потокового ответа по частям со сбросом буфера после каждой"""
+
+    def __init__(self, encoding: str) -> None:
+        if encoding == "br":
+            self._compressor = _brotli().Compressor(quality=5)
+        else:
+            self._buffer = StreamingBuffer()
+            self._compressor = gzip.GzipFile(
+                filename=_random_filename(),
+                mode="wb",
+                compresslevel=6,
+                fileobj=self._buffer,
+                mtime=0,
+            )
+        self.encoding = encoding
+
+    def compress(self, chunk: bytes | str) -> bytes:
+        """Сжатая часть; данные части целиком попадают в результат"""
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        if self.encoding == "br":
+            return self._compressor.process(chunk) + self._compressor.flush()
+        # Первая часть начинается с заголовка gzip (в нем случайное имя файла)
+        self._compressor.write(chunk)
+        self._compressor.flush()
+        return self._buffer.read()
+
+    def finish(self) -> bytes:
+        """Завершение потока (контрольная сумма gzip, последний блок brotli)"""
+        if self.encoding == "br":
+            return self._compressor.finish()
+        self._compressor.close()
+        return self._buffer.read()
+
+    def iterate(self, chunks):
+        """Сжатый поток из итератора частей"""
+        for chunk in chunks:
+            data = self.compress(chunk)
+            if data:
+                yield data
+        yield self.finish()
+
+    async def aiterate(self, chunks):
+        """Сжатый поток из асинхронного итератора частей"""
+        async for chunk in chunks:
+            data = self.compress(chunk)
+            if data:
+                yield data
+        yield self.finish()
@@ -0,0 +1,34 @@
+"""
+Условные GET-запросы к записям ДДС (ETag и ответ 304).
+
+Список, запись и period_stats зависят только от записей ДДС владельца,
+справочников и курсов валют, параметров запроса и кода проекта. Каждое
+изменение этих данных увеличивает версии DataVersion (services/versioning),
+поэтому ETag считается по версиям — один запрос по первичному ключу — без
+выборки и сериализации записей. Клиент, повторяющий запрос с
+If-None-Match, получает 304, пока данные не изменились.
+
+Last-Modified не выдается: с точностью HTTP-даты до секунды два изменения
+в одну секунду давали бы устаревший ответ 304 на If-Modified-Since.
+"""
+
+import hashlib
+
+from .schema import code_version
+from .versioning import CASHFLOWS, REFERENCES, get_versions
+
+
+def cashflow_etag(owner_id: int, path: str, *variant: str) -> str:
+    """
+    ETag ответа с записями ДДС.
+
+    Args:
+        owner_id: Владелец записей
+        path: Путь запроса со строкой параметров
+        variant: Прочее, от чего зависит тело ответа (формат рендерера и т.п.)
+    """
+    versions = get_versions(CASHFLOWS, REFERENCES)
+    digest = hashlib.sha256()
+    for part in (code_version(), owner_id, *versions.values(), path, *variant):
+        digest.update(f"{part}\n".encode())
+    return f'"{digest.hexdigest()[:32]}"'
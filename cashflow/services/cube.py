@@ -0,0 +1,374 @@
+"""
+Колоночный куб записей ДДС в памяти процесса.
+
+Все записи (вместе с архивными месяцами) загружаются один раз в массивы
+NumPy: дата — int32 (дни от 1970-01-01), владелец — int64, справочники —
+словарные коды int32, сумма — int64 в копейках базовой валюты (пересчет по курсу на дату
+операции выполняется в SQL при загрузке, см. converted_minor). Фильтры,
+группировка и агрегаты sum/count считаются векторно по всему массиву без
+запросов к базе, поэтому произвольный срез отвечает за миллисекунды.
+
+Куб поддерживается в актуальном состоянии сигналами CashFlow: сохранение
+или удаление записи применяется к массивам после фиксации транзакции.
+Каждое такое изменение увеличивает версию CASHFLOWS ровно на единицу, и
+куб ведет ожидаемую версию. Если фактическая версия (или версия
+справочников и курсов REFERENCES) отличается — были массовые изменения в
+обход сигналов, архивирование или запись в другом процессе, — куб
+перезагружается целиком перед следующим запросом.
+
+Куб включается настройкой CASHFLOW_CUBE_ENABLED.
+"""
+
+import threading
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+
+from ..models import ArchivedMonth, CashFlow, from_minor_units, to_minor_units
+from .archive import ArchiveFilter, _pyarrow
+from .currency import base_currency, converted_minor, ensure_rates, to_base
+from .reports import parse_date
+from .versioning import CASHFLOWS, REFERENCES, get_versions
+
+DIMENSIONS = ("status", "operation_type", "category", "subcategory")
+PERIODS = ("day", "week", "month", "year")
+# Размер порции строк при загрузке из базы
+CHUNK_SIZE = 100_000
+# Минимальная емкость массивов; при заполнении она растет в полтора раза
+MIN_CAPACITY = 1024
+
+
+def _period_start(days: np.ndarray, period: str) -> np.ndarray:
+    """Начало периода (день, неделя с понедельника, месяц, год) для дат"""
+    if period == "day":
+        return days
+    if period == "week":
+        # 1970-01-01 — четверг, понедельник той же недели на три дня раньше
+        return days - (days + 3) % 7
+    unit = "datetime64[M]" if period == "month" else "datetime64[Y]"
+    return (
+        days.astype("datetime64[D]")
+        .astype(unit)
+        .astype("datetime64[D]")
+        .astype(np.int32)
+    )
+
+
+@dataclass(frozen=True)
+class CubeQuery:
+    """Срез куба: фильтры и измерения группировки (owner — id владельца)"""
+
+    group_by: tuple[str, ...] = ()
+    start_date: date | None = None
+    end_date: date | None = None
+    filters: dict[str, tuple[int, ...]] = field(default_factory=dict)
+    owner: int | None = None
+
+    @classmethod
+    def from_params(cls, params, owner: int | None = None) -> "CubeQuery":
+        """
+        Срез записей владельца owner из параметров запроса: group_by (через
+        запятую или несколько раз), start_date, end_date и фильтры по
+        справочникам (id через запятую или несколько раз).
+
+        Raises:
+            ValueError: Если измерение группировки неизвестно или id не число
+        """
+        group_by = tuple(
+            name.strip()
+            for value in params.getlist("group_by")
+            for name in value.split(",")
+            if name.strip()
+        )
+        unknown = set(group_by) - set(PERIODS) - set(DIMENSIONS)
+        if unknown:
+            raise ValueError(
+                f"Неизвестные измерения группировки: {', '.join(sorted(unknown))}"
+            )
+        if len([name for name in group_by if name in PERIODS]) > 1:
+            raise ValueError("Группировать можно только по одному периоду")
+        filters = {}
+        for name in DIMENSIONS:
+            values = [
+                item
+                for value in params.getlist(name)
+                for item in value.split(",")
+                if item.strip()
+            ]
+            if values:
+                try:
+                    filters[name] = tuple(int(item) for item in values)
+                except ValueError:
+                    raise ValueError(f"Некорректный id в параметре {name}")
+        return cls(
+            group_by=tuple(dict.fromkeys(group_by)),
+            start_date=parse_date(params.get("start_date")),
+            end_date=parse_date(params.get("end_date")),
+            filters=filters,
+            owner=owner,
+        )
+
+
+class LedgerCube:
+    """Записи ДДС в массивах NumPy, отсортированных по id"""
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self.loaded = False
+        self._size = 0
+        self._versions: dict[str, int] = {}
+        self._columns: dict[str, np.ndarray] = {}
+        self._alive = np.empty(0, dtype=bool)
+        # Словари измерений: код -> id справочника и id -> код
+        self._values: dict[str, np.ndarray] = {}
+        self._codes: dict[str, dict[int, int]] = {}
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._alive[: self._size]))
+
+    def load(self) -> None:
+        """
+        Загружает все записи (и архивные месяцы) в массивы.
+
+        Версии читаются до записей: изменение, зафиксированное во время
+        загрузки, приведет к повторной загрузке, но не будет потеряно.
+
+        Raises:
+            ValueError: Если для записи в иностранной валюте нет курса
+        """
+        with self._lock:
+            self.loaded = False
+            versions = get_versions(CASHFLOWS, REFERENCES)
+            queryset = CashFlow.objects.all()
+            ensure_rates(queryset, base_currency())
+            rows = queryset.order_by().values_list(
+                "id",
+                "date",
+                "owner_id",
+                *(f"{name}_id" for name in DIMENSIONS),
+                converted_minor(),
+            )
+            parts = [self._archived()]
+            chunk = []
+            for row in rows.iterator(chunk_size=CHUNK_SIZE):
+                chunk.append(row)
+                if len(chunk) == CHUNK_SIZE:
+                    parts.append(self._to_arrays(chunk))
+                    chunk = []
+            if chunk:
+                parts.append(self._to_arrays(chunk))
+            parts = [part for part in parts if part is not None]
+            if not parts:
+                parts = [self._to_arrays([])]
+            columns = {
+                name: np.concatenate([part[i] for part in parts])
+                for i, name in enumerate(["id", "date", "owner", *DIMENSIONS, "amount"])
+            }
+            order = np.argsort(columns["id"], kind="stable")
+            size = len(order)
+            capacity = max(MIN_CAPACITY, size + size // 2)
+            self._columns = {}
+            for name, column in columns.items():
+                column = column[order]
+                if name in DIMENSIONS:
+                    values, codes = np.unique(column, return_inverse=True)
+                    self._values[name] = values
+                    self._codes[name] = {
+                        int(value): code for code, value in enumerate(values)
+                    }
+                    column = codes.astype(np.int32)
+                array = np.zeros(capacity, dtype=column.dtype)
+                array[:size] = column
+                self._columns[name] = array
+            self._alive = np.zeros(capacity, dtype=bool)
+            self._alive[:size] = True
+            self._size = size
+            self._versions = versions
+            self.loaded = True
+
+    def _to_arrays(self, rows: list[tuple]) -> list[np.ndarray]:
+        columns = list(zip(*rows)) or [()] * 8
+        return [
+            np.array(columns[0], dtype=np.int64),
+            np.array(columns[1], dtype="datetime64[D]").astype(np.int32),
+            *(np.array(column, dtype=np.int64) for column in columns[2:7]),
+            np.array(columns[7], dtype=np.int64),
+        ]
+
+    def _archived(self) -> list[np.ndarray] | None:
+        """Записи архивных месяцев (суммы в базовой валюте уже в файлах)"""
+        if not ArchivedMonth.objects.exists():
+            return None
+        table = ArchiveFilter().read(
+            columns=[
+                "id",
+                "date",
+                "owner_id",
+                *(f"{name}_id" for name in DIMENSIONS),
+                "amount_base",
+            ]
+        )
+        if table is None or not table.num_rows:
+            return None
+        amount = (
+            _pyarrow()
+            .compute.multiply(table["amount_base"], Decimal("100"))
+            .cast("int64")
+        )
+        return [
+            table["id"].to_numpy().astype(np.int64),
+            table["date"].to_numpy().astype("datetime64[D]").astype(np.int32),
+            *(
+                table[f"{name}_id"].to_numpy().astype(np.int64)
+                for name in ("owner", *DIMENSIONS)
+            ),
+            amount.to_numpy().astype(np.int64),
+        ]
+
+    def ensure_current(self) -> None:
+        """Загружает куб, если он еще не загружен или устарел"""
+        with self._lock:
+            if not self.loaded or get_versions(CASHFLOWS, REFERENCES) != self._versions:
+                self.load()
+
+    def _code(self, dimension: str, value: int) -> int:
+        """Код значения измерения; новое значение добавляется в словарь"""
+        codes = self._codes[dimension]
+        if value not in codes:
+            codes[value] = len(codes)
+            self._values[dimension] = np.append(self._values[dimension], value)
+        return codes[value]
+
+    def _position(self, pk: int) -> int | None:
+        index = int(np.searchsorted(self._columns["id"][: self._size], pk))
+        if index < self._size and self._columns["id"][index] == pk:
+            return index
+        return None
+
+    def _grow(self) -> None:
+        capacity = max(MIN_CAPACITY, len(self._alive) + len(self._alive) // 2)
+        for name, column in self._columns.items():
+            array = np.zeros(capacity, dtype=column.dtype)
+            array[: self._size] = column[: self._size]
+            self._columns[name] = array
+        alive = np.zeros(capacity, dtype=bool)
+        alive[: self._size] = self._alive[: self._size]
+        self._alive = alive
+
+    def apply_saved(self, values: dict[str, any]) -> None:
+        """
+        Применяет сохраненную запись (после фиксации транзакции).
+
+        Запись с уже известным id обновляется на месте, новая добавляется в
+        конец. Если запись нельзя применить (id меньше последнего загруженного
+        или нет курса валюты), куб помечается устаревшим.
+        """
+        with self._lock:
+            if not self.loaded:
+                return
+            amount = to_base(values["amount"], values["currency"], values["date"])
+            position = self._position(values["id"])
+            last = self._columns["id"][self._size - 1] if self._size else 0
+            if amount is None or (position is None and values["id"] < last):
+                self.loaded = False
+                return
+            if position is None:
+                if self._size == len(self._alive):
+                    self._grow()
+                position = self._size
+                self._size += 1
+            row = {
+                "id": values["id"],
+                "date": (values["date"] - date(1970, 1, 1)).days,
+                "owner": values["owner_id"],
+                "amount": to_minor_units(amount),
+                **{name: self._code(name, values[f"{name}_id"]) for name in DIMENSIONS},
+            }
+            for name, value in row.items():
+                self._columns[name][position] = value
+            self._alive[position] = True
+            self._versions[CASHFLOWS] += 1
+
+    def apply_deleted(self, pk: int) -> None:
+        """Применяет удаление записи (после фиксации транзакции)"""
+        with self._lock:
+            if not self.loaded:
+                return
+            position = self._position(pk)
+            if position is not None:
+                self._alive[position] = False
+            self._versions[CASHFLOWS] += 1
+
+    def query(self, query: CubeQuery) -> dict[str, any]:
+        """
+        Сумма (в базовой валюте) и число записей среза, в целом и по группам.
+
+        Строки отбираются булевой маской, группы — сортировкой lexsort по
+        ключам группировки и np.add.reduceat по границам групп; суммы
+        складываются в целых копейках без потери точности.
+        """
+        self.ensure_current()
+        with self._lock:
+            size = self._size
+            columns = {name: column[:size] for name, column in self._columns.items()}
+            mask = self._alive[:size].copy()
+            days = columns["date"]
+            if query.start_date:
+                mask &= days >= (query.start_date - date(1970, 1, 1)).days
+            if query.end_date:
+                mask &= days <= (query.end_date - date(1970, 1, 1)).days
+            if query.owner is not None:
+                mask &= columns["owner"] == query.owner
+            for name, ids in query.filters.items():
+                codes = [self._codes[name][pk] for pk in ids if pk in self._codes[name]]
+                mask &= np.isin(columns[name], codes)
+
+            amounts = columns["amount"][mask]
+            keys = []
+            for name in query.group_by:
+                if name in PERIODS:
+                    keys.append(_period_start(days[mask], name))
+                else:
+                    keys.append(self._values[name][columns[name][mask]])
+
+        result = {
+            "currency": base_currency(),
+            "total": {"amount": from_minor_units(amounts.sum()), "count": len(amounts)},
+            "groups": [],
+        }
+        if not keys or not len(amounts):
+            return result
+
+        order = np.lexsort(keys[::-1])
+        keys = [key[order] for key in keys]
+        # Граница группы — строка, где меняется хотя бы один ключ
+        change = np.zeros(len(order), dtype=bool)
+        change[0] = True
+        for key in keys:
+            change[1:] |= key[1:] != key[:-1]
+        starts = np.flatnonzero(change)
+        sums = np.add.reduceat(amounts[order], starts)
+        counts = np.diff(np.r_[starts, len(order)])
+
+        labels = []
+        for name, key in zip(query.group_by, keys):
+            values = key[starts]
+            if name in PERIODS:
+                labels.append(values.astype("datetime64[D]").tolist())
+            else:
+                labels.append(values.tolist())
+        result["groups"] = [
+            {
+                **dict(zip(query.group_by, group)),
+                "amount": from_minor_units(amount),
+                "count": int(count),
+            }
+            for *group, amount, count in zip(*labels, sums.tolist(), counts.tolist())
+        ]
+        return result
+
+
+# Куб процесса; загружается при первом запросе
+ledger_cube = LedgerCube()
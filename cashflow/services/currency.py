@@ -0,0 +1,259 @@
+"""
+Пересчет сумм ДДС между валютами по таблице курсов ExchangeRate.
+
+Курсы хранятся к базовой валюте учета (settings.CASHFLOW_BASE_CURRENCY) и
+действуют с указанной даты до следующего курса. Для отчетов пересчет
+выполняется в самой базе: сумма операции умножается на курс ее валюты и
+делится на курс валюты отчета, оба курса берутся коррелированным
+подзапросом «последний курс на дату операции», который обслуживается
+уникальным индексом (currency, date). Для массового импорта курсы
+загружаются в память одним запросом (RateCache).
+
+Агрегаты строятся через amount_sum: при CASHFLOW_AMOUNT_STORAGE = "minor"
+они суммируют целочисленную колонку amount_minor (копейки) вместо NUMERIC.
+"""
+
+import re
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import (BigIntegerField, Case, DecimalField,
+                              ExpressionWrapper, F, FloatField, Func, OuterRef,
+                              QuerySet, Subquery, Sum, When)
+from django.db.models.functions import Cast, Round
+
+from ..models import ExchangeRate
+
+CURRENCY_RE = re.compile(r"^[A-Z]{3}$")
+
+RATE_FIELD = DecimalField(max_digits=18, decimal_places=8)
+AMOUNT_FIELD = DecimalField(max_digits=20, decimal_places=2)
+MINOR_FIELD = BigIntegerField()
+
+
+def base_currency() -> str:
+    """Базовая валюта учета"""
+    return settings.CASHFLOW_BASE_CURRENCY
+
+
+def normalize_currency(value: str | None) -> str:
+    """
+    Код валюты в верхнем регистре; пустое значение — базовая валюта.
+
+    Raises:
+        ValueError: Если код не из трех латинских букв
+    """
+    if not value:
+        return base_currency()
+    code = value.strip().upper()
+    if not CURRENCY_RE.match(code):
+        raise ValueError(f"Некорректный код валюты: {value}")
+    return code
+
+
+class _Divide(Func):
+    """Деление; в SQLite делимое приводится к REAL, иначе деление целых — целочисленное"""
+
+    arg_joiner = " / "
+    template = "(%(expressions)s)"
+    output_field = RATE_FIELD
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        clone = self.copy()
+        dividend, divisor = clone.get_source_expressions()
+        clone.set_source_expressions([Cast(dividend, FloatField()), divisor])
+        return clone.as_sql(compiler, connection, **extra_context)
+
+
+def _rate_on_date(currency, prefix: str = "") -> Subquery:
+    """Последний курс валюты на дату операции (или раньше)"""
+    return Subquery(
+        ExchangeRate.objects.filter(
+            currency=currency, date__lte=OuterRef(f"{prefix}date")
+        )
+        .order_by("-date")
+        .values("rate")[:1],
+        output_field=RATE_FIELD,
+    )
+
+
+def _converted(
+    currency: str | None, prefix: str, field: str, output_field, places: int
+):
+    """Выражение суммы колонки field в валюте currency (см. converted_amount)"""
+    currency = normalize_currency(currency)
+    base = base_currency()
+    amount = F(f"{prefix}{field}")
+    amount_in_base = Case(
+        When(**{f"{prefix}currency": base}, then=amount),
+        default=ExpressionWrapper(
+            amount * _rate_on_date(OuterRef(f"{prefix}currency"), prefix),
+            output_field=RATE_FIELD,
+        ),
+        output_field=RATE_FIELD,
+    )
+    if currency == base:
+        converted = amount_in_base
+    else:
+        converted = _Divide(amount_in_base, _rate_on_date(currency, prefix))
+    rounded = Round(converted, places, output_field=output_field)
+    if places == 0:
+        rounded = Cast(rounded, output_field)
+    return Case(
+        When(**{f"{prefix}currency": currency}, then=amount),
+        default=rounded,
+        output_field=output_field,
+    )
+
+
+def converted_amount(currency: str | None = None, prefix: str = ""):
+    """
+    Выражение суммы операции в валюте currency (по умолчанию — базовой).
+
+    Операции в валюте отчета не пересчитываются; для остальных сумма
+    округляется до копеек после пересчета. Если курса на дату операции нет,
+    выражение дает NULL (см. ensure_rates).
+
+    Args:
+        prefix: Путь к записи ДДС для выборок из других моделей,
+            например "cashflow__" для агрегатов по справочникам
+    """
+    return _converted(currency, prefix, "amount", AMOUNT_FIELD, 2)
+
+
+def converted_minor(currency: str | None = None, prefix: str = ""):
+    """
+    То же, что converted_amount, но в целых копейках по колонке amount_minor.
+
+    Для операций в валюте отчета выражение — сама целочисленная колонка.
+    """
+    return _converted(currency, prefix, "amount_minor", MINOR_FIELD, 0)
+
+
+def amount_field(prefix: str = "") -> str:
+    """Колонка суммы для агрегатов и сортировки в текущем режиме хранения"""
+    if settings.CASHFLOW_AMOUNT_STORAGE == "minor":
+        return f"{prefix}amount_minor"
+    return f"{prefix}amount"
+
+
+class _FromMinor(Func):
+    """Копейки в сумму с двумя знаками"""
+
+    template = "ROUND(%(expressions)s / 100.0, 2)"
+    output_field = AMOUNT_FIELD
+
+
+def amount_sum(
+    currency: str | None = None, prefix: str = "", convert: bool = True, **extra: any
+):
+    """
+    Агрегат суммы операций в валюте currency (как Sum(converted_amount(...))).
+
+    При CASHFLOW_AMOUNT_STORAGE = "minor" суммируются целые копейки из
+    колонки amount_minor, а деление на 100 выполняется один раз для итога
+    группы; результат совпадает с суммированием Decimal.
+
+    Args:
+        convert: False — суммы без пересчета (для группировки по валюте)
+        extra: Аргументы Sum, например filter
+    """
+    if settings.CASHFLOW_AMOUNT_STORAGE == "minor":
+        minor = converted_minor(currency, prefix) if convert else F(amount_field(prefix))
+        return _FromMinor(Sum(minor, **extra))
+    amount = converted_amount(currency, prefix) if convert else F(amount_field(prefix))
+    return Sum(amount, **extra)
+
+
+def to_base(amount: Decimal, currency: str, day: date) -> Decimal | None:
+    """
+    Сумма в базовой валюте по курсу на дату.
+
+    Для операции в базовой валюте запросов нет, иначе — один запрос по
+    индексу (currency, date). Если курса нет, возвращается None.
+    """
+    if currency == base_currency():
+        return amount
+    rate = (
+        ExchangeRate.objects.filter(currency=currency, date__lte=day)
+        .order_by("-date")
+        .values_list("rate", flat=True)
+        .first()
+    )
+    if rate is None:
+        return None
+    return (amount * rate).quantize(Decimal("0.01"))
+
+
+def ensure_rates(queryset: QuerySet, currency: str | None = None) -> None:
+    """
+    Проверяет, что все операции выборки можно пересчитать в валюту currency.
+
+    Проверяются только операции в другой валюте; запрос останавливается на
+    первой найденной операции без курса.
+
+    Raises:
+        ValueError: Если для какой-либо операции нет курса на ее дату
+    """
+    currency = normalize_currency(currency)
+    missing = (
+        queryset.exclude(currency=currency)
+        .alias(converted=converted_amount(currency))
+        .filter(converted__isnull=True)
+        .order_by("date")
+        .values_list("currency", "date")
+        .first()
+    )
+    if missing:
+        raise ValueError(
+            "Нет курса для пересчета {} в {} на {}".format(
+                missing[0], currency, missing[1].isoformat()
+            )
+        )
+
+
+class RateCache:
+    """
+    Курсы валют в памяти для массовой обработки (импорт, прогноз).
+
+    Все курсы нужных валют загружаются одним запросом; курс на дату ищется
+    двоичным поиском по отсортированным датам без обращений к базе.
+    """
+
+    def __init__(self, currencies: list[str] | None = None) -> None:
+        self.base = base_currency()
+        self._dates: dict[str, list[date]] = defaultdict(list)
+        self._rates: dict[str, list[Decimal]] = defaultdict(list)
+        rates = ExchangeRate.objects.order_by("currency", "date")
+        if currencies is not None:
+            rates = rates.filter(currency__in=currencies)
+        for code, day, rate in rates.values_list("currency", "date", "rate"):
+            self._dates[code].append(day)
+            self._rates[code].append(rate)
+
+    def rate(self, currency: str, day: date) -> Decimal:
+        """
+        Стоимость единицы валюты в базовой валюте на дату.
+
+        Raises:
+            ValueError: Если курса на эту дату нет
+        """
+        if currency == self.base:
+            return Decimal("1")
+        index = bisect_right(self._dates.get(currency, []), day) - 1
+        if index < 0:
+            raise ValueError(f"Нет курса для пересчета {currency} на {day.isoformat()}")
+        return self._rates[currency][index]
+
+    def convert(
+        self, amount: Decimal, currency: str, day: date, to: str | None = None
+    ) -> Decimal:
+        """Пересчитывает сумму на дату в валюту to (по умолчанию — базовую)"""
+        to = to or self.base
+        if currency == to:
+            return amount
+        converted = amount * self.rate(currency, day) / self.rate(to, day)
+        return converted.quantize(Decimal("0.01"))
@@ -0,0 +1,163 @@
+"""
+Широковещательная рассылка изменений ДДС для SSE-подписчиков.
+
+Локальный бэкенд доставляет события подписчикам внутри процесса. Бэкенд
+``postgres`` публикует их через NOTIFY и слушает канал через LISTEN в
+фоновом потоке, поэтому события видят подписчики всех воркеров.
+"""
+
+import asyncio
+import json
+import logging
+import select
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "cashflow_events"
+# Ограничение PostgreSQL на размер payload у NOTIFY — 8000 байт
+NOTIFY_PAYLOAD_LIMIT = 7900
+
+
+class LocalBroadcaster:
+    """Рассылка событий всем подписчикам текущего процесса"""
+
+    def __init__(self, queue_size: int = 1000) -> None:
+        self.queue_size = queue_size
+        self._subscribers: set[tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = set()
+        self._lock = threading.Lock()
+
+    def publish(self, event: dict[str, any]) -> None:
+        """Передает событие в очереди подписчиков (потокобезопасно)"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, event)
+            except RuntimeError:
+                # Event loop подписчика уже закрыт
+                self._discard(loop, queue)
+
+    @staticmethod
+    def _put(queue: asyncio.Queue, event: dict[str, any]) -> None:
+        """Кладет событие в очередь; медленному подписчику отправляет resync"""
+        if queue.full():
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({"type": "resync"})
+            return
+        queue.put_nowait(event)
+
+    def _discard(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue) -> None:
+        with self._lock:
+            self._subscribers.discard((loop, queue))
+
+    def subscribe(self) -> "Subscription":
+        """Регистрирует подписчика сразу, до первого ожидания события"""
+        subscription = Subscription(self, asyncio.Queue(maxsize=self.queue_size))
+        with self._lock:
+            self._subscribers.add(subscription.key)
+        return subscription
+
+
+class Subscription:
+    """Очередь событий одного подписчика"""
+
+    def __init__(self, broadcaster: LocalBroadcaster, queue: asyncio.Queue) -> None:
+        self.broadcaster = broadcaster
+        self.key = (asyncio.get_running_loop(), queue)
+
+    async def get(self) -> dict[str, any]:
+        """Ожидает следующее событие"""
+        return await self.key[1].get()
+
+    def close(self) -> None:
+        """Отписывается от рассылки"""
+        self.broadcaster._discard(*self.key)
+
+
+class PostgresNotifyListener(threading.Thread):
+    """Фоновый поток, пересылающий NOTIFY из PostgreSQL в локальный broadcaster"""
+
+    def __init__(self, broadcaster: LocalBroadcaster) -> None:
+        super().__init__(name="cashflow-events-listener", daemon=True)
+        self.broadcaster = broadcaster
+
+    def run(self) -> None:
+        import psycopg2
+
+        db = settings.DATABASES["default"]
+        while True:
+            try:
+                conn = psycopg2.connect(
+                    dbname=db["NAME"],
+                    user=db["USER"],
+                    password=db["PASSWORD"],
+                    host=db["HOST"],
+                    port=db["PORT"],
+                )
+                conn.set_isolation_level(0)  # autocommit
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CHANNEL};")
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self.broadcaster.publish(json.loads(notify.payload))
+            except Exception:
+                logger.exception("Ошибка LISTEN %s, переподключение", CHANNEL)
+                threading.Event().wait(5)
+
+
+_broadcaster = LocalBroadcaster()
+_listener: PostgresNotifyListener | None = None
+_listener_lock = threading.Lock()
+
+
+def _use_postgres() -> bool:
+    return getattr(settings, "CASHFLOW_EVENTS_BACKEND", "local") == "postgres"
+
+
+def get_broadcaster() -> LocalBroadcaster:
+    """
+    Возвращает broadcaster процесса.
+
+    Для бэкенда postgres при первом обращении запускает поток LISTEN, поэтому
+    management-команды и воркеры без подписчиков соединение не держат.
+    """
+    global _listener
+    if _use_postgres() and _listener is None:
+        with _listener_lock:
+            if _listener is None:
+                _listener = PostgresNotifyListener(_broadcaster)
+                _listener.start()
+    return _broadcaster
+
+
+def publish(event: dict[str, any]) -> None:
+    """
+    Публикует событие после фиксации текущей транзакции.
+
+    Откаченные изменения подписчикам не отправляются.
+    """
+
+    def send() -> None:
+        if _use_postgres():
+            payload = json.dumps(event, cls=DjangoJSONEncoder)
+            if len(payload.encode()) > NOTIFY_PAYLOAD_LIMIT:
+                # Запись целиком не помещается в NOTIFY — клиент перечитает ее по id
+                payload = json.dumps(
+                    {**event, "record": None, "truncated": True}, cls=DjangoJSONEncoder
+                )
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, payload])
+        else:
+            _broadcaster.publish(json.loads(json.dumps(event, cls=DjangoJSONEncoder)))
+
+    transaction.on_commit(send)
@@ -0,0 +1,299 @@
+"""
+Прогноз денежных потоков и остатка по историческим данным ДДС.
+
+Дневные суммы по всем подкатегориям загружаются одним группирующим запросом
+в матрицу «подкатегории × дни». Модель (линейный тренд + сезонность по дням
+недели и месяцам года) подбирается сразу для всех строк матричными
+операциями NumPy, к ней добавляются операции по расписанию регулярных
+шаблонов, затем прогнозы суммируются до категорий и типов операций.
+Все суммы пересчитываются в базовую валюту учета. Архивные месяцы входят
+в остаток по итогам архива, а в историю модели — из файлов архива.
+"""
+
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from ..models import (CashFlow, CashFlowRollup, Category, OperationType,
+                      RecurringOperation, SubCategory)
+from .archive import ArchiveFilter
+from .currency import RateCache, amount_sum, ensure_rates
+from .recurring import occurrences_between
+from .versioning import CASHFLOWS, REFERENCES, get_versions
+
+HORIZONS = (30, 90, 180)
+CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def _one_hot(labels: np.ndarray, size: int) -> np.ndarray:
+    """Матрица «дни × значения» для усреднения по дню недели или месяцу"""
+    matrix = np.zeros((len(labels), size))
+    matrix[np.arange(len(labels)), labels] = 1
+    return matrix
+
+
+def _seasonal_effect(
+    residuals: np.ndarray, labels: np.ndarray, size: int
+) -> np.ndarray:
+    """Средний остаток модели по каждому значению сезонного признака"""
+    one_hot = _one_hot(labels, size)
+    counts = one_hot.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        effect = np.where(counts > 0, residuals @ one_hot / counts, 0.0)
+    return effect
+
+
+def fit_and_predict(
+    history: np.ndarray, history_start: date, horizon: int
+) -> np.ndarray:
+    """
+    Подбирает модель для каждой строки матрицы history и прогнозирует
+    horizon дней вперед.
+
+    Модель: линейный тренд, аддитивные эффекты дня недели и (при истории
+    от года) месяца года. Отрицательные прогнозы обнуляются: суммы ДДС
+    положительны, направление задается типом операции.
+
+    Args:
+        history: Матрица «ряды × дни» дневных сумм
+        history_start: Дата первого столбца history
+        horizon: Число дней прогноза
+
+    Returns:
+        Матрица «ряды × horizon» прогнозных дневных сумм
+    """
+    series_count, days = history.shape
+    if not series_count or not days:
+        return np.zeros((series_count, horizon))
+
+    t = np.arange(days, dtype=np.float64)
+    t_centered = t - t.mean()
+    mean = history.mean(axis=1)
+    slope = (history - mean[:, None]) @ t_centered / (t_centered @ t_centered or 1.0)
+    intercept = mean - slope * t.mean()
+    residuals = history - (intercept[:, None] + slope[:, None] * t)
+
+    all_dates = np.arange(days + horizon) + np.datetime64(history_start, "D")
+    weekdays = (all_dates.astype(np.int64) + 3) % 7  # 1970-01-01 — четверг
+    months = all_dates.astype("datetime64[M]").astype(np.int64) % 12
+
+    weekday_effect = _seasonal_effect(residuals, weekdays[:days], 7)
+    residuals = residuals - weekday_effect[:, weekdays[:days]]
+    if days >= 365:
+        month_effect = _seasonal_effect(residuals, months[:days], 12)
+    else:
+        month_effect = np.zeros((series_count, 12))
+
+    future_t = np.arange(days, days + horizon, dtype=np.float64)
+    prediction = (
+        intercept[:, None]
+        + slope[:, None] * future_t
+        + weekday_effect[:, weekdays[days:]]
+        + month_effect[:, months[days:]]
+    )
+    return np.maximum(prediction, 0.0)
+
+
+def _group_sum(matrix: np.ndarray, groups: np.ndarray, size: int) -> np.ndarray:
+    """Суммирует строки матрицы по группам (подкатегории -> категории)"""
+    result = np.zeros((size, matrix.shape[1]))
+    np.add.at(result, groups, matrix)
+    return result
+
+
+def _money(value: float) -> str:
+    return str(Decimal(value).quantize(Decimal("0.01")))
+
+
+def build_forecast(
+    owner,
+    horizons: tuple[int, ...] = HORIZONS,
+    history_days: int = 730,
+    today: date | None = None,
+) -> dict[str, any]:
+    """
+    Прогноз остатка и потоков владельца по типам операций и категориям.
+
+    Raises:
+        ValueError: Если для какой-либо операции нет курса валюты
+
+    Returns:
+        Словарь с текущим остатком, итогами по горизонтам (остаток на конец
+        горизонта, суммы по типам операций и категориям) и дневным рядом
+        поступлений, списаний и остатка на максимальный горизонт.
+    """
+    today = today or timezone.now().date()
+    horizon = max(horizons)
+    history_start = today - timedelta(days=history_days - 1)
+
+    subcategories = list(
+        SubCategory.objects.filter(owner=owner).values_list(
+            "id", "category_id", "category__operation_type_id"
+        )
+    )
+    categories = list(
+        Category.objects.filter(owner=owner).values_list(
+            "id", "name", "operation_type_id"
+        )
+    )
+    operation_types = list(
+        OperationType.objects.filter(owner=owner).values_list(
+            "id", "name", "is_income"
+        )
+    )
+    cashflows = CashFlow.objects.filter(owner=owner)
+
+    row_index = {row[0]: index for index, row in enumerate(subcategories)}
+    category_index = {row[0]: index for index, row in enumerate(categories)}
+    type_index = {row[0]: index for index, row in enumerate(operation_types)}
+
+    ensure_rates(cashflows.filter(date__lte=today))
+    history = np.zeros((len(subcategories), history_days))
+    # Операции по регулярным шаблонам известны заранее: в статистическую
+    # модель их не включаем, а добавляем в прогноз по расписанию шаблонов
+    cells = (
+        cashflows.filter(
+            date__gte=history_start, date__lte=today, recurring__isnull=True
+        )
+        .order_by()
+        .values_list("subcategory_id", "date")
+        .annotate(total=amount_sum())
+    )
+    rows, columns, totals = [], [], []
+    for subcategory_id, day, total in cells:
+        rows.append(row_index[subcategory_id])
+        columns.append((day - history_start).days)
+        totals.append(float(total))
+    # Архивные месяцы окна истории читаются из файлов архива
+    archived = ArchiveFilter(
+        start_date=history_start, end_date=today, owner=owner.pk
+    ).read(columns=["subcategory_id", "date", "amount_base", "recurring_id"])
+    for row in archived.to_pylist() if archived is not None else []:
+        if row["recurring_id"] is None and row["subcategory_id"] in row_index:
+            rows.append(row_index[row["subcategory_id"]])
+            columns.append((row["date"] - history_start).days)
+            totals.append(float(row["amount_base"]))
+    np.add.at(
+        history,
+        (np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64)),
+        totals,
+    )
+
+    prediction = fit_and_predict(history, history_start, horizon)
+    rates = RateCache()
+    for template in RecurringOperation.objects.filter(owner=owner, is_active=True):
+        for day in occurrences_between(
+            template, today + timedelta(days=1), today + timedelta(days=horizon)
+        ):
+            # Будущие операции пересчитываются по последнему известному курсу
+            amount = rates.convert(template.amount, template.currency, day)
+            prediction[
+                row_index[template.subcategory_id], (day - today).days - 1
+            ] += float(amount)
+
+    sub_to_category = np.array(
+        [category_index[category_id] for _, category_id, _ in subcategories],
+        dtype=np.int64,
+    )
+    category_to_type = np.array(
+        [type_index[type_id] for _, _, type_id in categories], dtype=np.int64
+    )
+    by_category = _group_sum(prediction, sub_to_category, len(categories))
+    by_type = _group_sum(by_category, category_to_type, len(operation_types))
+
+    is_income = np.array([income for _, _, income in operation_types], dtype=bool)
+    inflow = by_type[is_income].sum(axis=0)
+    outflow = by_type[~is_income].sum(axis=0)
+
+    income_types = Q(operation_type__is_income=True)
+    balance = cashflows.filter(date__lte=today).aggregate(
+        income=amount_sum(filter=income_types),
+        expense=amount_sum(filter=~income_types),
+    )
+    # Архивные месяцы целиком в прошлом — их суммы берутся из итогов архива
+    archived_balance = CashFlowRollup.objects.filter(owner=owner).aggregate(
+        income=Sum("amount_base", filter=income_types),
+        expense=Sum("amount_base", filter=~income_types),
+    )
+    current_balance = float(
+        (balance["income"] or 0)
+        - (balance["expense"] or 0)
+        + (archived_balance["income"] or 0)
+        - (archived_balance["expense"] or 0)
+    )
+    projected = current_balance + np.cumsum(inflow - outflow)
+
+    result_horizons = {}
+    for days in sorted(horizons):
+        type_totals = by_type[:, :days].sum(axis=1)
+        category_totals = by_category[:, :days].sum(axis=1)
+        result_horizons[str(days)] = {
+            "end_date": today + timedelta(days=days),
+            "balance": _money(projected[days - 1]),
+            "by_operation_type": [
+                {
+                    "id": type_id,
+                    "name": name,
+                    "is_income": income,
+                    "total": _money(total),
+                }
+                for (type_id, name, income), total in zip(operation_types, type_totals)
+            ],
+            "by_category": [
+                {
+                    "id": category_id,
+                    "name": name,
+                    "operation_type": type_id,
+                    "total": _money(total),
+                }
+                for (category_id, name, type_id), total in zip(
+                    categories, category_totals
+                )
+                if total
+            ],
+        }
+
+    return {
+        "as_of": today,
+        "history_days": history_days,
+        "current_balance": _money(current_balance),
+        "horizons": result_horizons,
+        "daily": [
+            {
+                "date": today + timedelta(days=offset + 1),
+                "inflow": _money(inflow[offset]),
+                "outflow": _money(outflow[offset]),
+                "balance": _money(projected[offset]),
+            }
+            for offset in range(horizon)
+        ],
+    }
+
+
+def get_forecast(
+    owner, horizons: tuple[int, ...] = HORIZONS, history_days: int = 730
+) -> dict[str, any]:
+    """
+    Прогноз владельца из кэша; пересчитывается только при появлении новых данных.
+
+    Ключ кэша включает версии ДДС и справочников, поэтому любое изменение
+    записей или справочников приводит к пересчету при следующем запросе.
+    """
+    versions = get_versions(CASHFLOWS, REFERENCES)
+    key = "cashflow:forecast:{}:{}:{}:{}:{}:{}".format(
+        owner.pk,
+        versions[CASHFLOWS],
+        versions[REFERENCES],
+        timezone.now().date().isoformat(),
+        history_days,
+        ",".join(map(str, sorted(horizons))),
+    )
+    forecast = cache.get(key)
+    if forecast is None:
+        forecast = build_forecast(owner, horizons, history_days)
+        cache.set(key, forecast, CACHE_TIMEOUT)
+    return forecast
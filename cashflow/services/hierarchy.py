@@ -0,0 +1,112 @@
+"""
+Целостность иерархии записей ДДС «тип операции → категория → подкатегория».
+
+Новые записи проверяет CashFlowValidator (по id уже загруженных
+справочников, без запросов), а в PostgreSQL — составные внешние ключи
+(миграция 0012), которые не обходят и массовые вставки. Записи,
+сохраненные раньше или в обход валидации, находит audit: каждое
+нарушение ищется одним запросом с JOIN по всей таблице. repair исправляет
+их массовыми UPDATE — категория берется из подкатегории, тип операции из
+категории — и после этого проверяет ключи (VALIDATE CONSTRAINT).
+"""
+
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, QuerySet, Subquery
+
+from ..models import Budget, CashFlow, Category, SubCategory
+from . import budgets, events
+from .versioning import CASHFLOWS, bump_version
+
+# Составные внешние ключи из миграции 0012
+FOREIGN_KEYS = (
+    "cashflow_subcategory_in_category",
+    "cashflow_category_in_operation_type",
+)
+
+
+def violations(queryset: QuerySet | None = None) -> dict[str, QuerySet]:
+    """
+    Записи с нарушением иерархии по видам: subcategory — подкатегория из
+    другой категории, category — категория другого типа операции.
+    """
+    queryset = CashFlow.objects.all() if queryset is None else queryset
+    return {
+        "subcategory": queryset.exclude(category_id=F("subcategory__category_id")),
+        "category": queryset.exclude(
+            operation_type_id=F("category__operation_type_id")
+        ),
+    }
+
+
+def audit(queryset: QuerySet | None = None, limit: int = 20) -> dict[str, any]:
+    """Число нарушений каждого вида и id первых limit записей"""
+    return {
+        kind: {
+            "count": broken.count(),
+            "ids": list(broken.order_by("pk").values_list("pk", flat=True)[:limit]),
+        }
+        for kind, broken in violations(queryset).items()
+    }
+
+
+def _owners(queryset: QuerySet) -> dict[int, int]:
+    return dict(queryset.order_by().values_list("owner_id").annotate(count=Count("id")))
+
+
+def repair() -> dict[str, int]:
+    """
+    Приводит записи к иерархии их подкатегорий. Сигналы при массовом
+    UPDATE не отправляются, поэтому бюджеты затронутых категорий
+    пересчитываются, а кэши инвалидируются явно.
+
+    Returns:
+        Число исправленных записей по видам нарушений
+    """
+    with transaction.atomic():
+        broken = violations()["subcategory"]
+        categories = set()
+        for pair in broken.values_list("category_id", "subcategory__category_id"):
+            categories.update(pair)
+        owners = _owners(broken)
+        result = {
+            "subcategory": broken.update(
+                category_id=Subquery(
+                    SubCategory.objects.filter(pk=OuterRef("subcategory_id")).values(
+                        "category_id"
+                    )
+                )
+            )
+        }
+        # Тип операции сверяется уже с исправленными категориями
+        broken = violations()["category"]
+        for owner_id, count in _owners(broken).items():
+            owners[owner_id] = owners.get(owner_id, 0) + count
+        result["category"] = broken.update(
+            operation_type_id=Subquery(
+                Category.objects.filter(pk=OuterRef("category_id")).values(
+                    "operation_type_id"
+                )
+            )
+        )
+        if categories:
+            budgets.recalculate(Budget.objects.filter(category_id__in=categories))
+        if any(result.values()):
+            bump_version(CASHFLOWS)
+        for owner_id, count in owners.items():
+            events.publish({"type": "cashflow.bulk", "owner": owner_id, "count": count})
+    return result
+
+
+def validate_constraints() -> bool:
+    """
+    Проверяет составные внешние ключи на всех записях (после repair).
+    Возвращает False, если ключей нет (база не PostgreSQL).
+    """
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        for name in FOREIGN_KEYS:
+            cursor.execute(
+                f"ALTER TABLE {CashFlow._meta.db_table} VALIDATE CONSTRAINT {name}"
+            )
+    return True
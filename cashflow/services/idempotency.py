@@ -0,0 +1,75 @@
+"""
+Поддержка заголовка Idempotency-Key для изменяющих запросов API.
+
+Ключ записывается в той же транзакции, что и сама операция, вместе с ее
+ответом. Повтор запроса с тем же ключом упирается в уникальный индекс
+(scope, key) и получает сохраненный ответ; параллельный повтор ждет на
+индексе фиксации первого запроса. Ошибки не сохраняются: транзакция
+откатывается вместе с ключом, и запрос можно исправить и повторить.
+Ключи разных пользователей не пересекаются: в scope входит id пользователя.
+"""
+
+import hashlib
+import json
+from typing import Callable
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from rest_framework.response import Response
+
+from ..models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+
+
+def request_hash(request) -> str:
+    """Отпечаток тела запроса (данные уже разобраны DRF)"""
+    data = request.data
+    if hasattr(data, "lists"):
+        data = dict(data.lists())
+    content = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(f"{request.method} {content}".encode()).hexdigest()
+
+
+def run_idempotent(request, scope: str, handler: Callable[[], Response]) -> Response:
+    """
+    Выполняет handler не более одного раза для каждого ключа идемпотентности.
+
+    Без заголовка Idempotency-Key handler просто вызывается.
+    """
+    key = request.headers.get(HEADER)
+    if not key:
+        return handler()
+    if len(key) > 255:
+        return Response({"error": "Слишком длинный ключ идемпотентности"}, status=400)
+
+    digest = request_hash(request)
+    scope = f"{scope}:{request.user.pk}"
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    key=key, scope=scope, request_hash=digest
+                )
+        except IntegrityError:
+            stored = IdempotencyKey.objects.get(key=key, scope=scope)
+            if stored.request_hash != digest:
+                return Response(
+                    {"error": "Ключ идемпотентности уже использован с другим запросом"},
+                    status=422,
+                )
+            return Response(
+                stored.response_body,
+                status=stored.response_status,
+                headers={"Idempotent-Replayed": "true"},
+            )
+
+        response = handler()
+        if response.status_code >= 400:
+            # Ответ с ошибкой не запоминаем: запрос можно исправить и повторить
+            transaction.set_rollback(True)
+            return response
+        record.response_status = response.status_code
+        record.response_body = response.data
+        record.save(update_fields=["response_status", "response_body"])
+    return response
@@ -0,0 +1,258 @@
+"""
+Идемпотентный импорт записей ДДС.
+
+Импортированная запись получает отпечаток — SHA-256 от даты, суммы, валюты,
+подкатегории, нормализованного комментария и внешнего идентификатора. По
+отпечатку построен уникальный индекс, поэтому записи вставляются пачками
+INSERT ... ON CONFLICT DO NOTHING (bulk_create с ignore_conflicts): повторная
+загрузка того же файла или пересекающихся выписок не создает дублей и не
+требует проверки существования перед вставкой.
+
+Одинаковые строки без внешнего идентификатора дают один отпечаток: в пачке
+остается первая из них, остальные возвращаются в счетчике repeated. Чтобы
+загрузить такие операции отдельно, у них должен различаться source_reference.
+
+ON CONFLICT DO NOTHING не сообщает, какие строки вставлены. Поэтому каждая
+новая запись получает ingest_token, и созданными считаются только записи,
+найденные по отпечатку с токеном этого импорта, — а не совпавшие с
+параллельным импортом того же содержимого.
+"""
+
+import csv
+import hashlib
+import io
+import uuid
+from collections import Counter
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from ..models import (ArchivedMonth, Budget, CashFlow, CashFlowNote, Category,
+                      OperationType, Status, SubCategory, to_minor_units)
+from . import budgets, events
+from .currency import RateCache
+from .reports import parse_date
+from .validators import CashFlowValidator
+from .versioning import CASHFLOWS, bump_version
+
+# Размер порции отпечатков при поиске id вставленных записей
+LOOKUP_CHUNK = 10_000
+
+
+def normalize_comment(comment: str) -> str:
+    """Комментарий без различий в регистре, пробелах и «ё»"""
+    return " ".join(comment.lower().replace("ё", "е").split())
+
+
+def compute_fingerprint(
+    day: date,
+    amount: Decimal,
+    currency: str,
+    subcategory_id: int,
+    comment: str = "",
+    source_reference: str = "",
+) -> str:
+    """Отпечаток содержимого операции"""
+    content = "|".join(
+        [
+            day.isoformat(),
+            str(Decimal(amount).quantize(Decimal("0.01"))),
+            currency.upper(),
+            str(subcategory_id),
+            normalize_comment(comment or ""),
+            (source_reference or "").strip(),
+        ]
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def fingerprint_of(record: CashFlow) -> str:
+    """Отпечаток записи ДДС"""
+    return compute_fingerprint(
+        record.date,
+        record.amount,
+        record.currency,
+        record.subcategory_id,
+        record.comment,
+        record.source_reference,
+    )
+
+
+def import_records(records: list[CashFlow], batch_size: int = 1000) -> dict[str, any]:
+    """
+    Вставляет проверенные записи, пропуская уже загруженные.
+
+    Повторы внутри пачки отбрасываются до вставки, дубли с уже сохраненными
+    записями — уникальным индексом по отпечатку. Записи в архивных месяцах
+    и сверх бюджетов с запретом не вставляются (budgets.check_batch), а
+    возвращаются с причиной отказа. Сигналы при массовой вставке не
+    отправляются, поэтому счетчики бюджетов пересчитываются, а кэши
+    инвалидируются явно.
+
+    Raises:
+        ValueError: Если для записи в иностранной валюте нет курса на ее дату
+
+    Returns:
+        Словарь с числом полученных и созданных записей, дублей уже
+        сохраненных записей (duplicates), повторов строк внутри пачки
+        (repeated), причинами отказа по номерам записей во входном списке
+        (rejected) и id записей в порядке входного списка (для дублей и
+        повторов — id сохраненной записи, для отклоненных — None)
+    """
+    rates = RateCache({record.currency for record in records})
+    unique: dict[str, CashFlow] = {}
+    fingerprints = []
+    for record in records:
+        rates.rate(record.currency, record.date)
+        record.fingerprint = fingerprint_of(record)
+        # bulk_create не отправляет pre_save — копейки заполняются здесь
+        record.amount_minor = to_minor_units(record.amount)
+        unique.setdefault(record.fingerprint, record)
+        fingerprints.append(record.fingerprint)
+    for record in unique.values():
+        # Метка импорта: по ней отличаются записи, вставленные этим вызовом
+        record.ingest_token = uuid.uuid4()
+
+    with transaction.atomic():
+        # Бюджеты с запретом блокируются до вставки, как при сохранении записи
+        limits = budgets.lock_limits(list(unique.values()))
+        keys = list(unique)
+        saved = set()
+        if limits:
+            # Дубли уже сохраненных записей не расходуют бюджет
+            for start in range(0, len(keys), LOOKUP_CHUNK):
+                saved.update(
+                    CashFlow.objects.filter(
+                        fingerprint__in=keys[start : start + LOOKUP_CHUNK]
+                    ).values_list("fingerprint", flat=True)
+                )
+        reasons = budgets.check_batch(
+            [record for key, record in unique.items() if key not in saved], limits
+        )
+        rejected = {
+            key: reasons[str(record.ingest_token)]
+            for key, record in unique.items()
+            if str(record.ingest_token) in reasons
+        }
+        CashFlow.objects.bulk_create(
+            [record for key, record in unique.items() if key not in rejected],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        ids = {}
+        owners = Counter()
+        for start in range(0, len(keys), LOOKUP_CHUNK):
+            for fingerprint, pk, token in CashFlow.objects.filter(
+                fingerprint__in=keys[start : start + LOOKUP_CHUNK]
+            ).values_list("fingerprint", "id", "ingest_token"):
+                ids[fingerprint] = pk
+                record = unique[fingerprint]
+                if token == record.ingest_token:
+                    record.pk = pk
+                    owners[record.owner_id] += 1
+        created = sum(owners.values())
+        # bulk_create с ignore_conflicts не возвращает id — длинные
+        # комментарии созданных записей вставляются по найденным id
+        CashFlowNote.create_for(unique.values(), batch_size=batch_size)
+        if created:
+            budgets.recalculate(
+                Budget.objects.filter(
+                    category_id__in={r.category_id for r in unique.values()},
+                    month__in={budgets.month_start(r.date) for r in unique.values()},
+                )
+            )
+            bump_version(CASHFLOWS)
+            for owner_id, count in owners.items():
+                events.publish(
+                    {"type": "cashflow.bulk", "owner": owner_id, "count": count}
+                )
+
+    return {
+        "received": len(records),
+        "created": created,
+        "duplicates": len(unique) - created - len(rejected),
+        "repeated": len(records) - len(unique),
+        "rejected": {
+            index: rejected[fingerprint]
+            for index, fingerprint in enumerate(fingerprints)
+            if fingerprint in rejected
+        },
+        "ids": [ids.get(fingerprint) for fingerprint in fingerprints],
+    }
+
+
+def _lookup(model, owner) -> dict[str, any]:
+    """Справочник владельца по названию без учета регистра"""
+    return {
+        item.name.strip().lower(): item for item in model.objects.filter(owner=owner)
+    }
+
+
+def records_from_csv(
+    content: str, owner, delimiter: str | None = None
+) -> tuple[list[CashFlow], dict[int, str]]:
+    """
+    Разбирает CSV с заголовком в несохраненные записи ДДС владельца owner.
+
+    Колонки: date (YYYY-MM-DD), amount, status, operation_type, category,
+    subcategory (названия справочников), необязательные currency, comment
+    и source_reference. Строки проверяются правилами CashFlowValidator
+    (кроме бюджетов: импорт загружает уже совершенные операции).
+
+    Returns:
+        Записи и ошибки по номерам строк файла
+    """
+    if delimiter is None:
+        header = content.split("\n", 1)[0]
+        delimiter = max(";,\t", key=header.count)
+    reader = csv.DictReader(io.StringIO(content), delimiter=delimiter)
+    required = {"date", "amount", "status", "operation_type", "category", "subcategory"}
+    missing = required - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"В файле нет колонок: {', '.join(sorted(missing))}")
+
+    references = {
+        "status": _lookup(Status, owner),
+        "operation_type": _lookup(OperationType, owner),
+        "category": _lookup(Category, owner),
+        "subcategory": _lookup(SubCategory, owner),
+    }
+    # Архивные месяцы загружаются один раз, а не запросом на каждую строку
+    archived = set(ArchivedMonth.objects.values_list("month", flat=True))
+    records, errors = [], {}
+    for number, row in enumerate(reader, start=2):
+        if not any(row.values()):
+            continue
+        try:
+            values = {}
+            for name, items in references.items():
+                value = (row[name] or "").strip()
+                if value.lower() not in items:
+                    raise ValidationError(f"Не найдено значение справочника: {value}")
+                values[name] = items[value.lower()]
+            day = parse_date(row["date"].strip())
+            if day is None:
+                raise ValidationError("Не указана дата")
+            try:
+                amount = Decimal(row["amount"].strip().replace(",", "."))
+            except InvalidOperation:
+                raise ValidationError(f"Некорректная сумма: {row['amount']}")
+            record = CashFlow(
+                owner=owner,
+                date=CashFlowValidator.validate_date(day, archived),
+                amount=CashFlowValidator.validate_amount(amount),
+                currency=CashFlowValidator.validate_currency(row.get("currency")),
+                comment=(row.get("comment") or "").strip(),
+                source_reference=(row.get("source_reference") or "").strip(),
+                **values,
+            )
+            CashFlowValidator.validate_category_relations(
+                record.category, record.subcategory, record.operation_type
+            )
+        except (ValueError, ValidationError) as e:
+            errors[number] = "; ".join(getattr(e, "messages", [str(e)]))
+            continue
+        records.append(record)
+    return records, errors
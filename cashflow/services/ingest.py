@@ -0,0 +1,485 @@
+"""
+Буфер записи (write-behind) для потока одиночных записей ДДС.
+
+При закрытии дня клиенты присылают тысячи POST /api/cashflows/ по одной
+записи, и каждая фиксируется отдельной транзакцией. Запрос с заголовком
+Prefer: respond-async проверяется как обычно (CashFlowSerializer и
+CashFlowValidator), но запись дописывается в журнал на локальном диске
+(с fsync) и сразу подтверждается ответом 202. Фоновый поток фиксирует
+накопленные записи одной транзакцией, когда их набирается
+CASHFLOW_INGEST_BATCH_SIZE или самая старая ждет дольше
+CASHFLOW_INGEST_MAX_DELAY секунд.
+
+Журнал — файлы <хост>-<pid>-<n>.wal в CASHFLOW_INGEST_DIR, по строке JSON
+на запись. Процесс держит блокировку (flock) своих файлов, поэтому журнал
+упавшего процесса узнается по свободной блокировке и загружается заново:
+при запуске буфера в другом воркере или командой flush_ingest. У записи
+есть ingest_token с уникальным индексом, поэтому записи, зафиксированные
+до сбоя, при повторной загрузке пропускаются.
+
+При фиксации пачка проверяется повторно: пока записи ждали в буфере, их
+месяц могли перенести в архив, а бюджет с запретом — израсходовать. Строки
+таких бюджетов блокируются в транзакции фиксации; записи, которые теперь
+не проходят проверку, откладываются в rejected.jsonl, а не фиксируются.
+
+Перед чтением ДДС пользователем фиксируются его записи (sync_owner): из
+буфера своего процесса и из журналов других процессов в том же
+CASHFLOW_INGEST_DIR (их файлы читаются без блокировки, а повторная
+фиксация записи исключена ее ingest_token). Поэтому клиент видит принятые
+записи в ответах любого воркера, журналы которого лежат в этом каталоге;
+воркеры разных хостов с локальными каталогами этого не гарантируют.
+"""
+
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import Counter
+from itertools import count
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, transaction
+from django.db.models import Count
+
+from ..models import (Budget, CashFlow, CashFlowNote, Category, OperationType,
+                      Status, SubCategory, needs_note, to_minor_units)
+from . import budgets, events
+from .imports import fingerprint_of
+from .versioning import CASHFLOWS, bump_version
+
+logger = logging.getLogger(__name__)
+
+SUFFIX = ".wal"
+# Записи, которые не удалось зафиксировать (справочник удален, пока запись
+# ждала в буфере), — для разбора вручную
+REJECTED = "rejected.jsonl"
+# Пауза перед повтором, если база недоступна, секунд
+RETRY_DELAY = 5
+# Ссылки записи, существование которых проверяется перед вставкой
+REFERENCES = {
+    "status_id": Status,
+    "operation_type_id": OperationType,
+    "category_id": Category,
+    "subcategory_id": SubCategory,
+}
+
+
+def _fields() -> list:
+    """Сохраняемые поля записи ДДС (ссылки — в виде id)"""
+    return [field for field in CashFlow._meta.concrete_fields if not field.primary_key]
+
+
+def encode(record: CashFlow) -> dict[str, any]:
+    """Значения несохраненной записи для журнала (с полным комментарием)"""
+    values = {field.attname: field.value_from_object(record) for field in _fields()}
+    values["comment"] = record.comment
+    return values
+
+
+def decode(values: dict[str, any]) -> CashFlow:
+    """Запись ДДС из строки журнала"""
+    return CashFlow(
+        **{
+            field.attname: field.to_python(values[field.attname])
+            for field in _fields()
+            if field.attname in values
+        },
+        comment=values.get("comment", ""),
+    )
+
+
+class Segment:
+    """Файл журнала под исключительной блокировкой процесса"""
+
+    def __init__(self, path: str, file) -> None:
+        self.path = path
+        self.file = file
+
+    @classmethod
+    def acquire(cls, path: str) -> "Segment | None":
+        """Открывает файл журнала; None, если его держит другой процесс"""
+        file = open(path, "a+b")
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            file.close()
+            return None
+        return cls(path, file)
+
+    def append(self, line: bytes) -> None:
+        """Дописывает строку и дожидается ее записи на диск"""
+        self.file.write(line)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def entries(self) -> list[dict[str, any]]:
+        """Строки журнала"""
+        self.file.seek(0)
+        entries = []
+        for line in self.file:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # Процесс упал посреди записи строки: ответ клиенту не отправлен
+                logger.warning("Пропущена недописанная строка журнала %s", self.path)
+        return entries
+
+    def remove(self) -> None:
+        """Удаляет зафиксированный журнал и снимает блокировку"""
+        os.remove(self.path)
+        self.file.close()
+
+
+def _foreign_entries(directory: str, owner_id: int) -> list[dict[str, any]]:
+    """
+    Записи владельца из журналов других процессов. Файлы читаются без
+    блокировки: недописанная последняя строка (ответ на нее еще не
+    отправлен) пропускается, а удаленный после фиксации журнал — тоже.
+    """
+    own = f"{socket.gethostname()}-{os.getpid()}-"
+    entries = []
+    for path in glob.glob(os.path.join(directory, "*" + SUFFIX)):
+        if os.path.basename(path).startswith(own):
+            continue
+        try:
+            with open(path, "rb") as file:
+                lines = file.readlines()
+        except FileNotFoundError:
+            continue
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry["record"]["owner_id"] == owner_id:
+                entries.append(entry)
+    return entries
+
+
+def _existing(model, ids: set[int]) -> set[int]:
+    return set(model.objects.filter(pk__in=ids).values_list("pk", flat=True))
+
+
+def _reject(
+    directory: str, entries: list[dict[str, any]], reasons: dict[str, str]
+) -> None:
+    """Откладывает записи в rejected.jsonl с причиной отказа (по token)"""
+    rejected = [entry for entry in entries if entry["token"] in reasons]
+    logger.error("Отклонено записей из буфера: %s", len(rejected))
+    with open(os.path.join(directory, REJECTED), "a", encoding="utf-8") as file:
+        for entry in rejected:
+            file.write(
+                json.dumps(
+                    {**entry, "error": reasons[entry["token"]]},
+                    cls=DjangoJSONEncoder,
+                    ensure_ascii=False,
+                )
+                + "\n"
+            )
+
+
+def _save_comments(records: list[CashFlow], batch_size: int) -> None:
+    """
+    Длинные комментарии вставленных записей (в CashFlowNote). bulk_create
+    с ignore_conflicts не возвращает id, поэтому они ищутся по ingest_token.
+    """
+    tokens = [
+        record.ingest_token
+        for record in records
+        if needs_note(record.comment)
+    ]
+    if not tokens:
+        return
+    ids = dict(
+        CashFlow.objects.filter(ingest_token__in=tokens).values_list(
+            "ingest_token", "id"
+        )
+    )
+    for record in records:
+        record.pk = ids.get(record.ingest_token)
+    CashFlowNote.create_for(records, batch_size=batch_size)
+
+
+def commit(
+    entries: list[dict[str, any]],
+    directory: str,
+    batch_size: int,
+    dead_letter: bool = True,
+) -> int:
+    """
+    Вставляет записи журнала одной транзакцией.
+
+    Записи, зафиксированные раньше (по ingest_token), и повторы по
+    внешнему идентификатору пропускаются. Ссылки на справочники
+    проверяются одним запросом на справочник, архивные месяцы и бюджеты с
+    запретом — повторно (budgets.check_batch): не прошедшая проверку запись
+    откладывается в rejected.jsonl, а не срывает пачку. Сигналы при
+    массовой вставке не отправляются, поэтому бюджеты, кэши и подписчики
+    SSE обновляются явно, как при импорте.
+
+    Args:
+        dead_letter: Записывать отклоненные записи в rejected.jsonl (при
+            фиксации чужого журнала это сделает процесс-владелец)
+
+    Returns:
+        Число созданных записей
+    """
+    records: dict[uuid.UUID, CashFlow] = {}
+    for entry in entries:
+        record = decode(entry["record"])
+        record.ingest_token = uuid.UUID(entry["token"])
+        records[record.ingest_token] = record
+
+    with transaction.atomic():
+        # Бюджеты блокируются до поиска зафиксированных записей: если те же
+        # записи фиксирует другой процесс, он завершится раньше, и его
+        # записи не будут учтены в счетчиках второй раз
+        limits = budgets.lock_limits(list(records.values()))
+        committed = set(
+            CashFlow.objects.filter(ingest_token__in=list(records)).values_list(
+                "ingest_token", flat=True
+            )
+        )
+        fresh = [record for token, record in records.items() if token not in committed]
+        existing = {
+            attname: _existing(model, {getattr(r, attname) for r in fresh})
+            for attname, model in REFERENCES.items()
+        }
+        valid, rejected = [], {}
+        for record in fresh:
+            if all(getattr(record, name) in ids for name, ids in existing.items()):
+                valid.append(record)
+            else:
+                rejected[str(record.ingest_token)] = "справочник записи удален"
+        rejected.update(budgets.check_batch(valid, limits))
+        valid = [record for record in valid if str(record.ingest_token) not in rejected]
+        for record in valid:
+            if record.source_reference:
+                record.fingerprint = fingerprint_of(record)
+            # bulk_create не отправляет pre_save — копейки заполняются здесь
+            record.amount_minor = to_minor_units(record.amount)
+        CashFlow.objects.bulk_create(
+            valid, batch_size=batch_size, ignore_conflicts=True
+        )
+        _save_comments(valid, batch_size)
+
+        owners = Counter(
+            dict(
+                CashFlow.objects.filter(
+                    ingest_token__in=[record.ingest_token for record in valid]
+                )
+                .order_by()
+                .values_list("owner_id")
+                .annotate(count=Count("id"))
+            )
+        )
+        if owners:
+            budgets.recalculate(
+                Budget.objects.filter(
+                    category_id__in={record.category_id for record in valid},
+                    month__in={budgets.month_start(record.date) for record in valid},
+                )
+            )
+            bump_version(CASHFLOWS)
+            for owner_id, created in owners.items():
+                events.publish(
+                    {"type": "cashflow.bulk", "owner": owner_id, "count": created}
+                )
+    if rejected and dead_letter:
+        _reject(directory, entries, rejected)
+    return sum(owners.values())
+
+
+class IngestBuffer:
+    """
+    Буфер записи процесса: журнал на диске, очередь в памяти и фоновый
+    поток, фиксирующий записи пачками.
+    """
+
+    def __init__(self, directory: str, batch_size: int, max_delay: float) -> None:
+        self.directory = directory
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # Сбросы выполняются по одному: фоновым потоком или запросом на чтение
+        self._flush_lock = threading.Lock()
+        self._segment: Segment | None = None
+        self._entries: list[dict[str, any]] = []
+        # Журналы, ожидающие фиксации (после неудачной попытки — повтор)
+        self._sealed: list[tuple[Segment, list[dict[str, any]]]] = []
+        # Время (monotonic) самой старой незафиксированной записи
+        self._since: float | None = None
+        # Число незафиксированных записей по владельцам
+        self._pending: Counter = Counter()
+        self._numbers = count(1)
+        self._thread: threading.Thread | None = None
+
+    def append(self, record: CashFlow) -> uuid.UUID:
+        """
+        Записывает проверенную запись в журнал.
+
+        Returns:
+            ingest_token записи: после фиксации он есть в ответах API
+        """
+        token = uuid.uuid4()
+        entry = {"token": str(token), "record": encode(record)}
+        line = json.dumps(entry, cls=DjangoJSONEncoder).encode() + b"\n"
+        with self._lock:
+            self._start()
+            if self._segment is None:
+                self._segment = self._open()
+            self._segment.append(line)
+            self._entries.append(entry)
+            self._pending[record.owner_id] += 1
+            if self._since is None:
+                self._since = time.monotonic()
+            if len(self._entries) >= self.batch_size:
+                self._wakeup.notify()
+        return token
+
+    def _open(self) -> Segment:
+        """
+        Новый журнал процесса. Файл блокируется под временным именем и
+        только потом переименовывается в .wal, чтобы recover другого
+        процесса не принял его за брошенный.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{socket.gethostname()}-{os.getpid()}-{next(self._numbers)}"
+        path = os.path.join(self.directory, name + SUFFIX)
+        segment = Segment.acquire(path + ".tmp")
+        os.replace(segment.path, path)
+        segment.path = path
+        return segment
+
+    def flush(self) -> int:
+        """Фиксирует все записи буфера. Возвращает число созданных записей"""
+        with self._flush_lock:
+            with self._lock:
+                if self._segment is not None:
+                    self._sealed.append((self._segment, self._entries))
+                self._segment, self._entries, self._since = None, [], None
+                sealed, self._sealed = self._sealed, []
+            created = 0
+            for position, (segment, entries) in enumerate(sealed):
+                try:
+                    created += commit(entries, self.directory, self.batch_size)
+                except Exception:
+                    # Журнал остается на диске и в очереди до следующей попытки
+                    with self._lock:
+                        self._sealed[:0] = sealed[position:]
+                    raise
+                segment.remove()
+                with self._lock:
+                    self._pending -= Counter(
+                        entry["record"]["owner_id"] for entry in entries
+                    )
+            return created
+
+    def sync_owner(self, owner_id: int) -> None:
+        """Фиксирует буфер, если в нем есть записи владельца"""
+        with self._lock:
+            if not self._pending[owner_id]:
+                return
+        self.flush()
+
+    def recover(self) -> int:
+        """
+        Фиксирует журналы завершившихся процессов (их блокировка свободна).
+        Возвращает число созданных записей.
+        """
+        created = 0
+        for path in sorted(glob.glob(os.path.join(self.directory, "*" + SUFFIX))):
+            segment = Segment.acquire(path)
+            if segment is None:
+                continue
+            entries = segment.entries()
+            if entries:
+                created += commit(entries, self.directory, self.batch_size)
+            segment.remove()
+            logger.info("Загружен журнал %s: записей %s", path, len(entries))
+        return created
+
+    def _start(self) -> None:
+        """Запускает фоновый поток при первой записи (вызывается под _lock)"""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="cashflow-ingest", daemon=True
+            )
+            self._thread.start()
+            # При штатной остановке воркера буфер фиксируется; при сбое
+            # записи остаются в журнале
+            atexit.register(self.flush)
+
+    def _due(self) -> bool:
+        return bool(
+            self._sealed
+            or len(self._entries) >= self.batch_size
+            or (
+                self._since is not None
+                and time.monotonic() - self._since >= self.max_delay
+            )
+        )
+
+    def _run(self) -> None:
+        try:
+            self.recover()
+        except Exception:
+            logger.exception("Не удалось загрузить журналы буфера записи")
+        while True:
+            with self._lock:
+                while not self._due():
+                    timeout = None
+                    if self._since is not None:
+                        timeout = self._since + self.max_delay - time.monotonic()
+                    self._wakeup.wait(timeout)
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception(
+                    "Не удалось зафиксировать буфер записи, повтор через %s с",
+                    RETRY_DELAY,
+                )
+                time.sleep(RETRY_DELAY)
+
+
+_buffer: IngestBuffer | None = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer() -> IngestBuffer:
+    """Буфер записи процесса"""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = IngestBuffer(
+                settings.CASHFLOW_INGEST_DIR,
+                settings.CASHFLOW_INGEST_BATCH_SIZE,
+                settings.CASHFLOW_INGEST_MAX_DELAY,
+            )
+        return _buffer
+
+
+def sync_owner(owner_id: int) -> None:
+    """
+    Фиксирует записи пользователя перед чтением: из буфера этого процесса
+    и из журналов других процессов в CASHFLOW_INGEST_DIR.
+    """
+    if _buffer is not None:
+        _buffer.sync_owner(owner_id)
+    entries = _foreign_entries(settings.CASHFLOW_INGEST_DIR, owner_id)
+    if entries:
+        commit(
+            entries,
+            settings.CASHFLOW_INGEST_DIR,
+            settings.CASHFLOW_INGEST_BATCH_SIZE,
+            dead_letter=False,
+        )
@@ -0,0 +1,185 @@
+"""
+Объединение категорий и подкатегорий.
+
+Записи ДДС и шаблоны регулярных операций ссылаются на справочники с
+on_delete=PROTECT, поэтому удалить используемую категорию можно только
+перенеся ссылки на другую. Перенос выполняется одним UPDATE ... WHERE на
+каждую таблицу в одной транзакции, без загрузки записей в Python; после
+него источник удаляется. Бюджеты источника переносятся на цель, а при
+совпадении месяца их лимиты складываются. Ссылки в итогах и файлах архива
+(см. archive) заменяются тем же образом.
+"""
+
+from django.db import transaction
+from django.db.models import F, OuterRef, QuerySet, Subquery
+
+from ..models import (Budget, CashFlow, Category, RecurringOperation,
+                      SubCategory)
+from . import archive, budgets, events
+from .versioning import CASHFLOWS, bump_version
+
+
+def _check_operation_type(source_type_id: int, target_type_id: int) -> None:
+    if source_type_id != target_type_id:
+        raise ValueError("Объединять можно только справочники одного типа операции")
+
+
+def _check_owner(source_owner_id: int, target_owner_id: int) -> None:
+    if source_owner_id != target_owner_id:
+        raise ValueError("Объединять можно только справочники одного владельца")
+
+
+def category_merge_preview(source: Category) -> dict[str, int]:
+    """Число объектов, которые будут перенесены при объединении категорий"""
+    return {
+        "cashflows": CashFlow.objects.filter(category=source).count(),
+        "recurring": RecurringOperation.objects.filter(category=source).count(),
+        "subcategories": SubCategory.objects.filter(category=source).count(),
+        "budgets": Budget.objects.filter(category=source).count(),
+    }
+
+
+def subcategory_merge_preview(source: SubCategory) -> dict[str, int]:
+    """Число объектов, которые будут перенесены при объединении подкатегорий"""
+    return {
+        "cashflows": CashFlow.objects.filter(subcategory=source).count(),
+        "recurring": RecurringOperation.objects.filter(subcategory=source).count(),
+        "budgets": Budget.objects.filter(subcategory=source).count(),
+    }
+
+
+def _move_budgets(source: QuerySet, target: QuerySet, **values: any) -> int:
+    """
+    Переносит бюджеты источника на цель.
+
+    Для месяцев, где у цели уже есть бюджет, лимит источника прибавляется
+    к нему (коррелированный подзапрос), а бюджет источника удаляется.
+    """
+    same_month = source.filter(month=OuterRef("month")).values("limit")[:1]
+    target.filter(month__in=source.values("month")).update(
+        limit=F("limit") + Subquery(same_month)
+    )
+    merged, _ = source.filter(month__in=target.values("month")).delete()
+    return merged + source.update(**values)
+
+
+def _finish(cashflows: int, category_ids: set[int], owner_id: int) -> None:
+    """Пересчитывает затронутые бюджеты и инвалидирует кэши"""
+    budgets.recalculate(Budget.objects.filter(category_id__in=category_ids))
+    if cashflows:
+        bump_version(CASHFLOWS)
+        events.publish({"type": "cashflow.bulk", "owner": owner_id, "count": cashflows})
+
+
+def merge_categories(source: Category, target: Category) -> dict[str, int]:
+    """
+    Переносит записи ДДС, шаблоны, подкатегории и бюджеты категории source
+    в категорию target и удаляет source.
+
+    Raises:
+        ValueError: Если категории совпадают, относятся к разным типам операций
+            или разным владельцам
+
+    Returns:
+        Число перенесенных объектов по видам
+    """
+    if source.pk == target.pk:
+        raise ValueError("Нельзя объединить категорию саму с собой")
+    _check_owner(source.owner_id, target.owner_id)
+    _check_operation_type(source.operation_type_id, target.operation_type_id)
+
+    with transaction.atomic():
+        # Блокируем обе категории от параллельного объединения или удаления
+        list(Category.objects.select_for_update().filter(pk__in=[source.pk, target.pk]))
+        result = {
+            "cashflows": CashFlow.objects.filter(category=source).update(
+                category=target
+            ),
+            "recurring": RecurringOperation.objects.filter(category=source).update(
+                category=target
+            ),
+            "subcategories": SubCategory.objects.filter(category=source).update(
+                category=target
+            ),
+            # Бюджеты подкатегорий уникальны по подкатегории и переносятся как есть
+            "budgets": Budget.objects.filter(
+                category=source, subcategory__isnull=False
+            ).update(category=target)
+            + _move_budgets(
+                Budget.objects.filter(category=source, subcategory__isnull=True),
+                Budget.objects.filter(category=target, subcategory__isnull=True),
+                category=target,
+            ),
+        }
+        archive.remap("category_id", source.pk, {"category_id": target.pk})
+        source.delete()
+        _finish(result["cashflows"], {target.pk}, target.owner_id)
+    return result
+
+
+def merge_subcategories(source: SubCategory, target: SubCategory) -> dict[str, int]:
+    """
+    Переносит записи ДДС, шаблоны и бюджеты подкатегории source в подкатегорию
+    target (вместе с ее категорией) и удаляет source.
+
+    Raises:
+        ValueError: Если подкатегории совпадают или относятся к разным типам
+            операций или разным владельцам
+
+    Returns:
+        Число перенесенных объектов по видам
+    """
+    if source.pk == target.pk:
+        raise ValueError("Нельзя объединить подкатегорию саму с собой")
+    _check_owner(source.owner_id, target.owner_id)
+    source_category, target_category = source.category, target.category
+    _check_operation_type(
+        source_category.operation_type_id, target_category.operation_type_id
+    )
+
+    with transaction.atomic():
+        list(
+            SubCategory.objects.select_for_update().filter(
+                pk__in=[source.pk, target.pk]
+            )
+        )
+        moved = {"subcategory": target, "category": target_category}
+        result = {
+            "cashflows": CashFlow.objects.filter(subcategory=source).update(**moved),
+            "recurring": RecurringOperation.objects.filter(subcategory=source).update(
+                **moved
+            ),
+            "budgets": _move_budgets(
+                Budget.objects.filter(subcategory=source),
+                Budget.objects.filter(subcategory=target),
+                **moved,
+            ),
+        }
+        archive.remap(
+            "subcategory_id",
+            source.pk,
+            {"subcategory_id": target.pk, "category_id": target_category.pk},
+        )
+        source.delete()
+        _finish(
+            result["cashflows"],
+            {source_category.pk, target_category.pk},
+            target.owner_id,
+        )
+    return result
+
+
+def merge_preview(source: Category | SubCategory) -> dict[str, int]:
+    """Предпросмотр объединения категорий или подкатегорий"""
+    if isinstance(source, Category):
+        return category_merge_preview(source)
+    return subcategory_merge_preview(source)
+
+
+def merge(
+    source: Category | SubCategory, target: Category | SubCategory
+) -> dict[str, int]:
+    """Объединение категорий или подкатегорий"""
+    if isinstance(source, Category):
+        return merge_categories(source, target)
+    return merge_subcategories(source, target)
@@ -0,0 +1,372 @@
+"""
+Сверка банковской выписки с записями ДДС.
+
+Обе стороны переводятся в массивы NumPy (дата в днях, сумма в копейках).
+Записи ДДС сортируются по ключу (корзина суммы, дата): ширина корзины
+2 * tolerance + 1 копеек, поэтому кандидаты строки выписки лежат в ее
+корзине или соседних (hash join), а внутри корзины окно дат находится
+двоичным поиском по отсортированным ключам (sort-merge join). Кандидаты
+всех строк находятся векторно, без вложенного цикла по строкам. Затем
+кандидаты ранжируются по сходству назначения платежа с комментарием
+записи, близости даты и суммы, и строки жадно сопоставляются один к одному.
+"""
+
+import csv
+import io
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from difflib import SequenceMatcher
+
+import numpy as np
+from django.db.models import BigIntegerField, F, QuerySet
+from django.db.models.functions import Cast, Round
+
+from ..models import CashFlow, full_comment
+from .currency import normalize_currency
+
+CENT = Decimal("0.01")
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y", "%d/%m/%Y")
+# Разница в сходстве комментариев, при которой кандидаты считаются равноценными
+AMBIGUITY_MARGIN = 0.1
+# Размер порции id при загрузке комментариев кандидатов
+COMMENT_CHUNK = 10_000
+
+
+@dataclass
+class StatementLine:
+    """Строка банковской выписки"""
+
+    line: int
+    date: date
+    amount: Decimal
+    description: str
+
+
+def _parse_date(value: str) -> date:
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Некорректная дата: {value}")
+
+
+def _parse_amount(value: str) -> Decimal:
+    cleaned = value.strip().replace("\xa0", "").replace(" ", "").replace(",", ".")
+    try:
+        return Decimal(cleaned)
+    except InvalidOperation:
+        raise ValueError(f"Некорректная сумма: {value}")
+
+
+def load_statement(
+    content: str,
+    date_column: str = "date",
+    amount_column: str = "amount",
+    description_column: str = "description",
+    delimiter: str | None = None,
+) -> list[StatementLine]:
+    """
+    Разбирает выписку в формате CSV с заголовком.
+
+    Дата — YYYY-MM-DD, DD.MM.YYYY или DD/MM/YYYY; в сумме допускаются
+    пробелы и десятичная запятая, знак «-» обозначает списание. Если
+    разделитель не указан, он определяется по первой строке.
+
+    Raises:
+        ValueError: При отсутствии колонок или некорректных значениях
+    """
+    if delimiter is None:
+        header = content.split("\n", 1)[0]
+        delimiter = max(";,\t", key=header.count)
+    reader = csv.DictReader(io.StringIO(content), delimiter=delimiter)
+    missing = {date_column, amount_column} - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"В выписке нет колонок: {', '.join(sorted(missing))}")
+
+    lines = []
+    for number, row in enumerate(reader, start=2):
+        if not any(row.values()):
+            continue
+        try:
+            lines.append(
+                StatementLine(
+                    line=number,
+                    date=_parse_date(row[date_column]),
+                    amount=_parse_amount(row[amount_column]),
+                    description=(row.get(description_column) or "").strip(),
+                )
+            )
+        except ValueError as e:
+            raise ValueError(f"Строка {number}: {e}")
+    return lines
+
+
+@dataclass
+class _Ledger:
+    """Записи ДДС в диапазоне дат выписки"""
+
+    ids: np.ndarray
+    days: np.ndarray
+    cents: np.ndarray
+    income: np.ndarray
+
+    @classmethod
+    def load(cls, queryset: QuerySet, chunk_size: int = 100_000) -> "_Ledger":
+        rows = queryset.order_by().values_list(
+            "id",
+            "date",
+            Cast(Round(F("amount") * 100), BigIntegerField()),
+            "operation_type__is_income",
+        )
+        parts: list[list] = [[], [], [], []]
+        chunk = []
+        for row in rows.iterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                cls._append(parts, chunk)
+                chunk = []
+        if chunk:
+            cls._append(parts, chunk)
+        if not parts[0]:
+            empty = np.empty(0, dtype=np.int64)
+            return cls(empty, empty, empty, empty.astype(bool))
+        return cls(*(np.concatenate(part) for part in parts))
+
+    @staticmethod
+    def _append(parts: list[list], chunk: list[tuple]) -> None:
+        ids, days, cents, income = zip(*chunk)
+        parts[0].append(np.array(ids, dtype=np.int64))
+        parts[1].append(np.array(days, dtype="datetime64[D]").astype(np.int64))
+        parts[2].append(np.array(cents, dtype=np.int64))
+        parts[3].append(np.array(income, dtype=bool))
+
+
+def candidate_pairs(
+    statement_days: np.ndarray,
+    statement_cents: np.ndarray,
+    ledger_days: np.ndarray,
+    ledger_cents: np.ndarray,
+    window: int,
+    tolerance: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Все пары (строка выписки, запись ДДС) с |Δдата| <= window дней и
+    |Δсумма| <= tolerance копеек.
+
+    Суммы сравниваются по модулю. Возвращает индексы строк выписки и
+    записей ДДС в исходных массивах.
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if not len(statement_days) or not len(ledger_days):
+        return empty, empty
+
+    origin = min(statement_days.min(), ledger_days.min()) - window
+    span = max(statement_days.max(), ledger_days.max()) + window - origin + 1
+    width = 2 * tolerance + 1
+    ledger_keys = (ledger_cents // width) * span + (ledger_days - origin)
+    order = np.argsort(ledger_keys)
+    sorted_keys = ledger_keys[order]
+
+    statement_bucket = statement_cents // width
+    statement_offset = statement_days - origin
+    lines, positions = [], []
+    for shift in (-1, 0, 1) if tolerance else (0,):
+        base = (statement_bucket + shift) * span + statement_offset
+        low = np.searchsorted(sorted_keys, base - window, side="left")
+        high = np.searchsorted(sorted_keys, base + window, side="right")
+        counts = high - low
+        total = int(counts.sum())
+        if not total:
+            continue
+        line_index = np.repeat(np.arange(len(statement_days)), counts)
+        starts = np.repeat(low - (np.cumsum(counts) - counts), counts)
+        lines.append(line_index)
+        positions.append(order[np.arange(total) + starts])
+    if not lines:
+        return empty, empty
+
+    line_index = np.concatenate(lines)
+    ledger_index = np.concatenate(positions)
+    within = np.abs(statement_cents[line_index] - ledger_cents[ledger_index])
+    keep = within <= tolerance
+    return line_index[keep], ledger_index[keep]
+
+
+def _similarity(first: str, second: str) -> float:
+    """Сходство назначения платежа и комментария (0..1)"""
+    if not first or not second:
+        return 0.0
+    return SequenceMatcher(None, first.lower(), second.lower()).ratio()
+
+
+def _load_comments(ids: np.ndarray) -> dict[int, str]:
+    comments = {}
+    unique = np.unique(ids).tolist()
+    for start in range(0, len(unique), COMMENT_CHUNK):
+        comments.update(
+            CashFlow.objects.filter(pk__in=unique[start : start + COMMENT_CHUNK])
+            .annotate(text=full_comment())
+            .values_list("id", "text")
+        )
+    return comments
+
+
+def reconcile(
+    lines: list[StatementLine],
+    window: int = 3,
+    tolerance: Decimal = Decimal("0"),
+    currency: str | None = None,
+    queryset: QuerySet | None = None,
+) -> dict[str, any]:
+    """
+    Сопоставляет строки выписки с записями ДДС.
+
+    Args:
+        lines: Строки выписки
+        window: Допустимое расхождение дат, дней
+        tolerance: Допустимое расхождение сумм
+        currency: Валюта выписки (по умолчанию базовая); сверяются только
+            записи ДДС в этой валюте
+        queryset: Выборка записей ДДС (по умолчанию все)
+
+    Если в выписке есть отрицательные суммы, знак учитывается: списания
+    сопоставляются только с расходными операциями, поступления — с
+    операциями-поступлениями.
+
+    Returns:
+        Словарь со сводкой, сопоставленными, неоднозначными (несколько
+        равноценных кандидатов) и несопоставленными строками выписки, а
+        также id записей ДДС периода, не найденных в выписке
+    """
+    if window < 0 or tolerance < 0:
+        raise ValueError("Окно дат и допуск по сумме не могут быть отрицательными")
+    currency = normalize_currency(currency)
+    tolerance = Decimal(tolerance)
+    result = {
+        "currency": currency,
+        "matched": [],
+        "ambiguous": [],
+        "unmatched": [],
+        "unmatched_ledger": [],
+    }
+    if not lines:
+        result["summary"] = _summary(result, 0)
+        return result
+
+    start = min(line.date for line in lines) - timedelta(days=window)
+    end = max(line.date for line in lines) + timedelta(days=window)
+    queryset = CashFlow.objects.all() if queryset is None else queryset
+    ledger = _Ledger.load(
+        queryset.filter(currency=currency, date__gte=start, date__lte=end)
+    )
+
+    statement_days = np.array(
+        [line.date for line in lines], dtype="datetime64[D]"
+    ).astype(np.int64)
+    signed_cents = np.array(
+        [int((line.amount * 100).to_integral_value()) for line in lines],
+        dtype=np.int64,
+    )
+    tolerance_cents = int((tolerance * 100).to_integral_value())
+    line_index, ledger_index = candidate_pairs(
+        statement_days,
+        np.abs(signed_cents),
+        ledger.days,
+        ledger.cents,
+        window,
+        tolerance_cents,
+    )
+    if (signed_cents < 0).any():
+        same_direction = (signed_cents[line_index] > 0) == ledger.income[ledger_index]
+        line_index, ledger_index = (
+            line_index[same_direction],
+            ledger_index[same_direction],
+        )
+
+    date_diff = np.abs(statement_days[line_index] - ledger.days[ledger_index])
+    amount_diff = np.abs(np.abs(signed_cents[line_index]) - ledger.cents[ledger_index])
+    comments = _load_comments(ledger.ids[ledger_index])
+    similarity = np.array(
+        [
+            _similarity(lines[line].description, comments.get(int(ledger.ids[row]), ""))
+            for line, row in zip(line_index.tolist(), ledger_index.tolist())
+        ],
+        dtype=np.float64,
+    )
+
+    # Кандидаты каждой строки от лучшего к худшему
+    order = np.lexsort((amount_diff, date_diff, -similarity, line_index))
+    candidates: dict[int, list[dict[str, any]]] = {}
+    for position in order.tolist():
+        candidates.setdefault(int(line_index[position]), []).append(
+            {
+                "cashflow_id": int(ledger.ids[ledger_index[position]]),
+                "similarity": round(float(similarity[position]), 3),
+                "date_diff": int(date_diff[position]),
+                "amount_diff": str(
+                    (Decimal(int(amount_diff[position])) / 100).quantize(CENT)
+                ),
+            }
+        )
+
+    # Сначала строки с самыми надежными кандидатами
+    def strength(index: int) -> tuple:
+        best = candidates[index][0]
+        return -best["similarity"], best["date_diff"], Decimal(best["amount_diff"])
+
+    taken: set[int] = set()
+    for index in sorted(candidates, key=strength):
+        available = [c for c in candidates[index] if c["cashflow_id"] not in taken]
+        item = _line_item(lines[index])
+        if not available:
+            result["unmatched"].append(item)
+        elif len(available) > 1 and _is_tie(available[0], available[1]):
+            result["ambiguous"].append({**item, "candidates": available})
+        else:
+            taken.add(available[0]["cashflow_id"])
+            result["matched"].append({**item, **available[0]})
+    for index, line in enumerate(lines):
+        if index not in candidates:
+            result["unmatched"].append(_line_item(line))
+
+    for key in ("matched", "ambiguous", "unmatched"):
+        result[key].sort(key=lambda item: item["line"])
+    reserved = taken | {
+        c["cashflow_id"] for item in result["ambiguous"] for c in item["candidates"]
+    }
+    ledger_start = np.datetime64(start + timedelta(days=window), "D").astype(np.int64)
+    ledger_end = np.datetime64(end - timedelta(days=window), "D").astype(np.int64)
+    in_period = (ledger.days >= ledger_start) & (ledger.days <= ledger_end)
+    result["unmatched_ledger"] = sorted(set(ledger.ids[in_period].tolist()) - reserved)
+    result["summary"] = _summary(result, len(lines))
+    return result
+
+
+def _line_item(line: StatementLine) -> dict[str, any]:
+    return {
+        "line": line.line,
+        "date": line.date,
+        "amount": str(line.amount),
+        "description": line.description,
+    }
+
+
+def _is_tie(first: dict[str, any], second: dict[str, any]) -> bool:
+    """Кандидаты равноценны: одинаковые расхождения и близкие комментарии"""
+    return (
+        first["date_diff"] == second["date_diff"]
+        and first["amount_diff"] == second["amount_diff"]
+        and first["similarity"] - second["similarity"] < AMBIGUITY_MARGIN
+    )
+
+
+def _summary(result: dict[str, any], total: int) -> dict[str, int]:
+    return {
+        "lines": total,
+        "matched": len(result["matched"]),
+        "ambiguous": len(result["ambiguous"]),
+        "unmatched": len(result["unmatched"]),
+        "unmatched_ledger": len(result["unmatched_ledger"]),
+    }
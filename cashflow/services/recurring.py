@@ -0,0 +1,166 @@
+from collections import Counter
+from datetime import date, timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from ..models import (Budget, CashFlow, CashFlowNote, RecurringOperation,
+                      needs_note, to_minor_units)
+from . import budgets, events
+from .reports import shift_months
+from .validators import CashFlowValidator
+from .versioning import CASHFLOWS, bump_version
+
+
+def occurrence_date(template: RecurringOperation, index: int) -> date:
+    """Дата index-й (с нуля) операции по шаблону, считая от даты начала"""
+    step = index * template.interval
+    if template.frequency == RecurringOperation.DAILY:
+        return template.start_date + timedelta(days=step)
+    if template.frequency == RecurringOperation.WEEKLY:
+        return template.start_date + timedelta(weeks=step)
+    if template.frequency == RecurringOperation.MONTHLY:
+        return shift_months(template.start_date, step)
+    return shift_months(template.start_date, step * 12)
+
+
+def occurrences_between(
+    template: RecurringOperation, start: date, end: date
+) -> list[date]:
+    """Даты операций по шаблону в диапазоне [start, end] с учетом даты окончания"""
+    if template.end_date:
+        end = min(end, template.end_date)
+    dates = []
+    index = 0
+    while (current := occurrence_date(template, index)) <= end:
+        if current >= start:
+            dates.append(current)
+        index += 1
+    return dates
+
+
+def next_occurrence_after(template: RecurringOperation, day: date) -> date:
+    """Первая дата операции по шаблону строго после day"""
+    index = 0
+    while (current := occurrence_date(template, index)) <= day:
+        index += 1
+    return current
+
+
+def validate_template(template: RecurringOperation) -> None:
+    """
+    Проверяет шаблон правилами CashFlowValidator.
+
+    Raises:
+        ValidationError: Если операции по шаблону не прошли бы валидацию
+    """
+    CashFlowValidator.validate_amount(template.amount)
+    CashFlowValidator.validate_category_relations(
+        template.category, template.subcategory, template.operation_type
+    )
+
+
+def _save_comments(occurrences: list[CashFlow], batch_size: int) -> None:
+    """
+    Длинные комментарии созданных операций (в CashFlowNote). bulk_create с
+    ignore_conflicts не возвращает id, поэтому они ищутся по (шаблон, дата).
+    """
+    templates = {
+        item.recurring_id
+        for item in occurrences
+        if needs_note(item.comment)
+    }
+    if not templates:
+        return
+    ids = {
+        (recurring_id, day): pk
+        for recurring_id, day, pk in CashFlow.objects.filter(
+            recurring_id__in=templates,
+            date__in={item.date for item in occurrences},
+        ).values_list("recurring_id", "date", "id")
+    }
+    for item in occurrences:
+        item.pk = ids.get((item.recurring_id, item.date))
+    CashFlowNote.create_for(occurrences, batch_size=batch_size)
+
+
+def materialize(today: date, batch_size: int = 1000) -> dict[str, any]:
+    """
+    Создает все наступившие операции по всем активным шаблонам.
+
+    Шаблоны блокируются через SELECT ... FOR UPDATE SKIP LOCKED, поэтому
+    несколько параллельных запусков (cron на разных хостах) делят шаблоны
+    между собой, а не ждут друг друга. Все операции создаются одним
+    bulk_create внутри той же транзакции; уникальный индекс (шаблон, дата)
+    с ignore_conflicts делает повторный запуск безопасным.
+
+    Returns:
+        Словарь с числом созданных операций, обработанных шаблонов и
+        ошибками валидации по шаблонам
+    """
+    occurrences = []
+    processed = []
+    errors = {}
+    with transaction.atomic():
+        templates = (
+            RecurringOperation.objects.select_for_update(skip_locked=True, of=("self",))
+            .select_related("operation_type", "category", "subcategory")
+            .filter(is_active=True, next_date__lte=today)
+            .order_by("pk")
+        )
+        for template in templates:
+            try:
+                validate_template(template)
+            except ValidationError as e:
+                errors[str(template)] = "; ".join(e.messages)
+                continue
+
+            for day in occurrences_between(template, template.next_date, today):
+                occurrences.append(
+                    CashFlow(
+                        owner_id=template.owner_id,
+                        date=day,
+                        status_id=template.status_id,
+                        operation_type_id=template.operation_type_id,
+                        category_id=template.category_id,
+                        subcategory_id=template.subcategory_id,
+                        amount=template.amount,
+                        amount_minor=to_minor_units(template.amount),
+                        currency=template.currency,
+                        comment=template.comment,
+                        recurring=template,
+                    )
+                )
+            template.next_date = next_occurrence_after(template, today)
+            if template.end_date and template.next_date > template.end_date:
+                template.is_active = False
+            processed.append(template)
+
+        CashFlow.objects.bulk_create(
+            occurrences, batch_size=batch_size, ignore_conflicts=True
+        )
+        RecurringOperation.objects.bulk_update(
+            processed, ["next_date", "is_active"], batch_size=batch_size
+        )
+        _save_comments(occurrences, batch_size)
+        if occurrences:
+            # bulk_create не отправляет сигналы — пересчитываем счетчики
+            # бюджетов и инвалидируем кэши явно
+            budgets.recalculate(
+                Budget.objects.filter(
+                    category_id__in={item.category_id for item in occurrences},
+                    month__in={budgets.month_start(item.date) for item in occurrences},
+                )
+            )
+            bump_version(CASHFLOWS)
+            owners = Counter(item.owner_id for item in occurrences)
+            for owner_id, count in owners.items():
+                events.publish(
+                    {"type": "cashflow.bulk", "owner": owner_id, "count": count}
+                )
+
+    return {
+        "created": len(occurrences),
+        "templates": len(processed),
+        "errors": errors,
+    }
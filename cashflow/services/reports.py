@@ -0,0 +1,431 @@
+import calendar
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, Q, QuerySet
+from django.db.models.functions import Coalesce, TruncMonth
+
+from ..models import Category, OperationType, Status, SubCategory
+from .currency import amount_sum, ensure_rates, normalize_currency
+
+PIVOT_ROWS = {"category": Category, "subcategory": SubCategory}
+CENT = Decimal("0.01")
+
+
+def parse_date(value: str | None) -> date | None:
+    """
+    Разбор даты в формате YYYY-MM-DD.
+
+    Raises:
+        ValueError: Если дата передана в некорректном формате
+    """
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError("Некорректный формат даты. Используйте YYYY-MM-DD")
+
+
+def parse_month(value: str | None) -> date | None:
+    """
+    Разбор месяца в формате YYYY-MM (результат — первое число месяца).
+
+    Raises:
+        ValueError: Если месяц передан в некорректном формате
+    """
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        raise ValueError("Некорректный формат месяца. Используйте YYYY-MM")
+
+
+def filter_cashflows(queryset: QuerySet, params) -> QuerySet:
+    """
+    Применяет к выборке ДДС общие для отчетов фильтры.
+
+    Поддерживаются start_date, end_date, status и operation_type.
+
+    Raises:
+        ValueError: При некорректной дате или идентификаторе
+    """
+    start_date = parse_date(params.get("start_date"))
+    end_date = parse_date(params.get("end_date"))
+    if start_date:
+        queryset = queryset.filter(date__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(date__lte=end_date)
+    for name in ("status", "operation_type"):
+        if params.get(name):
+            queryset = queryset.filter(**{f"{name}_id": int(params[name])})
+    return queryset
+
+
+def month_range(start: date, end: date) -> list[date]:
+    """Список первых чисел месяцев от start до end включительно"""
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append(date(year, month, 1))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+@dataclass
+class PivotTable:
+    """
+    Плотная матрица «строки × месяцы» с итогами.
+
+    values[i][j] — сумма по строке rows[i] за месяц columns[j]. Для строк по
+    подкатегориям subtotals содержит итоги по каждой категории. Суммы строк
+    положительны, а итоги по месяцам и общий итог — сальдо: поступления
+    (строки с is_income) минус списания.
+    """
+
+    row_type: str
+    currency: str = ""
+    rows: list[dict[str, any]] = field(default_factory=list)
+    columns: list[date] = field(default_factory=list)
+    values: list[list[Decimal]] = field(default_factory=list)
+    row_totals: list[Decimal] = field(default_factory=list)
+    column_totals: list[Decimal] = field(default_factory=list)
+    grand_total: Decimal = Decimal("0")
+    subtotals: list[dict[str, any]] = field(default_factory=list)
+
+    def as_dict(self) -> dict[str, any]:
+        """Представление для JSON-ответа (суммы — строками, как в сериализаторах)"""
+        return {
+            "row_type": self.row_type,
+            "currency": self.currency,
+            "rows": self.rows,
+            "columns": [month.strftime("%Y-%m") for month in self.columns],
+            "values": [[str(value) for value in row] for row in self.values],
+            "row_totals": [str(value) for value in self.row_totals],
+            "column_totals": [str(value) for value in self.column_totals],
+            "grand_total": str(self.grand_total),
+            "subtotals": [
+                {
+                    **subtotal,
+                    "values": [str(value) for value in subtotal["values"]],
+                    "total": str(subtotal["total"]),
+                }
+                for subtotal in self.subtotals
+            ],
+        }
+
+    def table_rows(self) -> list[dict[str, any]]:
+        """
+        Строки для шаблона: строки матрицы с промежуточными итогами
+        после каждой категории (при разбивке по подкатегориям).
+        """
+        result = []
+        subtotals = {subtotal["id"]: subtotal for subtotal in self.subtotals}
+        for index, row in enumerate(self.rows):
+            result.append(
+                {**row, "values": self.values[index], "total": self.row_totals[index]}
+            )
+            category_id = row.get("category_id")
+            is_last = (
+                index + 1 == len(self.rows)
+                or self.rows[index + 1].get("category_id") != category_id
+            )
+            if category_id in subtotals and is_last:
+                result.append({**subtotals[category_id], "is_subtotal": True})
+        return result
+
+
+def build_pivot(
+    queryset: QuerySet,
+    row_type: str = "category",
+    start_date: date | None = None,
+    end_date: date | None = None,
+    currency: str | None = None,
+    archive=None,
+) -> PivotTable:
+    """
+    Строит сводную таблицу «категории/подкатегории × месяцы».
+
+    Все суммы считаются одним GROUP BY запросом по (строка, месяц) в валюте
+    currency (по умолчанию — базовой) с пересчетом по курсам внутри запроса;
+    имена строк подгружаются вторым запросом только для встречающихся id.
+    Матрица плотная: пустые ячейки заполнены нулями.
+
+    Args:
+        archive: ArchiveFilter с теми же фильтрами — суммы архивных записей
+            периода добавляются к суммам из базы
+    """
+    if row_type not in PIVOT_ROWS:
+        raise ValueError(f"Недопустимая разбивка: {row_type}")
+    currency = normalize_currency(currency)
+    ensure_rates(queryset, currency)
+
+    row_field = f"{row_type}_id"
+    cells = list(
+        queryset.order_by()
+        .annotate(month=TruncMonth("date"))
+        .values_list(row_field, "month")
+        .annotate(total=amount_sum(currency))
+    )
+    if archive is not None:
+        totals = defaultdict(Decimal)
+        for row_id, month, total in cells:
+            totals[row_id, month] += total
+        for key, total in archive.totals([row_field], currency, by_month=True).items():
+            totals[key] += total
+        cells = [(row_id, month, total) for (row_id, month), total in totals.items()]
+    table = PivotTable(row_type=row_type, currency=currency)
+    if not cells:
+        return table
+
+    months = [month for _, month, _ in cells]
+    table.columns = month_range(start_date or min(months), end_date or max(months))
+
+    if row_type == "subcategory":
+        labels = (
+            SubCategory.objects.filter(pk__in={row_id for row_id, _, _ in cells})
+            .order_by("category__name", "name")
+            .values(
+                "id",
+                "name",
+                "category_id",
+                "category__name",
+                "category__operation_type__is_income",
+            )
+        )
+        table.rows = [
+            {
+                "id": label["id"],
+                "name": label["name"],
+                "category_id": label["category_id"],
+                "category_name": label["category__name"],
+                "is_income": label["category__operation_type__is_income"],
+            }
+            for label in labels
+        ]
+    else:
+        table.rows = list(
+            Category.objects.filter(pk__in={row_id for row_id, _, _ in cells})
+            .order_by("name")
+            .values("id", "name", is_income=F("operation_type__is_income"))
+        )
+
+    row_index = {row["id"]: index for index, row in enumerate(table.rows)}
+    column_index = {month: index for index, month in enumerate(table.columns)}
+    zero = Decimal("0")
+    table.values = [[zero] * len(table.columns) for _ in table.rows]
+    for row_id, month, total in cells:
+        if month in column_index:
+            table.values[row_index[row_id]][column_index[month]] = total.quantize(CENT)
+
+    table.row_totals = [sum(row, zero) for row in table.values]
+    # Поступления и списания в итогах складываются с разными знаками
+    signs = [1 if row["is_income"] else -1 for row in table.rows]
+    table.column_totals = [
+        sum((sign * value for sign, value in zip(signs, column)), zero)
+        for column in zip(*table.values)
+    ]
+    table.grand_total = sum(
+        (sign * total for sign, total in zip(signs, table.row_totals)), zero
+    )
+
+    if row_type == "subcategory":
+        subtotals: dict[int, dict[str, any]] = {}
+        for index, row in enumerate(table.rows):
+            subtotal = subtotals.setdefault(
+                row["category_id"],
+                {
+                    "id": row["category_id"],
+                    "name": row["category_name"],
+                    "values": [zero] * len(table.columns),
+                    "total": zero,
+                },
+            )
+            subtotal["values"] = [
+                a + b for a, b in zip(subtotal["values"], table.values[index])
+            ]
+            subtotal["total"] += table.row_totals[index]
+        table.subtotals = list(subtotals.values())
+
+    return table
+
+
+COMPARE_DIMENSIONS = {
+    "category": Category,
+    "subcategory": SubCategory,
+    "operation_type": OperationType,
+    "status": Status,
+}
+
+
+def shift_months(value: date, months: int) -> date:
+    """
+    Сдвигает дату на заданное число месяцев.
+
+    День ограничивается длиной целевого месяца, а последний день месяца
+    переходит в последний день целевого месяца (31.03 -> 28.02 -> 31.01).
+    """
+    index = value.year * 12 + value.month - 1 + months
+    year, month = divmod(index, 12)
+    last_day = calendar.monthrange(year, month + 1)[1]
+    if value.day == calendar.monthrange(value.year, value.month)[1]:
+        return date(year, month + 1, last_day)
+    return date(year, month + 1, min(value.day, last_day))
+
+
+def parse_baseline(value: str, start: date, end: date) -> tuple[date, date]:
+    """
+    Период сравнения относительно текущего [start, end].
+
+    Поддерживаются mom (месяц назад), yoy (год назад), prev (предыдущий
+    период той же длины) и явный диапазон YYYY-MM-DD:YYYY-MM-DD.
+
+    Raises:
+        ValueError: При неизвестном обозначении или некорректных датах
+    """
+    if value == "mom":
+        return shift_months(start, -1), shift_months(end, -1)
+    if value == "yoy":
+        return shift_months(start, -12), shift_months(end, -12)
+    if value == "prev":
+        length = end - start + timedelta(days=1)
+        return start - length, end - length
+    if ":" in value:
+        baseline_start, baseline_end = (
+            parse_date(part) for part in value.split(":", 1)
+        )
+        if baseline_start and baseline_end and baseline_start <= baseline_end:
+            return baseline_start, baseline_end
+    raise ValueError(f"Некорректный период сравнения: {value}")
+
+
+def _delta(current: Decimal, baseline: Decimal) -> dict[str, any]:
+    """Абсолютное и относительное (в процентах) изменение"""
+    delta = current - baseline
+    return {
+        "value": str(baseline),
+        "delta": str(delta),
+        "delta_pct": (
+            str((delta * 100 / abs(baseline)).quantize(Decimal("0.01")))
+            if baseline
+            else None
+        ),
+    }
+
+
+def compare_periods(
+    queryset: QuerySet,
+    dimension: str,
+    current: tuple[date, date],
+    baselines: dict[str, tuple[date, date]],
+    currency: str | None = None,
+    archive=None,
+) -> dict[str, any]:
+    """
+    Сравнение текущего периода с одним или несколькими базовыми.
+
+    Все периоды считаются за один проход: выборка ограничивается объединением
+    диапазонов, а сумма по каждому периоду — условным агрегатом
+    SUM(amount) FILTER (WHERE date BETWEEN ...) в одном GROUP BY по измерению.
+    Пересекающиеся периоды учитываются корректно. Суммы пересчитываются
+    в валюту currency (по умолчанию — базовую) по курсу на дату операции.
+    Если передан archive (ArchiveFilter), к суммам периодов добавляются
+    суммы архивных записей. Суммы строк положительны, а итоги периодов —
+    сальдо: поступления минус списания.
+    """
+    if dimension not in COMPARE_DIMENSIONS:
+        raise ValueError(f"Недопустимое измерение: {dimension}")
+    currency = normalize_currency(currency)
+
+    periods = {"current": current, **baselines}
+    aliases = {key: f"period_{index}" for index, key in enumerate(periods)}
+    in_any_period = Q()
+    for start, end in periods.values():
+        in_any_period |= Q(date__range=(start, end))
+
+    queryset = queryset.filter(in_any_period)
+    ensure_rates(queryset, currency)
+
+    zero = Decimal("0")
+    field_name = f"{dimension}_id"
+    # Группы по (измерение, поступление/списание): строки складываются без
+    # знака, а итоги периодов — сальдо поступлений и списаний
+    groups = list(
+        queryset.order_by()
+        .values(field_name, is_income=F("operation_type__is_income"))
+        .annotate(
+            **{
+                aliases[key]: Coalesce(
+                    amount_sum(currency, filter=Q(date__range=period)),
+                    zero,
+                    output_field=DecimalField(max_digits=14, decimal_places=2),
+                )
+                for key, period in periods.items()
+            }
+        )
+    )
+    if archive is not None:
+        income_types = set(
+            OperationType.objects.filter(is_income=True).values_list("id", flat=True)
+        )
+        keys = list(dict.fromkeys([field_name, "operation_type_id"]))
+        for key, (start, end) in periods.items():
+            totals = archive.restrict(start, end).totals(keys, currency)
+            for values, total in totals.items():
+                values = dict(zip(keys, values))
+                groups.append(
+                    {
+                        field_name: values[field_name],
+                        "is_income": values["operation_type_id"] in income_types,
+                        **dict.fromkeys(aliases.values(), zero),
+                        aliases[key]: total,
+                    }
+                )
+
+    rows: dict[int, dict[str, Decimal]] = {}
+    totals = {key: zero for key in periods}
+    for group in groups:
+        row = rows.setdefault(group[field_name], dict.fromkeys(periods, zero))
+        sign = 1 if group["is_income"] else -1
+        for key, alias in aliases.items():
+            value = Decimal(group[alias]).quantize(CENT)
+            row[key] += value
+            totals[key] += sign * value
+    names = dict(
+        COMPARE_DIMENSIONS[dimension]
+        .objects.filter(pk__in=list(rows))
+        .values_list("id", "name")
+    )
+
+    result_rows = [
+        {
+            "id": row_id,
+            "name": names.get(row_id),
+            "current": str(values["current"]),
+            "baselines": {
+                key: _delta(values["current"], values[key]) for key in baselines
+            },
+        }
+        for row_id, values in sorted(
+            rows.items(), key=lambda item: names.get(item[0], "")
+        )
+    ]
+
+    return {
+        "dimension": dimension,
+        "currency": currency,
+        "periods": {
+            key: {"start_date": start, "end_date": end}
+            for key, (start, end) in periods.items()
+        },
+        "rows": result_rows,
+        "totals": {
+            "current": str(totals["current"]),
+            "baselines": {
+                key: _delta(totals["current"], totals[key]) for key in baselines
+            },
+        },
+    }
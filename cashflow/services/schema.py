@@ -0,0 +1,148 @@
+"""
+Заранее сгенерированная схема OpenAPI.
+
+drf_yasg строит схему, обходя все viewset'ы и сериализаторы, что заметно
+дороже обычного запроса к API. Поэтому схема генерируется один раз
+(командой generate_schema или при первом запросе) и сохраняется в
+CASHFLOW_SCHEMA_DIR в файлы openapi-<версия>.json и .yaml. Версия — отпечаток
+исходного кода проекта и версий drf_yasg и DRF: пока код не изменился,
+схема читается из файла и отдается из памяти процесса с ETag, после
+изменения кода строится заново.
+"""
+
+import glob
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from importlib.metadata import version
+
+from django.conf import settings
+
+FORMATS = {"json": "application/json", "yaml": "application/yaml"}
+# Каталоги с кодом, от которого зависит схема
+SOURCE_DIRS = ("cashflow", "config")
+
+
+def api_info():
+    """Описание API для заголовка схемы"""
+    from drf_yasg import openapi
+
+    return openapi.Info(
+        title="Документация по API для ДДС",
+        default_version="v1",
+        description="",
+        terms_of_service="https://www.example.com/",
+        contact=openapi.Contact(email="mail@mail.ru"),
+        license=openapi.License(name="BSD License"),
+    )
+
+
+@lru_cache(maxsize=1)
+def code_version() -> str:
+    """Отпечаток исходников проекта (считается один раз за процесс)"""
+    digest = hashlib.sha256()
+    for package in ("djangorestframework", "drf-yasg"):
+        digest.update(f"{package}=={version(package)}\n".encode())
+    for directory in SOURCE_DIRS:
+        pattern = os.path.join(settings.BASE_DIR, directory, "**", "*.py")
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            digest.update(os.path.relpath(path, settings.BASE_DIR).encode())
+            with open(path, "rb") as source:
+                digest.update(source.read())
+    return digest.hexdigest()[:16]
+
+
+def schema_path(schema_version: str, fmt: str) -> str:
+    """Путь к файлу схемы версии в формате fmt (json или yaml)"""
+    return os.path.join(settings.CASHFLOW_SCHEMA_DIR, f"openapi-{schema_version}.{fmt}")
+
+
+def generate() -> dict[str, bytes]:
+    """Строит схему по всем endpoints и кодирует ее в JSON и YAML"""
+    from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+    from drf_yasg.generators import OpenAPISchemaGenerator
+
+    schema = OpenAPISchemaGenerator(api_info()).get_schema(request=None, public=True)
+    return {
+        "json": OpenAPICodecJson([]).encode(schema),
+        "yaml": OpenAPICodecYaml([]).encode(schema),
+    }
+
+
+def write(force: bool = False) -> tuple[str, bool]:
+    """
+    Сохраняет схему текущей версии кода и удаляет файлы прежних версий.
+
+    Args:
+        force: Перегенерировать, даже если файлы текущей версии уже есть
+
+    Returns:
+        Версия схемы и признак того, что схема была сгенерирована
+    """
+    schema_version = code_version()
+    generated = force or not all(
+        os.path.exists(schema_path(schema_version, fmt)) for fmt in FORMATS
+    )
+    if generated:
+        os.makedirs(settings.CASHFLOW_SCHEMA_DIR, exist_ok=True)
+        for fmt, content in generate().items():
+            path = schema_path(schema_version, fmt)
+            temporary = f"{path}.tmp"
+            with open(temporary, "wb") as file:
+                file.write(content)
+            os.replace(temporary, path)
+    for fmt in FORMATS:
+        pattern = os.path.join(settings.CASHFLOW_SCHEMA_DIR, f"openapi-*.{fmt}")
+        for path in glob.glob(pattern):
+            if path != schema_path(schema_version, fmt):
+                os.remove(path)
+    return schema_version, generated
+
+
+@dataclass(frozen=True)
+class Schema:
+    """Схема одной версии кода в памяти"""
+
+    version: str
+    content: dict[str, bytes]
+
+    def etag(self, fmt: str) -> str:
+        return f'"{self.version}-{fmt}"'
+
+
+_lock = threading.Lock()
+_schema: Schema | None = None
+
+
+def _read(schema_version: str) -> dict[str, bytes] | None:
+    try:
+        content = {}
+        for fmt in FORMATS:
+            with open(schema_path(schema_version, fmt), "rb") as file:
+                content[fmt] = file.read()
+        return content
+    except FileNotFoundError:
+        return None
+
+
+def get_schema() -> Schema:
+    """
+    Схема текущей версии кода: из памяти, из файла или (если файла нет —
+    например, после деплоя без generate_schema) сгенерированная и сохраненная.
+    """
+    global _schema
+    with _lock:
+        if _schema is None:
+            schema_version = code_version()
+            content = _read(schema_version)
+            if content is None:
+                try:
+                    write()
+                    content = _read(schema_version)
+                except OSError:
+                    # Каталог недоступен для записи — схема живет только в памяти
+                    content = generate()
+            _schema = Schema(schema_version, content)
+        return _schema
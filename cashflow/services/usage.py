@@ -0,0 +1,97 @@
+"""
+Статистика использования элементов справочников в записях ДДС.
+
+Число операций, сумма в базовой валюте и дата последней операции
+считаются одним запросом: LEFT JOIN справочника с таблицей ДДС и
+группировка по элементу справочника. Аннотации можно сортировать
+на стороне БД. Архивные операции добавляются коррелированными
+подзапросами к итогам архива (CashFlowRollup). Операции без курса на
+дату в сумму не входят, а считаются в operations_unconverted — как в
+счетчике unconverted потока событий.
+"""
+
+from decimal import Decimal
+
+from django.db.models import (Count, F, Max, OuterRef, QuerySet, Subquery, Sum,
+                              Value)
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.lookups import IsNull
+
+from ..models import CashFlowRollup
+from .currency import AMOUNT_FIELD, amount_sum, converted_amount
+
+# Допустимые значения параметра сортировки списков справочников
+SORT_FIELDS = ["name", "operations_count", "operations_total", "last_used"]
+
+
+def _archived(field: str, aggregate) -> Subquery:
+    """Итог архива по элементу справочника (NULL, если архивных операций нет)"""
+    return Subquery(
+        CashFlowRollup.objects.filter(**{field: OuterRef("pk")})
+        .order_by()
+        .values(field)
+        .annotate(value=aggregate)
+        .values("value")
+    )
+
+
+def with_usage(queryset: QuerySet) -> QuerySet:
+    """
+    Аннотирует выборку справочника (статусы, типы операций, категории,
+    подкатегории) полями operations_count, operations_total,
+    operations_unconverted и last_used с учетом архивных операций.
+    """
+    # Обратная связь от справочника к записям ДДС называется по модели CashFlow
+    prefix = "cashflow__"
+    field = next(
+        rollup_field.name
+        for rollup_field in CashFlowRollup._meta.get_fields()
+        if rollup_field.related_model is queryset.model
+    )
+    live_last = Max(f"{prefix}date")
+    # У итогов без last_date (созданных до появления поля) — первое число месяца
+    archived_last = _archived(field, Max(Coalesce("last_date", "month")))
+    return queryset.annotate(
+        operations_count=Count("cashflow")
+        + Coalesce(_archived(field, Sum("count")), Value(0)),
+        operations_total=Coalesce(
+            amount_sum(prefix=prefix),
+            Value(Decimal("0")),
+            output_field=AMOUNT_FIELD,
+        )
+        + Coalesce(
+            _archived(field, Sum("amount_base")),
+            Value(Decimal("0")),
+            output_field=AMOUNT_FIELD,
+        ),
+        # Суммы архива пересчитаны при архивации — без курса бывают только
+        # операции из базы
+        operations_unconverted=Count(
+            "cashflow", filter=IsNull(converted_amount(prefix=prefix), True)
+        ),
+        # Greatest с NULL в SQLite дает NULL — подставляем вторую дату
+        last_used=Greatest(
+            Coalesce(live_last, archived_last), Coalesce(archived_last, live_last)
+        ),
+    )
+
+
+def order_by_usage(
+    queryset: QuerySet, sort: str | None, default: str = "name"
+) -> tuple[QuerySet, str]:
+    """
+    Сортирует выборку по параметру sort (поле из SORT_FIELDS, «-» — по убыванию).
+
+    Returns:
+        Отсортированная выборка и примененная сортировка
+    """
+    if not sort or sort.lstrip("-") not in SORT_FIELDS:
+        sort = default
+    field = F(sort.lstrip("-"))
+    # Неиспользуемые элементы (без даты последней операции) — в конце списка
+    ordering = (
+        field.desc(nulls_last=True)
+        if sort.startswith("-")
+        else field.asc(nulls_last=True)
+    )
+    return queryset.order_by(ordering, "name"), sort
@@ -1,18 +1,23 @@
 from datetime import date
+from decimal import Decimal
 
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
-from ..models import Category, OperationType, SubCategory
+from ..models import (CashFlow, Category, OperationType, SubCategory,
+                      default_currency, from_minor_units, to_minor_units)
+from .archive import is_archived
+from .budgets import check_limits, matching_budgets
+from .currency import normalize_currency, to_base
 
 
 class BaseValidator:
     """Базовый класс для всех валидаторов"""
 
     @classmethod
-    def validate_unique_name(cls, model, name: str, instance=None) -> str:
-        """Проверка уникальности имени с учетом регистра"""
-        qs = model.objects.filter(name__iexact=name)
+    def validate_unique_name(cls, model, name: str, owner, instance=None) -> str:
+        """Проверка уникальности имени в справочнике владельца без учета регистра"""
+        qs = model.objects.filter(name__iexact=name, owner=owner)
         if instance:
             qs = qs.exclude(pk=instance.pk)
         if qs.exists():
@@ -24,30 +29,125 @@ class CashFlowValidator:
     """Валидатор для операций денежного потока"""
 
     @staticmethod
-    def validate_date(value: date) -> date:
-        """Проверяем, что дата не в будущем"""
+    def validate_date(value: date, archived: set[date] | None = None) -> date:
+        """
+        Проверяем, что дата не в будущем и ее месяц не перенесен в архив.
+
+        Args:
+            archived: Заранее загруженные архивные месяцы (при проверке
+                многих строк), иначе месяц проверяется запросом
+        """
         if value > timezone.now().date():
             raise ValidationError("Дата не может быть в будущем")
+        if (
+            value.replace(day=1) in archived
+            if archived is not None
+            else is_archived(value)
+        ):
+            raise ValidationError(
+                f"Записи за {value:%m.%Y} перенесены в архив и не изменяются"
+            )
         return value
 
     @staticmethod
-    def validate_amount(value: float) -> float:
-        """Валидация суммы (положительная и разумный предел)"""
+    def validate_amount(value: Decimal) -> Decimal:
+        """
+        Валидация суммы (положительная и разумный предел).
+
+        Сумма округляется до копеек точно, через целые копейки (без float).
+        """
         if value <= 0:
             raise ValidationError("Сумма должна быть положительной")
         if value > 1000000000:
             raise ValidationError("Сумма превышает максимально допустимую")
-        return round(value, 2)
+        return from_minor_units(to_minor_units(value))
 
     @staticmethod
-    def validate_category_relations(category, subcategory) -> None:
-        """Проверка соответствия категории и подкатегории"""
-        if category and subcategory and subcategory.category != category:
+    def validate_currency(value: str) -> str:
+        """Код валюты ISO 4217: три латинские буквы"""
+        try:
+            return normalize_currency(value)
+        except ValueError as e:
+            raise ValidationError(str(e))
+
+    @staticmethod
+    def validate_category_relations(category, subcategory, operation_type=None) -> None:
+        """
+        Проверка иерархии «тип операции → категория → подкатегория».
+
+        Сравниваются id уже загруженных объектов, без запросов к базе. В
+        PostgreSQL та же иерархия закреплена составными внешними ключами
+        (миграция 0012), поэтому ее не обходят и массовые вставки.
+        """
+        if category and subcategory and subcategory.category_id != category.pk:
             raise ValidationError("Подкатегория не принадлежит выбранной категории")
+        if (
+            operation_type
+            and category
+            and category.operation_type_id != operation_type.pk
+        ):
+            raise ValidationError("Категория не относится к выбранному типу операции")
+
+    @staticmethod
+    def validate_budget(data: dict[str, any], instance=None) -> list[str]:
+        """
+        Проверка лимитов бюджетов по счетчикам (запросы по индексу).
+
+        Курс валюты нужен, только если на категорию и месяц операции есть
+        бюджеты: без них запись в валюте без курса принимается.
+
+        Args:
+            data: Данные операции (date, amount, category, subcategory, currency)
+            instance: Редактируемая запись с еще не измененными значениями
+
+        Returns:
+            Предупреждения о превышении бюджетов
+
+        Raises:
+            ValidationError: Если превышен бюджет с запретом или нет курса валюты
+        """
+        subcategory = data.get("subcategory")
+        subcategory_id = subcategory.pk if subcategory else None
+        # Без бюджетов на категорию и месяц проверять нечего (и курс не нужен)
+        if not matching_budgets(
+            data["category"].pk, subcategory_id, data["date"]
+        ).exists():
+            return []
+        currency = data.get("currency") or default_currency()
+        amount = to_base(Decimal(data["amount"]), currency, data["date"])
+        if amount is None:
+            raise ValidationError(
+                f"Нет курса {currency} на {data['date']:%d.%m.%Y} для проверки бюджета"
+            )
+        previous = None
+        if instance is not None and instance.pk:
+            previous = {
+                "category_id": instance.category_id,
+                "subcategory_id": instance.subcategory_id,
+                "date": instance.date,
+                "amount": to_base(instance.amount, instance.currency, instance.date),
+            }
+        return check_limits(
+            data["category"].pk,
+            subcategory_id,
+            data["date"],
+            amount,
+            previous,
+        )
 
     @classmethod
-    def validate_all(cls, data: dict[str, any]) -> dict[str, any]:
-        """Комплексная валидация всех данных CashFlow"""
+    def validate_all(
+        cls,
+        data: dict[str, any],
+        instance=None,
+        warnings: list[str] | None = None,
+    ) -> dict[str, any]:
+        """
+        Комплексная валидация всех данных CashFlow.
+
+        Предупреждения о превышении бюджетов добавляются в список warnings,
+        если он передан.
+        """
         validated_data = data.copy()
 
         if "date" in validated_data:
@@ -56,11 +156,30 @@ class CashFlowValidator:
         if "amount" in validated_data:
             validated_data["amount"] = cls.validate_amount(validated_data["amount"])
 
-        if all(key in validated_data for key in ["category", "subcategory"]):
+        if "currency" in validated_data:
+            validated_data["currency"] = cls.validate_currency(
+                validated_data["currency"]
+            )
+
+        hierarchy = ["category", "subcategory", "operation_type"]
+        if any(key in validated_data for key in hierarchy):
+            # При частичном изменении недостающие звенья берутся из записи
             cls.validate_category_relations(
-                validated_data["category"], validated_data["subcategory"]
+                **{
+                    key: (
+                        validated_data[key]
+                        if key in validated_data
+                        else getattr(instance, key, None)
+                    )
+                    for key in hierarchy
+                }
             )
 
+        if all(key in validated_data for key in ["date", "amount", "category"]):
+            budget_warnings = cls.validate_budget(validated_data, instance)
+            if warnings is not None:
+                warnings.extend(budget_warnings)
+
         return validated_data
 
 
@@ -68,14 +187,28 @@ class OperationTypeValidator(BaseValidator):
     """Валидатор для типов операций"""
 
     @classmethod
-    def validate_name(cls, name: str, instance=None) -> str:
+    def validate_name(cls, name: str, owner, instance=None) -> str:
         """Проверка уникальности имени типа операции"""
-        return cls.validate_unique_name(OperationType, name, instance)
+        return cls.validate_unique_name(OperationType, name, owner, instance)
 
 
 class CategoryValidator(BaseValidator):
     """Валидатор для категорий"""
 
+    @staticmethod
+    def validate_operation_type(operation_type, instance=None) -> OperationType:
+        """Тип операции категории с записями ДДС не меняется"""
+        if (
+            instance is not None
+            and instance.pk
+            and instance.operation_type_id != operation_type.pk
+            and CashFlow.objects.filter(category=instance).exists()
+        ):
+            raise ValidationError(
+                "Категория используется в записях ДДС: тип операции изменить нельзя"
+            )
+        return operation_type
+
     @classmethod
     def validate_name(cls, name: str, operation_type, instance=None) -> str:
         """Проверка уникальности имени категории в рамках типа операции"""
@@ -93,6 +226,24 @@ class CategoryValidator(BaseValidator):
 class SubCategoryValidator(BaseValidator):
     """Валидатор для подкатегорий"""
 
+    @staticmethod
+    def validate_category(category, instance=None) -> Category:
+        """
+        Подкатегория с записями ДДС остается в своей категории: перенести
+        записи можно объединением с подкатегорией другой категории.
+        """
+        if (
+            instance is not None
+            and instance.pk
+            and instance.category_id != category.pk
+            and CashFlow.objects.filter(subcategory=instance).exists()
+        ):
+            raise ValidationError(
+                "Подкатегория используется в записях ДДС: перенесите их "
+                "объединением с подкатегорией нужной категории"
+            )
+        return category
+
     @classmethod
     def validate_name(cls, name: str, category, instance=None) -> str:
         """Проверка уникальности имени подкатегории в рамках категории"""
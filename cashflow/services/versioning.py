@@ -0,0 +1,48 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from ..models import DataVersion
+
+# Имена отслеживаемых наборов данных
+CASHFLOWS = "cashflow"
+REFERENCES = "reference"
+
+
+def get_version(name: str) -> int:
+    """Текущая версия набора данных (один запрос по первичному ключу)"""
+    version = DataVersion.objects.filter(name=name).values_list("version", flat=True)
+    return next(iter(version), 0)
+
+
+def get_versions(*names: str) -> dict[str, int]:
+    """Версии нескольких наборов данных одним запросом"""
+    versions = dict(
+        DataVersion.objects.filter(name__in=names).values_list("name", "version")
+    )
+    return {name: versions.get(name, 0) for name in names}
+
+
+def _increment(name: str) -> None:
+    if DataVersion.objects.filter(name=name).update(version=F("version") + 1):
+        return
+    try:
+        with transaction.atomic():
+            DataVersion.objects.create(name=name, version=1)
+    except IntegrityError:
+        # Запись успел создать параллельный процесс
+        DataVersion.objects.filter(name=name).update(version=F("version") + 1)
+
+
+def bump_version(*names: str) -> None:
+    """
+    Увеличивает версии после фиксации текущей транзакции.
+
+    Инкремент выполняется отдельным коротким запросом, чтобы блокировка
+    строки счетчика не удерживалась на время всей пишущей транзакции.
+    """
+
+    def bump() -> None:
+        for name in names:
+            _increment(name)
+
+    transaction.on_commit(bump)
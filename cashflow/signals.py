@@ -0,0 +1,308 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from .models import (Budget, CashFlow, Category, ExchangeRate, OperationType,
+                     RecurringOperation, Status, SubCategory, to_minor_units)
+from .services import budgets, events
+from .services.currency import to_base
+from .services.versioning import CASHFLOWS, REFERENCES, bump_version
+
+
+def _delta(
+    operation_type_id: int, amount: Decimal, currency: str, day, count: int
+) -> dict[str, any]:
+    """
+    Изменение итогов по типу операции в базовой валюте — по курсу на дату
+    операции, как в отчетах. Сумма записи без курса в итог не входит, а
+    учитывается в счетчике unconverted.
+    """
+    total = to_base(Decimal(amount), currency, day)
+    return {
+        str(operation_type_id): {
+            "total": total if total is not None else Decimal("0"),
+            "count": count,
+            "unconverted": 0 if total is not None else count,
+        }
+    }
+
+
+def _merge_deltas(*deltas: dict[str, any]) -> dict[str, any]:
+    """Складывает изменения итогов, убирая нулевые"""
+    result: dict[str, any] = {}
+    for delta in deltas:
+        for key, value in delta.items():
+            current = result.setdefault(
+                key, {"total": Decimal("0"), "count": 0, "unconverted": 0}
+            )
+            for field in current:
+                current[field] += value[field]
+    return {key: value for key, value in result.items() if any(value.values())}
+
+
+@receiver(pre_save, sender=CashFlow)
+def sync_amount_minor(sender, instance: CashFlow, **kwargs) -> None:
+    """Копирует сумму в колонку целых копеек (в том числе при loaddata)"""
+    instance.amount_minor = to_minor_units(instance.amount)
+
+
+@receiver(pre_save, sender=CashFlow)
+def remember_previous_cashflow(sender, instance: CashFlow, raw=False, **kwargs) -> None:
+    """
+    Запоминает прежние значения записи для расчета изменения итогов
+    и счетчиков бюджетов
+    """
+    instance._previous_totals = None
+    if not raw and not instance._state.adding and instance.pk:
+        instance._previous_totals = (
+            CashFlow.objects.filter(pk=instance.pk)
+            .values(
+                "operation_type_id",
+                "amount",
+                "currency",
+                "date",
+                "category_id",
+                "subcategory_id",
+            )
+            .first()
+        )
+
+
+@receiver(post_save, sender=CashFlow)
+def broadcast_cashflow_saved(
+    sender, instance: CashFlow, created: bool, raw=False, **kwargs
+) -> None:
+    """Рассылает новую или измененную запись и изменение итогов"""
+    if raw:
+        return
+    # Сериализаторы тянут DRF целиком — импортируются при первой записи, а не при старте
+    from .serializers import CashFlowSerializer
+
+    deltas = [
+        _delta(
+            instance.operation_type_id,
+            instance.amount,
+            instance.currency,
+            instance.date,
+            1,
+        )
+    ]
+    previous = getattr(instance, "_previous_totals", None)
+    if previous:
+        deltas.append(
+            _delta(
+                previous["operation_type_id"],
+                -previous["amount"],
+                previous["currency"],
+                previous["date"],
+                -1,
+            )
+        )
+    events.publish(
+        {
+            "type": "cashflow.created" if created else "cashflow.updated",
+            "id": instance.pk,
+            "owner": instance.owner_id,
+            "record": CashFlowSerializer(instance).data,
+            "delta": _merge_deltas(*deltas),
+        }
+    )
+
+
+@receiver(post_delete, sender=CashFlow)
+def broadcast_cashflow_deleted(sender, instance: CashFlow, **kwargs) -> None:
+    """Рассылает удаление записи и изменение итогов"""
+    events.publish(
+        {
+            "type": "cashflow.deleted",
+            "id": instance.pk,
+            "owner": instance.owner_id,
+            "delta": _merge_deltas(
+                _delta(
+                    instance.operation_type_id,
+                    -instance.amount,
+                    instance.currency,
+                    instance.date,
+                    -1,
+                )
+            ),
+        }
+    )
+
+
+@receiver(post_save, sender=CashFlow)
+def update_budgets_on_save(sender, instance: CashFlow, raw=False, **kwargs) -> None:
+    """
+    Переносит сумму записи в счетчики бюджетов: вычитает прежнюю версию и
+    прибавляет новую. Выполняется в транзакции CashFlow.save: бюджеты
+    записи блокируются и проверяются по актуальным счетчикам, превышение
+    бюджета с запретом (ValidationError) откатывает сохранение.
+    """
+    if raw:
+        return
+    amount = to_base(Decimal(instance.amount), instance.currency, instance.date)
+    previous = getattr(instance, "_previous_totals", None)
+    if previous:
+        previous = {
+            **previous,
+            "amount": to_base(
+                previous["amount"], previous["currency"], previous["date"]
+            ),
+        }
+    if amount is not None:
+        budgets.check_limits(
+            instance.category_id,
+            instance.subcategory_id,
+            instance.date,
+            amount,
+            previous,
+            lock=True,
+        )
+    if previous:
+        budgets.apply_change(
+            previous["category_id"],
+            previous["subcategory_id"],
+            previous["date"],
+            -previous["amount"] if previous["amount"] else None,
+        )
+    budgets.apply_change(
+        instance.category_id, instance.subcategory_id, instance.date, amount
+    )
+
+
+@receiver(post_delete, sender=CashFlow)
+def update_budgets_on_delete(sender, instance: CashFlow, **kwargs) -> None:
+    """Вычитает удаленную запись из счетчиков бюджетов"""
+    amount = to_base(instance.amount, instance.currency, instance.date)
+    budgets.apply_change(
+        instance.category_id,
+        instance.subcategory_id,
+        instance.date,
+        -amount if amount else None,
+    )
+
+
+@receiver(pre_save, sender=Budget)
+def initialize_budget_spent(sender, instance: Budget, raw=False, **kwargs) -> None:
+    """Считает израсходованную сумму для нового или измененного бюджета"""
+    if raw:
+        return
+    instance.spent = budgets.spent_for(instance)
+
+
+@receiver(post_save, sender=Status)
+@receiver(post_save, sender=OperationType)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=SubCategory)
+def broadcast_reference_saved(sender, instance, raw=False, **kwargs) -> None:
+    """Сообщает подписчикам об изменении справочника"""
+    if raw:
+        return
+    events.publish(
+        {
+            "type": "reference.changed",
+            "model": sender._meta.model_name,
+            "id": instance.pk,
+            "owner": instance.owner_id,
+            "name": instance.name,
+        }
+    )
+
+
+@receiver(post_delete, sender=Status)
+@receiver(post_delete, sender=OperationType)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=SubCategory)
+def broadcast_reference_deleted(sender, instance, **kwargs) -> None:
+    """Сообщает подписчикам об удалении элемента справочника"""
+    events.publish(
+        {
+            "type": "reference.deleted",
+            "model": sender._meta.model_name,
+            "id": instance.pk,
+            "owner": instance.owner_id,
+        }
+    )
+
+
+@receiver(post_save, sender=CashFlow)
+@receiver(post_delete, sender=CashFlow)
+def bump_cashflow_version(sender, **kwargs) -> None:
+    """Инвалидирует кэши, зависящие от записей ДДС"""
+    bump_version(CASHFLOWS)
+
+
+@receiver(post_save, sender=CashFlow)
+def update_cube_on_save(sender, instance: CashFlow, raw=False, **kwargs) -> None:
+    """Переносит сохраненную запись в куб после фиксации транзакции"""
+    if raw or not settings.CASHFLOW_CUBE_ENABLED:
+        return
+    from .services.cube import ledger_cube
+
+    if not ledger_cube.loaded:
+        return
+    values = {
+        "id": instance.pk,
+        "date": instance.date,
+        "owner_id": instance.owner_id,
+        "status_id": instance.status_id,
+        "operation_type_id": instance.operation_type_id,
+        "category_id": instance.category_id,
+        "subcategory_id": instance.subcategory_id,
+        "amount": Decimal(instance.amount),
+        "currency": instance.currency,
+    }
+    transaction.on_commit(lambda: ledger_cube.apply_saved(values))
+
+
+@receiver(post_delete, sender=CashFlow)
+def update_cube_on_delete(sender, instance: CashFlow, **kwargs) -> None:
+    """Убирает удаленную запись из куба после фиксации транзакции"""
+    if not settings.CASHFLOW_CUBE_ENABLED:
+        return
+    from .services.cube import ledger_cube
+
+    if not ledger_cube.loaded:
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: ledger_cube.apply_deleted(pk))
+
+
+@receiver(post_save, sender=Status)
+@receiver(post_save, sender=OperationType)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_save, sender=RecurringOperation)
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=Status)
+@receiver(post_delete, sender=OperationType)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=SubCategory)
+@receiver(post_delete, sender=RecurringOperation)
+@receiver(post_delete, sender=ExchangeRate)
+def bump_reference_version(sender, **kwargs) -> None:
+    """Инвалидирует кэши, зависящие от справочников"""
+    bump_version(REFERENCES)
+
+
+@receiver(post_migrate)
+def add_archive_owner_column(sender, apps, plan=None, **kwargs) -> None:
+    """
+    Дополняет архивные файлы колонкой owner_id после миграции 0010 — вне ее
+    транзакции, чтобы файлы не разошлись с базой при откате миграции.
+    """
+    if sender.name != "cashflow":
+        return
+    try:
+        rollup = apps.get_model("cashflow", "CashFlowRollup")
+    except LookupError:
+        return
+    if not any(field.name == "owner" for field in rollup._meta.fields):
+        return
+    from .services import archive
+
+    archive.add_owner_column()
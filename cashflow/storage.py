@@ -0,0 +1,53 @@
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+from .services import compression
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Статика с отпечатком содержимого в имени файла (bootstrap.min.3f2a1c.css)
+    и сжатыми копиями рядом с ним (.gz и, если установлен brotli, .br).
+
+    Копии создаются один раз при collectstatic с максимальной степенью
+    сжатия; StaticFilesMiddleware отдает их без сжатия на лету.
+    """
+
+    # Ссылки на ресурсы в CSS переписываются на имена с отпечатком. Карты
+    # исходников (sourceMappingURL) в проекте не хранятся — их ссылки не
+    # трогаем, иначе collectstatic падает на отсутствующем .map
+    patterns = (
+        (
+            "*.css",
+            (
+                r"""(?P<matched>url\(['"]{0,1}\s*(?P<url>.*?)["']{0,1}\))""",
+                (
+                    r"""(?P<matched>@import\s*["']\s*(?P<url>.*?)["'])""",
+                    """@import url("%(url)s")""",
+                ),
+            ),
+        ),
+    )
+    # Промежуточные копии многопроходной обработки CSS не нужны
+    keep_intermediate_files = False
+
+    def post_process(self, paths, dry_run: bool = False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            if name.endswith(compression.COMPRESSIBLE_EXTENSIONS):
+                self._compress(name)
+
+    def _compress(self, name: str) -> None:
+        with self.open(name) as file:
+            data = file.read()
+        for encoding, suffix in (("br", "br"), ("gzip", "gz")):
+            if encoding not in compression.available():
+                continue
+            path = f"{name}.{suffix}"
+            if self.exists(path):
+                self.delete(path)
+            content = compression.compress(data, encoding, static=True)
+            if len(content) < len(data) * compression.MIN_RATIO:
+                self._save(path, ContentFile(content))
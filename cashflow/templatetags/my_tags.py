@@ -8,3 +8,11 @@ def media_filter(path):
     if path:
         return f"/media/{path}"
     return "#"
+
+
+@register.simple_tag
+def bootstrap_icons_css():
+    """Адрес CSS Bootstrap Icons: локальная копия или CDN"""
+    from cashflow.services.assets import icons_css_url
+
+    return icons_css_url()
@@ -0,0 +1,1590 @@
+import gzip
+import json
+import os
+import tempfile
+import uuid
+import zlib
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIClient, APIRequestFactory
+
+from .models import (ArchivedMonth, Budget, CashFlow, CashFlowNote,
+                     CashFlowRollup, Category, ExchangeRate, OperationType,
+                     RecurringOperation, Status, SubCategory)
+from .serializers import CashFlowSerializer
+from .services import (anomalies, archive, assets, bulk, compression, events,
+                       forecast, ingest, merge, reconciliation, recurring,
+                       schema)
+from .services.compression import StreamCompressor
+from .services.cube import CubeQuery, ledger_cube
+from .services.currency import amount_sum
+from .services.imports import fingerprint_of, import_records, records_from_csv
+
+
+class CashFlowTestMixin:
+    """Пользователь со справочниками и клиент API от его имени"""
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user("owner", password="x")
+        self.status = Status.objects.create(owner=self.user, name="Бизнес")
+        self.operation_type = OperationType.objects.create(
+            owner=self.user, name="Списание"
+        )
+        self.category = Category.objects.create(
+            owner=self.user, name="Маркетинг", operation_type=self.operation_type
+        )
+        self.subcategory = SubCategory.objects.create(
+            owner=self.user, name="Avito", category=self.category
+        )
+        self.client.force_login(self.user)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def payload(self, **values: any) -> dict[str, any]:
+        """Данные записи ДДС для API"""
+        return {
+            "date": "2001-05-05",
+            "status": self.status.pk,
+            "operation_type": self.operation_type.pk,
+            "category": self.category.pk,
+            "subcategory": self.subcategory.pk,
+            "amount": "100.00",
+            **values,
+        }
+
+
+class BudgetTests(CashFlowTestMixin, TestCase):
+    """Счетчики бюджетов и проверка лимитов"""
+
+    def budget(self, mode: str = Budget.BLOCK, **values: any) -> Budget:
+        """Бюджет категории на май 2001 с лимитом 150"""
+        return Budget.objects.create(
+            category=self.category,
+            month=date(2001, 5, 1),
+            limit=Decimal("150.00"),
+            mode=mode,
+            **values,
+        )
+
+    def spent(self, budget: Budget) -> Decimal:
+        """Текущий счетчик бюджета из базы"""
+        budget.refresh_from_db()
+        return budget.spent
+
+    def test_counter_follows_create_update_delete(self) -> None:
+        budget = self.budget(mode=Budget.WARN)
+        subcategory_budget = self.budget(subcategory=self.subcategory)
+
+        response = self.api.post("/api/cashflows/", self.payload(), format="json")
+        self.assertEqual(response.status_code, 201)
+        pk = response.json()["id"]
+        self.assertEqual(self.spent(budget), Decimal("100.00"))
+        self.assertEqual(self.spent(subcategory_budget), Decimal("100.00"))
+
+        response = self.api.patch(
+            f"/api/cashflows/{pk}/", {"amount": "40.00"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.spent(budget), Decimal("40.00"))
+
+        # Перенос в другой месяц вычитает запись из бюджета прежнего месяца
+        response = self.api.patch(
+            f"/api/cashflows/{pk}/", {"date": "2001-04-30"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.spent(budget), Decimal("0.00"))
+
+        self.api.patch(f"/api/cashflows/{pk}/", {"date": "2001-05-05"}, format="json")
+        self.assertEqual(self.api.delete(f"/api/cashflows/{pk}/").status_code, 204)
+        self.assertEqual(self.spent(budget), Decimal("0.00"))
+        self.assertEqual(self.spent(subcategory_budget), Decimal("0.00"))
+
+    def test_warn_budget_accepts_with_warning(self) -> None:
+        budget = self.budget(mode=Budget.WARN)
+        self.api.post("/api/cashflows/", self.payload(), format="json")
+
+        response = self.api.post("/api/cashflows/", self.payload(), format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()["budget_warnings"]), 1)
+        self.assertEqual(self.spent(budget), Decimal("200.00"))
+
+    def test_block_budget_rejects_overrun(self) -> None:
+        budget = self.budget()
+        self.api.post("/api/cashflows/", self.payload(), format="json")
+
+        response = self.api.post("/api/cashflows/", self.payload(), format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(CashFlow.objects.count(), 1)
+        self.assertEqual(self.spent(budget), Decimal("100.00"))
+
+    def test_block_budget_checked_again_on_save(self) -> None:
+        """Запись, прошедшая проверку до параллельной записи, не превышает бюджет"""
+        budget = self.budget()
+        request = APIRequestFactory().post("/api/cashflows/")
+        request.user = self.user
+        serializer = CashFlowSerializer(
+            data=self.payload(amount="60.00"), context={"request": request}
+        )
+        self.assertTrue(serializer.is_valid())
+        Budget.objects.filter(pk=budget.pk).update(spent=Decimal("100.00"))
+
+        with self.assertRaises(serializers.ValidationError):
+            serializer.save()
+        self.assertFalse(CashFlow.objects.exists())
+        self.assertEqual(self.spent(budget), Decimal("100.00"))
+
+    def test_block_budget_allows_decrease(self) -> None:
+        budget = self.budget()
+        response = self.api.post("/api/cashflows/", self.payload(), format="json")
+        pk = response.json()["id"]
+        Budget.objects.filter(pk=budget.pk).update(spent=Decimal("500.00"))
+
+        response = self.api.patch(
+            f"/api/cashflows/{pk}/", {"amount": "90.00"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.spent(budget), Decimal("490.00"))
+
+    def test_foreign_currency_without_rate_needs_no_budget(self) -> None:
+        response = self.api.post(
+            "/api/cashflows/", self.payload(currency="USD"), format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+
+        self.budget()
+        response = self.api.post(
+            "/api/cashflows/", self.payload(currency="USD"), format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_report_page(self) -> None:
+        url = reverse("cashflow:budget-report")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["month"], f"{timezone.now():%Y-%m}")
+
+        budget = self.budget()
+        self.api.post("/api/cashflows/", self.payload(), format="json")
+        response = self.client.get(url, {"month": "2001-05"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["month"], "2001-05")
+        row = response.context["report"]["rows"][0]
+        self.assertEqual((row["id"], row["spent"]), (budget.pk, "100.00"))
+
+        response = self.client.get(url, {"month": "05.2001"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("error", response.context)
+
+
+class ImportTests(CashFlowTestMixin, TestCase):
+    """Идемпотентный импорт: повторы строк и подсчет созданных записей"""
+
+    def record(self, **values: any) -> CashFlow:
+        return CashFlow(
+            owner=self.user,
+            date=date(2001, 5, 5),
+            status=self.status,
+            operation_type=self.operation_type,
+            category=self.category,
+            subcategory=self.subcategory,
+            amount=Decimal("100.00"),
+            **values,
+        )
+
+    def test_repeated_rows_are_reported(self) -> None:
+        records = [self.record(), self.record(), self.record(source_reference="2")]
+        result = import_records(records)
+        self.assertEqual(
+            (result["created"], result["duplicates"], result["repeated"]), (2, 0, 1)
+        )
+        self.assertEqual(result["ids"][0], result["ids"][1])
+
+        result = import_records([self.record(), self.record()])
+        self.assertEqual(
+            (result["created"], result["duplicates"], result["repeated"]), (0, 1, 1)
+        )
+        self.assertEqual(CashFlow.objects.count(), 2)
+
+    def test_concurrent_import_is_not_counted(self) -> None:
+        """Запись того же содержимого, вставленная параллельным импортом"""
+        comment = "Оплата по счету " * 10
+        competitor = self.record(comment=comment)
+        competitor.fingerprint = fingerprint_of(competitor)
+        bulk_create = QuerySet.bulk_create
+
+        def insert_first(queryset, objs, *args: any, **kwargs: any):
+            if queryset.model is CashFlow and not competitor.pk:
+                competitor.save()
+            return bulk_create(queryset, objs, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, "bulk_create", insert_first):
+            result = import_records([self.record(comment=comment.upper())])
+        self.assertEqual((result["created"], result["duplicates"]), (0, 1))
+        self.assertEqual(result["ids"], [competitor.pk])
+        self.assertEqual(CashFlowNote.objects.get().comment, comment)
+
+    def test_block_budget_rejects_overrun(self) -> None:
+        budget = Budget.objects.create(
+            category=self.category,
+            month=date(2001, 5, 1),
+            limit=Decimal("150.00"),
+            mode=Budget.BLOCK,
+        )
+        records = [self.record(source_reference=str(number)) for number in range(3)]
+        result = import_records(records)
+        self.assertEqual(result["created"], 1)
+        self.assertEqual(sorted(result["rejected"]), [1, 2])
+        self.assertIn("Превышен бюджет", result["rejected"][1])
+        self.assertEqual(result["ids"][1:], [None, None])
+        budget.refresh_from_db()
+        self.assertEqual(budget.spent, Decimal("100.00"))
+
+        # Повторная загрузка той же записи — дубль, а не перерасход
+        result = import_records([self.record(source_reference="0")])
+        self.assertEqual((result["duplicates"], result["rejected"]), (1, {}))
+
+    def test_csv_checks_archived_months_once(self) -> None:
+        ArchivedMonth.objects.create(month=date(2001, 4, 1), path="unused", rows=0)
+        rows = "\n".join(
+            f"2001-0{month}-0{day};100;Бизнес;Списание;Маркетинг;Avito"
+            for month in (4, 5)
+            for day in range(1, 6)
+        )
+        content = "date;amount;status;operation_type;category;subcategory\n" + rows
+        # Четыре справочника и архивные месяцы — независимо от числа строк
+        with self.assertNumQueries(5):
+            records, errors = records_from_csv(content, self.user)
+        self.assertEqual(len(records), 5)
+        self.assertEqual(sorted(errors), [2, 3, 4, 5, 6])
+
+
+class AdminReparentTests(CashFlowTestMixin, TestCase):
+    """Перенос категории и подкатегории с записями ДДС в админке"""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.api.post("/api/cashflows/", self.payload(), format="json")
+        self.other_type = OperationType.objects.create(owner=self.user, name="Приход")
+        self.other_category = Category.objects.create(
+            owner=self.user, name="Продажи", operation_type=self.other_type
+        )
+
+    def test_category_operation_type_is_locked(self) -> None:
+        response = self.client.post(
+            reverse("admin:cashflow_category_change", args=[self.category.pk]),
+            {
+                "name": self.category.name,
+                "operation_type": self.other_type.pk,
+                "owner": self.user.pk,
+                "subcategories-TOTAL_FORMS": 0,
+                "subcategories-INITIAL_FORMS": 0,
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "тип операции изменить нельзя")
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.operation_type, self.operation_type)
+
+    def test_subcategory_category_is_locked(self) -> None:
+        response = self.client.post(
+            reverse("admin:cashflow_subcategory_change", args=[self.subcategory.pk]),
+            {
+                "name": self.subcategory.name,
+                "category": self.other_category.pk,
+                "owner": self.user.pk,
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "объединением с подкатегорией")
+        self.subcategory.refresh_from_db()
+        self.assertEqual(self.subcategory.category, self.category)
+
+
+class CommentTests(CashFlowTestMixin, TestCase):
+    """Комментарий записи: начало в записи, полный текст в CashFlowNote"""
+
+    def test_note_lookup_only_for_full_preview(self) -> None:
+        for length in [63, 64, 65]:
+            with self.subTest(length=length):
+                comment = "к" * length
+                response = self.api.post(
+                    "/api/cashflows/", self.payload(comment=comment), format="json"
+                )
+                record = CashFlow.objects.get(pk=response.json()["id"])
+                has_note = CashFlowNote.objects.filter(cashflow=record).exists()
+                self.assertEqual(has_note, length >= 64)
+                with self.assertNumQueries(1 if has_note else 0):
+                    self.assertEqual(record.comment, comment)
+
+
+class CompressionTests(CashFlowTestMixin, TestCase):
+    """Сжатие ответов и защита от BREACH"""
+
+    def setUp(self) -> None:
+        super().setUp()
+        for amount in ["1.00", "2.00", "3.00"]:
+            self.api.post("/api/cashflows/", self.payload(amount=amount), format="json")
+
+    def test_stream_flushes_every_chunk(self) -> None:
+        compressor = StreamCompressor("gzip")
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for chunk in [b"data: 1\n\n", b"x" * 1000, b"end"]:
+            self.assertEqual(decompressor.decompress(compressor.compress(chunk)), chunk)
+        decompressor.decompress(compressor.finish())
+        self.assertTrue(decompressor.eof)
+
+    def test_gzip_length_is_masked(self) -> None:
+        lengths = {
+            len(b"".join(StreamCompressor("gzip").iterate([b"secret"] * 3)))
+            for _ in range(20)
+        }
+        self.assertGreater(len(lengths), 1)
+
+        plain = self.api.get("/api/cashflows/")
+        response = self.api.get("/api/cashflows/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+    def test_page_with_csrf_token_is_not_brotli(self) -> None:
+        brotli = mock.Mock(compress=lambda data, quality: data[:10])
+        with mock.patch.object(compression, "_brotli", return_value=brotli):
+            response = self.client.get("/", HTTP_ACCEPT_ENCODING="br, gzip")
+            self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+            self.assertEqual(response["Content-Encoding"], "gzip")
+
+            response = self.api.get("/api/cashflows/", HTTP_ACCEPT_ENCODING="br, gzip")
+            self.assertEqual(response["Content-Encoding"], "br")
+
+
+class IngestTests(CashFlowTestMixin, TestCase):
+    """Буфер записи: журнал, повторная проверка при фиксации и чтение своих записей"""
+
+    def setUp(self) -> None:
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(
+            CASHFLOW_INGEST_ENABLED=True, CASHFLOW_INGEST_DIR=self.directory
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Фиксация — явными вызовами в потоке теста, без фонового потока
+        start = mock.patch.object(ingest.IngestBuffer, "_start")
+        start.start()
+        self.addCleanup(start.stop)
+        ingest._buffer = None
+        self.addCleanup(setattr, ingest, "_buffer", None)
+
+    def post_async(self, **values: any):
+        return self.api.post(
+            "/api/cashflows/",
+            self.payload(**values),
+            format="json",
+            HTTP_PREFER="respond-async",
+        )
+
+    def write_wal(self, name: str, amounts: list[str]) -> list[str]:
+        """Журнал другого процесса с записями на указанные суммы"""
+        tokens, lines = [], []
+        for amount in amounts:
+            record = CashFlow(
+                owner=self.user,
+                date=date(2001, 5, 5),
+                status=self.status,
+                operation_type=self.operation_type,
+                category=self.category,
+                subcategory=self.subcategory,
+                amount=Decimal(amount),
+                comment="из журнала",
+            )
+            tokens.append(str(uuid.uuid4()))
+            entry = {"token": tokens[-1], "record": ingest.encode(record)}
+            lines.append(json.dumps(entry, cls=DjangoJSONEncoder) + "\n")
+        with open(os.path.join(self.directory, name), "w") as file:
+            file.writelines(lines)
+        return tokens
+
+    def rejected(self) -> list[dict[str, any]]:
+        path = os.path.join(self.directory, ingest.REJECTED)
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding="utf-8") as file:
+            return [json.loads(line) for line in file]
+
+    def test_recover_abandoned_wal_once(self) -> None:
+        self.write_wal("crashed-1-1.wal", ["10.00", "20.00"])
+        buffer = ingest.get_buffer()
+        self.assertEqual(buffer.recover(), 2)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.directory, "crashed-1-1.wal"))
+        )
+
+        # Журнал, загруженный до сбоя, повторно записей не создает
+        with open(os.path.join(self.directory, "crashed-1-2.wal"), "w") as file:
+            for record in CashFlow.objects.all():
+                entry = {
+                    "token": str(record.ingest_token),
+                    "record": ingest.encode(record),
+                }
+                file.write(json.dumps(entry, cls=DjangoJSONEncoder) + "\n")
+        self.assertEqual(buffer.recover(), 0)
+        self.assertEqual(CashFlow.objects.count(), 2)
+        self.assertEqual(CashFlow.objects.first().comment, "из журнала")
+
+    def test_read_your_writes(self) -> None:
+        response = self.post_async()
+        self.assertEqual(response.status_code, 202)
+        token = response.json()["ingest_token"]
+        self.assertFalse(CashFlow.objects.exists())
+
+        records = self.api.get("/api/cashflows/").json()
+        records = records.get("results", records)
+        self.assertEqual([record["ingest_token"] for record in records], [token])
+
+    def test_read_your_writes_from_other_process(self) -> None:
+        """Записи из журнала, который держит другой процесс, видны при чтении"""
+        (token,) = self.write_wal("other-1-1.wal", ["10.00"])
+        # Блокировка на отдельном открытом файле — как у живого процесса
+        segment = ingest.Segment.acquire(os.path.join(self.directory, "other-1-1.wal"))
+        self.addCleanup(segment.file.close)
+
+        records = self.api.get("/api/cashflows/").json()
+        records = records.get("results", records)
+        self.assertEqual([record["ingest_token"] for record in records], [token])
+        # Журнал остается у процесса-владельца; его фиксация дублей не создаст
+        self.assertEqual(ingest.commit(segment.entries(), self.directory, 100), 0)
+
+    def test_block_budget_rechecked_on_flush(self) -> None:
+        budget = Budget.objects.create(
+            category=self.category,
+            month=date(2001, 5, 1),
+            limit=Decimal("150.00"),
+            mode=Budget.BLOCK,
+        )
+        # Обе записи приняты: счетчик бюджета еще не учитывает буфер
+        self.assertEqual(self.post_async().status_code, 202)
+        self.assertEqual(self.post_async().status_code, 202)
+
+        self.assertEqual(ingest.get_buffer().flush(), 1)
+        budget.refresh_from_db()
+        self.assertEqual(budget.spent, Decimal("100.00"))
+        (rejected,) = self.rejected()
+        self.assertIn("Превышен бюджет", rejected["error"])
+
+    def test_archived_month_rechecked_on_flush(self) -> None:
+        self.assertEqual(self.post_async().status_code, 202)
+        ArchivedMonth.objects.create(month=date(2001, 5, 1), path="x.parquet", rows=0)
+
+        self.assertEqual(ingest.get_buffer().flush(), 0)
+        self.assertFalse(CashFlow.objects.exists())
+        (rejected,) = self.rejected()
+        self.assertIn("архив", rejected["error"])
+
+
+class ConditionalTests(CashFlowTestMixin, TestCase):
+    """ETag и 304 для записей ДДС"""
+
+    def setUp(self) -> None:
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api.post("/api/cashflows/", self.payload(), format="json")
+
+    def assertNotModified(self, path: str, client=None) -> str:
+        """Повтор запроса с полученным ETag дает 304; возвращает ETag"""
+        client = client or self.api
+        response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        response = client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        return etag
+
+    def test_not_modified(self) -> None:
+        record = CashFlow.objects.get()
+        for path in [
+            "/api/cashflows/",
+            f"/api/cashflows/{record.pk}/",
+            "/api/cashflows/period_stats/?start_date=2001-01-01&end_date=2001-12-31",
+        ]:
+            with self.subTest(path=path):
+                self.assertNotModified(path)
+        # Асинхронные endpoints и страницы — с сессией пользователя
+        for path in [
+            "/api/async/cashflows/",
+            f"/api/async/cashflows/{record.pk}/",
+            "/",
+        ]:
+            with self.subTest(path=path):
+                self.assertNotModified(path, self.client)
+
+    def test_write_changes_etag(self) -> None:
+        etag = self.assertNotModified("/api/cashflows/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api.post("/api/cashflows/", self.payload(amount="5.00"), format="json")
+
+        response = self.api.get("/api/cashflows/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["count"], 2)
+
+    def test_reference_change_changes_etag(self) -> None:
+        etag = self.assertNotModified("/api/cashflows/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = "Реклама"
+            self.category.save()
+
+        response = self.api.get("/api/cashflows/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_query_string_has_own_etag(self) -> None:
+        etag = self.assertNotModified("/api/cashflows/")
+        response = self.api.get("/api/cashflows/?category=0", HTTP_IF_NONE_MATCH=etag)
+        self.assertNotEqual(response.status_code, 304)
+
+
+class IconsTests(TestCase):
+    """Bootstrap Icons: локальная копия или CDN"""
+
+    def setUp(self) -> None:
+        assets.icons_css_url.cache_clear()
+        self.addCleanup(assets.icons_css_url.cache_clear)
+
+    def test_cdn_without_local_copy(self) -> None:
+        with mock.patch.object(assets.finders, "find", return_value=None):
+            self.assertEqual(assets.icons_css_url(), assets.ICONS_CDN)
+
+    def test_cdn_when_copy_is_not_collected(self) -> None:
+        with (
+            mock.patch.object(assets.finders, "find", return_value="/static/x.css"),
+            mock.patch.object(assets, "static", side_effect=ValueError),
+        ):
+            self.assertEqual(assets.icons_css_url(), assets.ICONS_CDN)
+
+    def test_local_copy(self) -> None:
+        with mock.patch.object(assets.finders, "find", return_value="/static/x.css"):
+            self.assertEqual(
+                assets.icons_css_url(), settings.STATIC_URL + assets.ICONS_CSS
+            )
+
+
+class EventTotalsTests(CashFlowTestMixin, TestCase):
+    """Итоги потока событий в базовой валюте"""
+
+    def setUp(self) -> None:
+        super().setUp()
+        ExchangeRate.objects.create(
+            currency="USD", date=date(2001, 1, 1), rate=Decimal("30")
+        )
+
+    def deltas(self, **values: any) -> list[dict[str, any]]:
+        with mock.patch.object(events, "publish") as publish:
+            self.api.post("/api/cashflows/", self.payload(**values), format="json")
+        return [
+            call.args[0]["delta"]
+            for call in publish.call_args_list
+            if "delta" in call.args[0]
+        ]
+
+    def test_delta_in_base_currency(self) -> None:
+        (delta,) = self.deltas(amount="10.00", currency="USD")
+        self.assertEqual(
+            delta[str(self.operation_type.pk)],
+            {"total": Decimal("300.00"), "count": 1, "unconverted": 0},
+        )
+
+    def test_delta_without_rate_is_counted_separately(self) -> None:
+        (delta,) = self.deltas(amount="10.00", currency="EUR")
+        self.assertEqual(
+            delta[str(self.operation_type.pk)],
+            {"total": Decimal("0"), "count": 1, "unconverted": 1},
+        )
+
+    def test_update_moves_converted_amount(self) -> None:
+        record = self.api.post(
+            "/api/cashflows/",
+            self.payload(amount="10.00", currency="USD"),
+            format="json",
+        ).json()
+        with mock.patch.object(events, "publish") as publish:
+            self.api.patch(
+                f"/api/cashflows/{record['id']}/",
+                {"amount": "100.00", "currency": "RUB"},
+                format="json",
+            )
+        (event,) = [
+            call.args[0] for call in publish.call_args_list if "delta" in call.args[0]
+        ]
+        self.assertEqual(
+            event["delta"][str(self.operation_type.pk)]["total"], Decimal("-200.00")
+        )
+
+    async def test_snapshot_in_base_currency(self) -> None:
+        await CashFlow.objects.acreate(
+            owner=self.user,
+            date=date(2001, 5, 5),
+            status=self.status,
+            operation_type=self.operation_type,
+            category=self.category,
+            subcategory=self.subcategory,
+            amount=Decimal("10.00"),
+            currency="USD",
+        )
+        await CashFlow.objects.acreate(
+            owner=self.user,
+            date=date(2001, 5, 5),
+            status=self.status,
+            operation_type=self.operation_type,
+            category=self.category,
+            subcategory=self.subcategory,
+            amount=Decimal("100.00"),
+        )
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get("/api/events/")
+        message = await anext(aiter(response.streaming_content))
+        if isinstance(message, bytes):
+            message = message.decode()
+        snapshot = json.loads(message.split("data: ", 1)[1])
+        self.assertEqual(snapshot["currency"], "RUB")
+        totals = snapshot["totals"][str(self.operation_type.pk)]
+        self.assertEqual(Decimal(totals.pop("total")), Decimal("400.00"))
+        self.assertEqual(totals, {"count": 2, "unconverted": 0})
+
+
+class ArchiveTests(CashFlowTestMixin, TestCase):
+    """Архив месяца: файл, итоги и чтение архивных записей отчетами"""
+
+    def setUp(self) -> None:
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(CASHFLOW_ARCHIVE_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        ExchangeRate.objects.create(
+            currency="USD", date=date(2000, 1, 1), rate=Decimal("30")
+        )
+        self.archived = [
+            self.record(date(2001, 1, 10), "100.00"),
+            self.record(date(2001, 1, 20), "10.00", currency="USD"),
+        ]
+        self.live = self.record(date(2001, 3, 1), "50.00")
+        archive.archive_month(date(2001, 1, 1))
+
+    def record(self, day: date, amount: str, **values: any) -> CashFlow:
+        return CashFlow.objects.create(
+            owner=self.user,
+            date=day,
+            status=self.status,
+            operation_type=self.operation_type,
+            category=self.category,
+            subcategory=self.subcategory,
+            amount=Decimal(amount),
+            **values,
+        )
+
+    def archived_values(self, path: str, column: str) -> set:
+        """Значения колонки в архивном файле"""
+        return set(archive._pyarrow().parquet.read_table(path)[column].to_pylist())
+
+    def test_round_trip(self) -> None:
+        self.assertFalse(CashFlow.objects.filter(date__year=2001, date__month=1))
+        (rollup,) = CashFlowRollup.objects.filter(currency="USD")
+        self.assertEqual(
+            (rollup.count, rollup.amount, rollup.amount_base, rollup.last_date),
+            (1, Decimal("10.00"), Decimal("300.00"), date(2001, 1, 20)),
+        )
+        table = archive.ArchiveFilter(owner=self.user.pk).read()
+        rows = sorted(table.to_pylist(), key=lambda row: row["date"])
+        self.assertEqual(
+            [(row["id"], row["amount"], row["currency"]) for row in rows],
+            [(record.pk, record.amount, record.currency) for record in self.archived],
+        )
+
+        pivot = self.api.get(
+            "/api/cashflows/pivot/?start_date=2001-01-01&end_date=2001-03-31"
+        ).json()
+        self.assertEqual(Decimal(str(pivot["grand_total"])), Decimal("-450.00"))
+
+    def test_compare_includes_archive(self) -> None:
+        for dimension in ["operation_type", "category"]:
+            with self.subTest(dimension=dimension):
+                result = self.api.get(
+                    "/api/cashflows/compare/",
+                    {
+                        "dimension": dimension,
+                        "start_date": "2001-03-01",
+                        "end_date": "2001-03-31",
+                        "baseline": "2001-01-01:2001-01-31",
+                    },
+                ).json()
+                (row,) = result["rows"]
+                (baseline,) = row["baselines"].values()
+                self.assertEqual(Decimal(baseline["value"]), Decimal("400.00"))
+                (total,) = result["totals"]["baselines"].values()
+                self.assertEqual(Decimal(total["value"]), Decimal("-400.00"))
+
+    def test_merge_rewrites_files_after_commit(self) -> None:
+        target = SubCategory.objects.create(
+            owner=self.user, name="Яндекс", category=self.category
+        )
+        source_id = self.subcategory.pk
+        path = archive.archive_path(date(2001, 1, 1))
+        with self.captureOnCommitCallbacks() as callbacks:
+            merge.merge_subcategories(self.subcategory, target)
+        # До фиксации меняются только итоги, файл остается прежним
+        self.assertEqual(
+            set(CashFlowRollup.objects.values_list("subcategory_id", flat=True)),
+            {target.pk},
+        )
+        self.assertEqual(self.archived_values(path, "subcategory_id"), {source_id})
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.archived_values(path, "subcategory_id"), {target.pk})
+        self.assertEqual(os.listdir(os.path.dirname(path)), [os.path.basename(path)])
+
+    def test_add_owner_column_to_legacy_file(self) -> None:
+        pa = archive._pyarrow()
+        path = archive.archive_path(date(2001, 1, 1))
+        table = pa.parquet.read_table(path)
+        pa.parquet.write_table(table.drop_columns(["owner_id"]), path)
+        self.assertEqual(archive.ArchiveFilter(owner=self.user.pk).read().num_rows, 0)
+
+        self.assertEqual(archive.add_owner_column(), 1)
+        self.assertEqual(archive.add_owner_column(), 0)
+        self.assertEqual(archive.ArchiveFilter(owner=self.user.pk).read().num_rows, 2)
+
+    def test_forecast_includes_archive(self) -> None:
+        result = forecast.build_forecast(
+            self.user, horizons=(30,), history_days=120, today=date(2001, 3, 31)
+        )
+        self.assertEqual(Decimal(result["current_balance"]), Decimal("-450.00"))
+        (category,) = result["horizons"]["30"]["by_category"]
+
+        # Без архивных записей в истории модель прогнозирует меньшие списания
+        with mock.patch.object(forecast.ArchiveFilter, "read", return_value=None):
+            live_only = forecast.build_forecast(
+                self.user, horizons=(30,), history_days=120, today=date(2001, 3, 31)
+            )
+        (live_category,) = live_only["horizons"]["30"]["by_category"]
+        self.assertGreater(Decimal(category["total"]), Decimal(live_category["total"]))
+
+    def test_usage_includes_archive(self) -> None:
+        categories = self.api.get("/api/categories/").json()
+        category = next(
+            item
+            for item in categories.get("results", categories)
+            if item["id"] == self.category.pk
+        )
+        self.assertEqual(category["operations_count"], 3)
+        self.assertEqual(Decimal(category["operations_total"]), Decimal("450.00"))
+        self.assertEqual(category["last_used"], "2001-03-01")
+
+        self.live.delete()
+        categories = self.api.get("/api/categories/").json()
+        category = next(
+            item
+            for item in categories.get("results", categories)
+            if item["id"] == self.category.pk
+        )
+        self.assertEqual(category["operations_count"], 2)
+        self.assertEqual(category["last_used"], "2001-01-20")
+
+    def test_period_stats_rejects_archived_months(self) -> None:
+        for path in [
+            "/api/cashflows/period_stats/",
+            "/api/async/cashflows/period_stats/",
+        ]:
+            with self.subTest(path=path):
+                client = self.api if "async" not in path else self.client
+                response = client.get(
+                    path + "?start_date=2001-01-01&end_date=2001-03-31"
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("01.2001", response.json()["error"])
+                response = client.get(
+                    path + "?start_date=2001-02-01&end_date=2001-03-31"
+                )
+                self.assertEqual(response.status_code, 200)
+
+    async def test_snapshot_includes_archive(self) -> None:
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get("/api/events/")
+        message = await anext(aiter(response.streaming_content))
+        if isinstance(message, bytes):
+            message = message.decode()
+        totals = json.loads(message.split("data: ", 1)[1])["totals"]
+        total = totals[str(self.operation_type.pk)]
+        self.assertEqual(Decimal(total["total"]), Decimal("450.00"))
+        self.assertEqual(total["count"], 3)
+
+
+class AnomalyTests(CashFlowTestMixin, TestCase):
+    """Выбросы сумм и всплески частоты по подкатегориям"""
+
+    def record(self, day: date, amount: str, **values: any) -> CashFlow:
+        return CashFlow.objects.create(
+            owner=self.user,
+            date=day,
+            status=self.status,
+            operation_type=self.operation_type,
+            category=self.category,
+            subcategory=self.subcategory,
+            amount=Decimal(amount),
+            **values,
+        )
+
+    def test_amounts_compared_in_base_currency(self) -> None:
+        ExchangeRate.objects.create(
+            currency="USD", date=date(2000, 1, 1), rate=Decimal("30")
+        )
+        for day in range(1, 11):
+            self.record(date(2001, 1, day), str(3000 + day))
+        usd = self.record(date(2001, 1, 11), "100.00", currency="USD")
+        spike = self.record(date(2001, 1, 12), "30000.00")
+
+        result = anomalies.detect_anomalies(CashFlow.objects.all())
+        self.assertEqual([item["id"] for item in result["outliers"]], [spike.pk])
+        self.assertNotIn(usd.pk, [item["id"] for item in result["outliers"]])
+        self.assertEqual(result["currency"], "RUB")
+
+    def test_missing_rate_is_reported(self) -> None:
+        self.record(date(2001, 1, 1), "10.00", currency="USD")
+        with self.assertRaisesMessage(ValueError, "Нет курса"):
+            anomalies.detect_anomalies(CashFlow.objects.all())
+
+    def test_frequency_before_1970(self) -> None:
+        for day in range(1, 11):
+            self.record(date(1969, 12, day), "100.00")
+        for _ in range(5):
+            self.record(date(1969, 12, 31), "100.00")
+
+        result = anomalies.detect_anomalies(CashFlow.objects.all())
+        self.assertEqual(
+            [
+                (item["subcategory"], item["date"], item["count"])
+                for item in result["frequency"]
+            ],
+            [(self.subcategory.pk, date(1969, 12, 31), 5)],
+        )
+
+
+class ReportTests(CashFlowTestMixin, TestCase):
+    """Сводная таблица и сравнение периодов: суммы строк и сальдо в итогах"""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.income_type = OperationType.objects.create(
+            owner=self.user, name="Поступление", is_income=True
+        )
+        self.income_category = Category.objects.create(
+            owner=self.user, name="Продажи", operation_type=self.income_type
+        )
+        self.income_subcategory = SubCategory.objects.create(
+            owner=self.user, name="Сайт", category=self.income_category
+        )
+        self.record(date(2001, 1, 10), "1000.00", income=True)
+        self.record(date(2001, 1, 20), "300.00")
+        self.record(date(2001, 2, 5), "200.00")
+
+    def record(self, day: date, amount: str, income: bool = False) -> CashFlow:
+        return CashFlow.objects.create(
+            owner=self.user,
+            date=day,
+            status=self.status,
+            operation_type=self.income_type if income else self.operation_type,
+            category=self.income_category if income else self.category,
+            subcategory=self.income_subcategory if income else self.subcategory,
+            amount=Decimal(amount),
+        )
+
+    def test_pivot_totals_are_net(self) -> None:
+        for rows in ["category", "subcategory"]:
+            with self.subTest(rows=rows):
+                pivot = self.api.get(
+                    "/api/cashflows/pivot/",
+                    {
+                        "rows": rows,
+                        "start_date": "2001-01-01",
+                        "end_date": "2001-02-28",
+                    },
+                ).json()
+                self.assertEqual(
+                    [(row["name"], row["is_income"]) for row in pivot["rows"]],
+                    (
+                        [("Маркетинг", False), ("Продажи", True)]
+                        if rows == "category"
+                        else [("Avito", False), ("Сайт", True)]
+                    ),
+                )
+                self.assertEqual(
+                    [[Decimal(value) for value in row] for row in pivot["values"]],
+                    [[Decimal("300"), Decimal("200")], [Decimal("1000"), Decimal("0")]],
+                )
+                self.assertEqual(
+                    [Decimal(value) for value in pivot["column_totals"]],
+                    [Decimal("700"), Decimal("-200")],
+                )
+                self.assertEqual(Decimal(pivot["grand_total"]), Decimal("500"))
+
+    def test_compare_totals_are_net(self) -> None:
+        result = self.api.get(
+            "/api/cashflows/compare/",
+            {
+                "dimension": "status",
+                "start_date": "2001-02-01",
+                "end_date": "2001-02-28",
+                "baseline": "mom",
+            },
+        ).json()
+        (row,) = result["rows"]
+        self.assertEqual(Decimal(row["current"]), Decimal("200"))
+        self.assertEqual(Decimal(row["baselines"]["mom"]["value"]), Decimal("1300"))
+        totals = result["totals"]
+        self.assertEqual(Decimal(totals["current"]), Decimal("-200"))
+        self.assertEqual(Decimal(totals["baselines"]["mom"]["value"]), Decimal("700"))
+        self.assertEqual(Decimal(totals["baselines"]["mom"]["delta"]), Decimal("-900"))
+
+
+class UsageTests(CashFlowTestMixin, TestCase):
+    """Статистика использования справочников"""
+
+    def test_operations_without_rate_are_counted(self) -> None:
+        for amount, currency in [("100.00", "RUB"), ("10.00", "USD")]:
+            CashFlow.objects.create(
+                owner=self.user,
+                date=date(2001, 1, 10),
+                status=self.status,
+                operation_type=self.operation_type,
+                category=self.category,
+                subcategory=self.subcategory,
+                amount=Decimal(amount),
+                currency=currency,
+            )
+        (category,) = self.api.get("/api/categories/").json()["results"]
+        self.assertEqual(category["operations_count"], 2)
+        self.assertEqual(Decimal(category["operations_total"]), Decimal("100.00"))
+        self.assertEqual(category["operations_unconverted"], 1)
+        response = self.client.get("/categories/")
+        self.assertContains(response, "Без курса валюты, не входят в сумму: 1")
+
+        ExchangeRate.objects.create(
+            currency="USD", date=date(2000, 1, 1), rate=Decimal("30")
+        )
+        (category,) = self.api.get("/api/categories/").json()["results"]
+        self.assertEqual(Decimal(category["operations_total"]), Decimal("400.00"))
+        self.assertEqual(category["operations_unconverted"], 0)
+
+
+class AsyncApiTests(CashFlowTestMixin, TestCase):
+    """Асинхронные endpoint'ы повторяют ответы DRF и видят только записи владельца"""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.records = [
+            CashFlow.objects.create(
+                owner=self.user,
+                date=date(2001, 1, day),
+                status=self.status,
+                operation_type=self.operation_type,
+                category=self.category,
+                subcategory=self.subcategory,
+                amount=Decimal("100.00"),
+            )
+            for day in (1, 2, 3)
+        ]
+        stranger = get_user_model().objects.create_user("stranger", password="x")
+        operation_type = OperationType.objects.create(owner=stranger, name="Списание")
+        category = Category.objects.create(
+            owner=stranger, name="Еда", operation_type=operation_type
+        )
+        self.foreign = CashFlow.objects.create(
+            owner=stranger,
+            date=date(2001, 1, 2),
+            status=Status.objects.create(owner=stranger, name="Личное"),
+            operation_type=operation_type,
+            category=category,
+            subcategory=SubCategory.objects.create(
+                owner=stranger, name="Кафе", category=category
+            ),
+            amount=Decimal("5.00"),
+        )
+
+    async def test_list_matches_drf(self) -> None:
+        await self.async_client.aforce_login(self.user)
+        query = "?start_date=2001-01-01&end_date=2001-01-31"
+        response = await self.async_client.get("/api/async/cashflows/" + query)
+        self.assertEqual(response.status_code, 200)
+        expected = await sync_to_async(
+            lambda: self.api.get("/api/cashflows/" + query).json()
+        )()
+        result = response.json()
+        self.assertEqual(result["count"], 3)
+        self.assertEqual(
+            [item["id"] for item in result["results"]],
+            [item["id"] for item in expected["results"]],
+        )
+
+    async def test_detail_is_owner_scoped(self) -> None:
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(
+            f"/api/async/cashflows/{self.records[0].pk}/"
+        )
+        self.assertEqual(response.json()["id"], self.records[0].pk)
+        response = await self.async_client.get(
+            f"/api/async/cashflows/{self.foreign.pk}/"
+        )
+        self.assertEqual(response.status_code, 404)
+
+    async def test_reference_tree(self) -> None:
+        await self.async_client.aforce_login(self.user)
+        tree = (await self.async_client.get("/api/async/references/")).json()
+        self.assertEqual(tree["statuses"], [{"id": self.status.pk, "name": "Бизнес"}])
+        (operation_type,) = tree["operation_types"]
+        (category,) = operation_type["categories"]
+        self.assertEqual(
+            category["subcategories"],
+            [{"id": self.subcategory.pk, "name": "Avito"}],
+        )
+
+
+class RecurringTests(CashFlowTestMixin, TestCase):
+    """Создание операций по шаблонам регулярных операций"""
+
+    def template(self, **values: any) -> RecurringOperation:
+        return RecurringOperation.objects.create(
+            owner=self.user,
+            name="Аренда",
+            status=self.status,
+            operation_type=self.operation_type,
+            category=self.category,
+            subcategory=self.subcategory,
+            amount=Decimal("100.00"),
+            **values,
+        )
+
+    def test_materialize_catches_up_and_is_idempotent(self) -> None:
+        template = self.template(
+            start_date=date(2001, 1, 31), end_date=date(2001, 4, 30)
+        )
+        budget = Budget.objects.create(
+            category=self.category, month=date(2001, 2, 1), limit=Decimal("1000")
+        )
+        result = recurring.materialize(date(2001, 3, 15))
+        self.assertEqual((result["created"], result["templates"]), (2, 1))
+        self.assertEqual(
+            list(template.occurrences.order_by("date").values_list("date", flat=True)),
+            [date(2001, 1, 31), date(2001, 2, 28)],
+        )
+        template.refresh_from_db()
+        self.assertEqual(template.next_date, date(2001, 3, 31))
+        budget.refresh_from_db()
+        self.assertEqual(budget.spent, Decimal("100.00"))
+
+        self.assertEqual(recurring.materialize(date(2001, 3, 15))["templates"], 0)
+        recurring.materialize(date(2001, 5, 1))
+        template.refresh_from_db()
+        self.assertEqual(template.occurrences.count(), 4)
+        self.assertFalse(template.is_active)
+
+    def test_invalid_template_is_reported(self) -> None:
+        RecurringOperation.objects.create(
+            owner=self.user,
+            name="Пустая",
+            status=self.status,
+            operation_type=self.operation_type,
+            category=self.category,
+            subcategory=self.subcategory,
+            amount=Decimal("0"),
+            start_date=date(2001, 1, 1),
+        )
+        result = recurring.materialize(date(2001, 1, 1))
+        self.assertEqual((result["created"], len(result["errors"])), (0, 1))
+        self.assertFalse(CashFlow.objects.exists())
+
+
+class ForecastTests(CashFlowTestMixin, TestCase):
+    """Прогноз остатка: текущий остаток, шаблоны и согласованность рядов"""
+
+    def setUp(self) -> None:
+        super().setUp()
+        income_type = OperationType.objects.create(
+            owner=self.user, name="Поступление", is_income=True
+        )
+        category = Category.objects.create(
+            owner=self.user, name="Продажи", operation_type=income_type
+        )
+        self.income = {
+            "operation_type": income_type,
+            "category": category,
+            "subcategory": SubCategory.objects.create(
+                owner=self.user, name="Сайт", category=category
+            ),
+        }
+        RecurringOperation.objects.create(
+            owner=self.user,
+            name="Аренда",
+            status=self.status,
+            operation_type=self.operation_type,
+            category=self.category,
+            subcategory=self.subcategory,
+            amount=Decimal("100.00"),
+            start_date=date(2001, 4, 1),
+        )
+
+    def record(self, day: date, amount: str, income: bool = False) -> CashFlow:
+        expense = {
+            "operation_type": self.operation_type,
+            "category": self.category,
+            "subcategory": self.subcategory,
+        }
+        return CashFlow.objects.create(
+            owner=self.user,
+            date=day,
+            status=self.status,
+            amount=Decimal(amount),
+            **(self.income if income else expense),
+        )
+
+    def forecast(self) -> dict[str, any]:
+        return forecast.build_forecast(
+            self.user, horizons=(30,), history_days=90, today=date(2001, 3, 31)
+        )
+
+    def test_recurring_without_history(self) -> None:
+        result = self.forecast()
+        self.assertEqual(Decimal(result["current_balance"]), Decimal("0.00"))
+        outflow = [Decimal(day["outflow"]) for day in result["daily"]]
+        self.assertEqual(outflow[0], Decimal("100.00"))
+        self.assertEqual(sum(outflow[1:]), Decimal("0"))
+        self.assertEqual(
+            Decimal(result["horizons"]["30"]["balance"]), Decimal("-100.00")
+        )
+
+    def test_balance_and_daily_series_agree(self) -> None:
+        for day in range(1, 29):
+            self.record(date(2001, 2, day), "10.00")
+            self.record(date(2001, 3, day), "30.00", income=True)
+        result = self.forecast()
+        self.assertEqual(Decimal(result["current_balance"]), Decimal("560.00"))
+        daily = result["daily"]
+        self.assertGreater(Decimal(daily[0]["outflow"]), Decimal("100.00"))
+        self.assertGreater(sum(Decimal(day["inflow"]) for day in daily), 0)
+        self.assertEqual(result["horizons"]["30"]["balance"], daily[-1]["balance"])
+
+
+class ReconciliationTests(CashFlowTestMixin, TestCase):
+    """Сверка выписки: поиск кандидатов и сопоставление один к одному"""
+
+    def test_candidate_pairs_match_brute_force(self) -> None:
+        generator = np.random.default_rng(7)
+        statement_days = generator.integers(0, 60, 200)
+        statement_cents = generator.integers(0, 5_000, 200)
+        ledger_days = generator.integers(-10, 70, 500)
+        ledger_cents = generator.integers(0, 5_000, 500)
+        lines, rows = reconciliation.candidate_pairs(
+            statement_days, statement_cents, ledger_days, ledger_cents, 3, 25
+        )
+        expected = {
+            (line, row)
+            for line in range(200)
+            for row in range(500)
+            if abs(statement_days[line] - ledger_days[row]) <= 3
+            and abs(statement_cents[line] - ledger_cents[row]) <= 25
+        }
+        self.assertEqual(set(zip(lines.tolist(), rows.tolist())), expected)
+        self.assertEqual(len(lines), len(expected))
+
+    def test_reconcile(self) -> None:
+        def record(day: int, amount: str, comment: str = "") -> CashFlow:
+            return CashFlow.objects.create(
+                owner=self.user,
+                date=date(2001, 1, day),
+                status=self.status,
+                operation_type=self.operation_type,
+                category=self.category,
+                subcategory=self.subcategory,
+                amount=Decimal(amount),
+                comment=comment,
+            )
+
+        avito = record(10, "100.00", "Оплата Avito")
+        first, second = record(10, "250.00"), record(12, "250.00")
+        extra = record(14, "75.00")
+        lines = reconciliation.load_statement(
+            "date;amount;description\n"
+            "11.01.2001;-100,00;AVITO оплата\n"
+            "11.01.2001;-250,00;\n"
+            "15.01.2001;-999,00;Неизвестно\n"
+        )
+        result = reconciliation.reconcile(
+            lines, queryset=CashFlow.objects.filter(owner=self.user)
+        )
+        self.assertEqual(
+            [(item["line"], item["cashflow_id"]) for item in result["matched"]],
+            [(2, avito.pk)],
+        )
+        (ambiguous,) = result["ambiguous"]
+        self.assertEqual(
+            {candidate["cashflow_id"] for candidate in ambiguous["candidates"]},
+            {first.pk, second.pk},
+        )
+        self.assertEqual([item["line"] for item in result["unmatched"]], [4])
+        self.assertEqual(result["unmatched_ledger"], [extra.pk])
+
+
+class MergeTests(CashFlowTestMixin, TestCase):
+    """Объединение категорий: перенос ссылок и сложение бюджетов"""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.target = Category.objects.create(
+            owner=self.user, name="Реклама", operation_type=self.operation_type
+        )
+        target_subcategory = SubCategory.objects.create(
+            owner=self.user, name="Баннеры", category=self.target
+        )
+        for category, subcategory, amount in [
+            (self.category, self.subcategory, "100.00"),
+            (self.target, target_subcategory, "50.00"),
+        ]:
+            CashFlow.objects.create(
+                owner=self.user,
+                date=date(2001, 5, 5),
+                status=self.status,
+                operation_type=self.operation_type,
+                category=category,
+                subcategory=subcategory,
+                amount=Decimal(amount),
+            )
+            Budget.objects.create(
+                category=category, month=date(2001, 5, 1), limit=Decimal(amount) * 2
+            )
+        Budget.objects.create(
+            category=self.category, month=date(2001, 6, 1), limit=Decimal("10.00")
+        )
+
+    def test_merge_categories(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            result = merge.merge_categories(self.category, self.target)
+        self.assertEqual(
+            (result["cashflows"], result["subcategories"], result["budgets"]),
+            (1, 1, 2),
+        )
+        self.assertFalse(Category.objects.filter(pk=self.category.pk).exists())
+        self.assertEqual(
+            set(CashFlow.objects.values_list("category_id", flat=True)),
+            {self.target.pk},
+        )
+        self.subcategory.refresh_from_db()
+        self.assertEqual(self.subcategory.category_id, self.target.pk)
+        self.assertEqual(
+            list(
+                Budget.objects.order_by("month").values_list(
+                    "category_id", "month", "limit", "spent"
+                )
+            ),
+            [
+                (
+                    self.target.pk,
+                    date(2001, 5, 1),
+                    Decimal("300.00"),
+                    Decimal("150.00"),
+                ),
+                (self.target.pk, date(2001, 6, 1), Decimal("10.00"), Decimal("0.00")),
+            ],
+        )
+
+    def test_merge_rejects_other_operation_type(self) -> None:
+        income = OperationType.objects.create(
+            owner=self.user, name="Поступление", is_income=True
+        )
+        other = Category.objects.create(
+            owner=self.user, name="Продажи", operation_type=income
+        )
+        with self.assertRaisesMessage(ValueError, "одного типа операции"):
+            merge.merge_categories(self.category, other)
+        self.assertTrue(Category.objects.filter(pk=self.category.pk).exists())
+
+
+class BulkTests(CashFlowTestMixin, TestCase):
+    """Массовые изменения записей одним UPDATE/DELETE с пересчетом бюджетов"""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.records = [
+            CashFlow.objects.create(
+                owner=self.user,
+                date=date(2001, 5, day),
+                status=self.status,
+                operation_type=self.operation_type,
+                category=self.category,
+                subcategory=self.subcategory,
+                amount=Decimal("100.00"),
+                comment="Длинный комментарий " * 20 if day == 1 else "",
+            )
+            for day in (1, 2, 3)
+        ]
+        self.budget = Budget.objects.create(
+            category=self.category, month=date(2001, 5, 1), limit=Decimal("1000")
+        )
+        self.target = Category.objects.create(
+            owner=self.user, name="Реклама", operation_type=self.operation_type
+        )
+        self.target_subcategory = SubCategory.objects.create(
+            owner=self.user, name="Баннеры", category=self.target
+        )
+        self.target_budget = Budget.objects.create(
+            category=self.target, month=date(2001, 5, 1), limit=Decimal("1000")
+        )
+
+    def spent(self) -> tuple[Decimal, Decimal]:
+        self.budget.refresh_from_db()
+        self.target_budget.refresh_from_db()
+        return self.budget.spent, self.target_budget.spent
+
+    def test_recategorize_moves_budget_spent(self) -> None:
+        queryset = CashFlow.objects.filter(pk__in=[r.pk for r in self.records[:2]])
+        # Без подкатегории переносятся только записи с подкатегорией цели
+        self.assertEqual(bulk.recategorize(queryset, self.target), (0, 2))
+        moved = bulk.recategorize(queryset, self.target, self.target_subcategory)
+        self.assertEqual(moved, (2, 0))
+        self.assertEqual(self.spent(), (Decimal("100.00"), Decimal("200.00")))
+
+    def test_delete_removes_notes_and_recounts(self) -> None:
+        self.assertEqual(CashFlowNote.objects.count(), 1)
+        self.assertEqual(bulk.delete(CashFlow.objects.filter(date__day__lte=2)), 2)
+        self.assertFalse(CashFlowNote.objects.exists())
+        self.assertEqual(self.spent(), (Decimal("100.00"), Decimal("0.00")))
+
+    def test_set_status_skips_foreign_status(self) -> None:
+        stranger = get_user_model().objects.create_user("stranger", password="x")
+        foreign = Status.objects.create(owner=stranger, name="Личное")
+        self.assertEqual(bulk.set_status(CashFlow.objects.all(), foreign), 0)
+        own = Status.objects.create(owner=self.user, name="Личное")
+        self.assertEqual(bulk.set_status(CashFlow.objects.all(), own), 3)
+
+
+@override_settings(CASHFLOW_CUBE_ENABLED=True)
+class CubeTests(CashFlowTestMixin, TestCase):
+    """Куб в памяти: срезы, точечные обновления и перезагрузка"""
+
+    def setUp(self) -> None:
+        super().setUp()
+        ExchangeRate.objects.create(
+            currency="USD", date=date(2000, 1, 1), rate=Decimal("30")
+        )
+        self.record(date(2001, 1, 10), "100.00")
+        self.record(date(2001, 1, 20), "10.00", currency="USD")
+        self.record(date(2001, 2, 1), "50.00")
+        self.addCleanup(setattr, ledger_cube, "loaded", False)
+
+    def record(self, day: date, amount: str, **values: any) -> CashFlow:
+        return CashFlow.objects.create(
+            owner=self.user,
+            date=day,
+            status=self.status,
+            operation_type=self.operation_type,
+            category=self.category,
+            subcategory=self.subcategory,
+            amount=Decimal(amount),
+            **values,
+        )
+
+    def months(self) -> dict[date, tuple[Decimal, int]]:
+        result = ledger_cube.query(CubeQuery(group_by=("month",), owner=self.user.pk))
+        return {
+            group["month"]: (group["amount"], group["count"])
+            for group in result["groups"]
+        }
+
+    def test_query_in_base_currency(self) -> None:
+        self.assertEqual(
+            self.months(),
+            {
+                date(2001, 1, 1): (Decimal("400.00"), 2),
+                date(2001, 2, 1): (Decimal("50.00"), 1),
+            },
+        )
+        response = self.api.get(
+            "/api/cashflows/cube/", {"group_by": "category", "start_date": "2001-02-01"}
+        ).json()
+        self.assertEqual(
+            response["groups"],
+            [{"category": self.category.pk, "amount": 50.0, "count": 1}],
+        )
+
+    def test_saved_record_is_applied_without_reload(self) -> None:
+        self.months()
+        with mock.patch.object(ledger_cube, "load", wraps=ledger_cube.load) as load:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.record(date(2001, 2, 2), "25.00")
+            self.assertEqual(self.months()[date(2001, 2, 1)], (Decimal("75.00"), 2))
+            load.assert_not_called()
+
+    def test_bulk_change_reloads(self) -> None:
+        self.months()
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk.delete(CashFlow.objects.filter(date__month=1))
+        self.assertEqual(self.months(), {date(2001, 2, 1): (Decimal("50.00"), 1)})
+
+
+class MinorUnitsTests(CashFlowTestMixin, TestCase):
+    """Колонка целых копеек и суммирование в режиме хранения minor"""
+
+    def test_amount_minor_follows_amount(self) -> None:
+        pk = self.api.post("/api/cashflows/", self.payload(amount="10.05")).json()["id"]
+        self.assertEqual(CashFlow.objects.get(pk=pk).amount_minor, 1005)
+        self.api.patch(f"/api/cashflows/{pk}/", {"amount": "0.99"})
+        self.assertEqual(CashFlow.objects.get(pk=pk).amount_minor, 99)
+
+    def test_minor_sums_match_numeric(self) -> None:
+        ExchangeRate.objects.create(
+            currency="USD", date=date(2000, 1, 1), rate=Decimal("33.3333")
+        )
+        for amount, code in (("0.10", "RUB"), ("0.20", "RUB"), ("1.07", "USD")):
+            self.api.post("/api/cashflows/", self.payload(amount=amount, currency=code))
+        totals = {}
+        for storage in ("decimal", "minor"):
+            with override_settings(CASHFLOW_AMOUNT_STORAGE=storage):
+                totals[storage] = CashFlow.objects.aggregate(
+                    total=amount_sum(), raw=amount_sum(convert=False)
+                )
+        self.assertEqual(totals["minor"], totals["decimal"])
+        self.assertEqual(totals["minor"]["total"], Decimal("35.97"))
+
+
+class SchemaTests(TestCase):
+    """Схема OpenAPI генерируется один раз и отдается с ETag"""
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(CASHFLOW_SCHEMA_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        schema._schema = None
+        self.addCleanup(setattr, schema, "_schema", None)
+
+    def test_generated_once_and_cached(self) -> None:
+        with mock.patch.object(schema, "generate", wraps=schema.generate) as generate:
+            first = self.client.get("/swagger.json/")
+            second = self.client.get("/swagger.yaml/")
+            schema._schema = None
+            third = self.client.get("/swagger.json/")
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("paths", json.loads(first.content))
+        self.assertEqual(second["Content-Type"], "application/yaml")
+        self.assertEqual(third.content, first.content)
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            [f"openapi-{schema.code_version()}.{fmt}" for fmt in ("json", "yaml")],
+        )
+
+    def test_etag(self) -> None:
+        response = self.client.get("/swagger.json/")
+        etag = response["ETag"]
+        self.assertEqual(
+            self.client.get("/swagger.json/", HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        self.assertNotEqual(self.client.get("/swagger.yaml/")["ETag"], etag)
+
+    def test_stale_versions_removed(self) -> None:
+        stale = os.path.join(self.directory, "openapi-0000000000000000.json")
+        with open(stale, "w") as file:
+            file.write("{}")
+        schema_version, generated = schema.write()
+        self.assertTrue(generated)
+        self.assertFalse(os.path.exists(stale))
+        self.assertEqual(schema.write(), (schema_version, False))
+
+
+class OwnerScopeTests(CashFlowTestMixin, TestCase):
+    """Пользователь видит и меняет только свои записи и справочники"""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.own = CashFlow.objects.create(
+            owner=self.user,
+            date=date(2001, 5, 5),
+            status=self.status,
+            operation_type=self.operation_type,
+            category=self.category,
+            subcategory=self.subcategory,
+            amount=Decimal("100.00"),
+        )
+        self.stranger = get_user_model().objects.create_user("stranger", password="x")
+        # Одноименные справочники другого пользователя допустимы
+        self.foreign_status = Status.objects.create(owner=self.stranger, name="Бизнес")
+        operation_type = OperationType.objects.create(
+            owner=self.stranger, name="Списание"
+        )
+        self.foreign_category = Category.objects.create(
+            owner=self.stranger, name="Маркетинг", operation_type=operation_type
+        )
+        self.foreign = CashFlow.objects.create(
+            owner=self.stranger,
+            date=date(2001, 5, 5),
+            status=self.foreign_status,
+            operation_type=operation_type,
+            category=self.foreign_category,
+            subcategory=SubCategory.objects.create(
+                owner=self.stranger, name="Avito", category=self.foreign_category
+            ),
+            amount=Decimal("7.00"),
+        )
+
+    def test_lists_show_own_rows(self) -> None:
+        response = self.api.get("/api/cashflows/").json()
+        self.assertEqual([item["id"] for item in response["results"]], [self.own.pk])
+        statuses = self.api.get("/api/statuses/").json()
+        self.assertEqual([item["id"] for item in statuses["results"]], [self.status.pk])
+
+    def test_foreign_record_not_found(self) -> None:
+        url = f"/api/cashflows/{self.foreign.pk}/"
+        self.assertEqual(self.api.get(url).status_code, 404)
+        self.assertEqual(self.api.patch(url, {"amount": "1.00"}).status_code, 404)
+        self.assertEqual(self.api.delete(url).status_code, 404)
+        self.assertEqual(
+            self.client.get(
+                reverse("cashflow:cashflow-update", args=[self.foreign.pk])
+            ).status_code,
+            404,
+        )
+        self.foreign.refresh_from_db()
+        self.assertEqual(self.foreign.amount, Decimal("7.00"))
+
+    def test_foreign_references_rejected(self) -> None:
+        response = self.api.post(
+            "/api/cashflows/", self.payload(status=self.foreign_status.pk)
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("status", response.json())
+        response = self.api.patch(
+            f"/api/cashflows/{self.own.pk}/", {"category": self.foreign_category.pk}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.own.refresh_from_db()
+        self.assertEqual(self.own.category, self.category)
+
+    def test_anonymous_rejected(self) -> None:
+        self.api.force_authenticate(None)
+        self.assertIn(self.api.get("/api/cashflows/").status_code, (401, 403))
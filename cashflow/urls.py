@@ -27,6 +27,29 @@ router.register(r"categories", CategoryViewSet, basename="category")
 router.register(r"subcategories", SubCategoryViewSet, basename="subcategory")
 
 urlpatterns = [
+    # Асинхронные read-only endpoints для работы под ASGI
+    path(
+        "api/async/cashflows/",
+        views.cashflow_list_async,
+        name="async-cashflow-list",
+    ),
+    path(
+        "api/async/cashflows/period_stats/",
+        views.period_stats_async,
+        name="async-cashflow-period-stats",
+    ),
+    path(
+        "api/async/cashflows/<int:pk>/",
+        views.cashflow_detail_async,
+        name="async-cashflow-detail",
+    ),
+    path(
+        "api/async/references/",
+        views.reference_tree_async,
+        name="async-reference-tree",
+    ),
+    # Поток изменений ДДС (Server-Sent Events)
+    path("api/events/", views.cashflow_events, name="cashflow-events"),
     path("api/", include(router.urls)),
     # Главная страница со списком записей
     path("", CashFlowListView.as_view(), name="cashflow-list"),
@@ -34,6 +57,10 @@ urlpatterns = [
     path("create/", CashFlowCreateView.as_view(), name="cashflow-create"),
     path("<int:pk>/edit/", CashFlowUpdateView.as_view(), name="cashflow-update"),
     path("<int:pk>/delete/", CashFlowDeleteView.as_view(), name="cashflow-delete"),
+    # Отчеты
+    path("reports/pivot/", views.PivotReportView.as_view(), name="pivot-report"),
+    path("reports/forecast/", views.ForecastView.as_view(), name="forecast"),
+    path("reports/budgets/", views.BudgetReportView.as_view(), name="budget-report"),
     # CRUD операции для статуса операций
     path("statuses/", StatusListView.as_view(), name="status-list"),
     path("statuses/create/", StatusCreateView.as_view(), name="status-create"),
@@ -71,6 +98,11 @@ urlpatterns = [
         CategoryDeleteView.as_view(),
         name="category-delete",
     ),
+    path(
+        "categories/<int:pk>/merge/",
+        views.CategoryMergeView.as_view(),
+        name="category-merge",
+    ),
     # CRUD операции для подкатегорий
     path("subcategories/", SubCategoryListView.as_view(), name="subcategory-list"),
     path(
@@ -88,6 +120,11 @@ urlpatterns = [
         SubCategoryDeleteView.as_view(),
         name="subcategory-delete",
     ),
+    path(
+        "subcategories/<int:pk>/merge/",
+        views.SubCategoryMergeView.as_view(),
+        name="subcategory-merge",
+    ),
     # API endpoint для динамической загрузки
     path(
         "get-categories/<int:operation_type_id>/",
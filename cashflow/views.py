@@ -1,29 +1,193 @@
-from datetime import datetime
-
+import asyncio
+import json
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache, wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.messages.views import SuccessMessageMixin
 from django.core.exceptions import ValidationError
-from django.db.models import QuerySet
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import Count, ProtectedError, QuerySet, Sum
+from django.db.models.lookups import IsNull
+from django.http import (Http404, HttpRequest, HttpResponse, JsonResponse,
+                         StreamingHttpResponse)
+from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse_lazy
 from django.utils import timezone
-from django.views.generic import CreateView, DeleteView, ListView, UpdateView
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.views.generic import (CreateView, DeleteView, FormView, ListView,
+                                  TemplateView, UpdateView)
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
+from rest_framework.filters import OrderingFilter
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.response import Response
 from rest_framework.serializers import Serializer
 from rest_framework.viewsets import ModelViewSet
 
 from . import serializers
-from .forms import (CashFlowForm, CategoryForm, OperationTypeForm,
-                    SubCategoryForm)
-from .models import CashFlow, Category, OperationType, Status, SubCategory
+from .forms import (CashFlowForm, CategoryForm, MergeForm, OperationTypeForm,
+                    StatusForm, SubCategoryForm)
+from .models import (CashFlow, CashFlowRollup, Category, OperationType, Status,
+                     SubCategory)
 from .serializers import (CashFlowSerializer, CategorySerializer,
                           OperationTypeSerializer, StatusSerializer,
                           SubCategorySerializer)
+from .services import events
+from .services.archive import ArchiveFilter, ensure_not_archived
+from .services.budgets import budget_report
+from .services.conditional import cashflow_etag
+from .services.currency import (amount_field, amount_sum, base_currency,
+                                converted_amount, normalize_currency)
+from .services.idempotency import run_idempotent
+from .services.imports import fingerprint_of, import_records
+from .services.merge import merge, merge_preview
+from .services.reports import (build_pivot, compare_periods, filter_cashflows,
+                               parse_baseline, parse_date, parse_month)
+from .services.schema import FORMATS as SCHEMA_FORMATS
+from .services.schema import api_info, get_schema
+from .services.usage import SORT_FIELDS, order_by_usage, with_usage
 from .services.validators import CashFlowValidator
 
+# Сервисы на NumPy (аномалии, прогноз, сверка, куб) импортируются внутри
+# обработчиков: воркер стартует и отвечает на первый запрос без загрузки NumPy
+
+# Интервал (в секундах) между keep-alive комментариями в SSE-потоке
+SSE_HEARTBEAT = 15
+
+
+class OwnerMixin(LoginRequiredMixin):
+    """
+    Данные текущего пользователя: страница доступна после входа, а выборка
+    ограничена записями, владелец которых — пользователь запроса.
+    """
+
+    def get_queryset(self) -> QuerySet:
+        return super().get_queryset().filter(owner=self.request.user)
+
+
+class OwnerFormMixin(OwnerMixin):
+    """Форма создания и редактирования со справочниками текущего пользователя"""
+
+    def get_form_kwargs(self) -> dict[str, any]:
+        return {**super().get_form_kwargs(), "owner": self.request.user}
+
+
+class BudgetFormMixin:
+    """
+    Сохранение записи ДДС из CashFlowForm: предупреждения о бюджетах — в
+    сообщения. Превышение бюджета с запретом, обнаруженное при сохранении
+    по заблокированным счетчикам (параллельная запись успела увеличить
+    расход), показывается как ошибка формы.
+    """
+
+    def form_valid(self, form: CashFlowForm) -> HttpResponse:
+        try:
+            response = super().form_valid(form)
+        except ValidationError as e:
+            form.add_error(None, e)
+            return self.form_invalid(form)
+        for warning in form.budget_warnings:
+            messages.warning(self.request, warning)
+        return response
+
+
+def sync_ingested(owner_id: int) -> None:
+    """
+    Чтение своих записей: записи пользователя, принятые в буфер записи
+    этого процесса, фиксируются до выборки (см. services/ingest.py).
+    """
+    if settings.CASHFLOW_INGEST_ENABLED:
+        from .services.ingest import sync_owner
+
+        sync_owner(owner_id)
+
+
+def owner_required(view):
+    """
+    Асинхронный endpoint только для вошедших пользователей. Пользователь
+    загружается заранее (request.auser), и выборки фильтруются по владельцу
+    без синхронных обращений к базе.
+    """
+
+    @wraps(view)
+    async def wrapper(request: HttpRequest, *args: any, **kwargs: any):
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return JsonResponse(
+                {"detail": "Учетные данные не были предоставлены."}, status=401
+            )
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def _cashflow_etag(request, variant: str | None = None) -> str | None:
+    """
+    ETag ответа с записями пользователя. Записи из буфера записи
+    фиксируются заранее, чтобы они вошли в версию данных.
+    """
+    sync_ingested(request.user.pk)
+    renderer = getattr(request, "accepted_renderer", None)
+    if renderer is not None:
+        variant = renderer.format
+    if variant is None:
+        # HTML-страница показывает одноразовые сообщения и CSRF-токен сессии
+        if len(messages.get_messages(request)):
+            return None
+        variant = request.session.session_key
+    return cashflow_etag(request.user.pk, request.get_full_path(), variant)
+
+
+def cashflow_conditional(view):
+    """
+    Условный GET для ответов с записями ДДС (список, запись, period_stats).
+
+    ETag считается по версиям данных, без выборки записей, и запрос с
+    совпадающим If-None-Match получает 304 без основного запроса и
+    сериализации. Ответ помечается private, no-cache: браузер хранит его,
+    но перед использованием переспрашивает сервер.
+    """
+
+    def finish(request, response: HttpResponse, etag: str | None) -> HttpResponse:
+        if etag and response.status_code in (200, 304):
+            response.headers.setdefault("ETag", etag)
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
 
-class CashFlowListView(ListView):
+    if iscoroutinefunction(view):
+
+        @wraps(view)
+        async def async_wrapper(request, *args: any, **kwargs: any):
+            etag = await sync_to_async(_cashflow_etag)(request, "json")
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            return finish(request, response, etag)
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args: any, **kwargs: any):
+        etag = _cashflow_etag(request)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = view(request, *args, **kwargs)
+        return finish(request, response, etag)
+
+    return wrapper
+
+
+@method_decorator(cashflow_conditional, name="get")
+class CashFlowListView(OwnerMixin, ListView):
     """Представление для отображения списка всех записей ДДС с возможностью фильтрации"""
 
     model: CashFlow = CashFlow
@@ -38,6 +202,7 @@ class CashFlowListView(ListView):
         Returns:
             QuerySet[CashFlow]: Набор записей ДДС, отфильтрованный по параметрам
         """
+        sync_ingested(self.request.user.pk)
         queryset = super().get_queryset()
 
         # Фильтрация по датам
@@ -55,7 +220,7 @@ class CashFlowListView(ListView):
         # Сортировка
         sort = self.request.GET.get("sort")
         if sort in ["date", "-date", "amount", "-amount"]:
-            queryset = queryset.order_by(sort)
+            queryset = queryset.order_by(sort.replace("amount", amount_field()))
         else:
             queryset = queryset.order_by("-date")  # Сортировка по умолчанию
 
@@ -72,21 +237,37 @@ class CashFlowListView(ListView):
             dict[str, any]: Контекст шаблона с дополнительными данными
         """
         context: dict[str, any] = super().get_context_data(**kwargs)
-        context["statuses"] = Status.objects.all()
-        context["operation_types"] = OperationType.objects.all()
+        context["statuses"] = Status.objects.filter(owner=self.request.user)
+        context["operation_types"] = OperationType.objects.filter(
+            owner=self.request.user
+        )
         context["current_sort"] = self.request.GET.get("sort", "")
         return context
 
 
-def get_categories(request, operation_type_id):
-    categories = Category.objects.filter(operation_type_id=operation_type_id).order_by(
-        "name"
+@owner_required
+async def get_categories(request: HttpRequest, operation_type_id: int) -> JsonResponse:
+    """
+    API endpoint для получения категорий по выбранному типу операции.
+
+    Args:
+        request: HTTP-запрос
+        operation_type_id: ID выбранного типа операции
+
+    Returns:
+        JsonResponse: Список категорий в формате JSON
+    """
+    categories = (
+        Category.objects.filter(operation_type_id=operation_type_id, owner=request.user)
+        .order_by("name")
+        .values("id", "name")
     )
-    data = [{"id": c.id, "name": c.name} for c in categories]
+    data = [c async for c in categories]
     return JsonResponse(data, safe=False)
 
 
-def get_subcategories(request: HttpRequest, category_id: int) -> JsonResponse:
+@owner_required
+async def get_subcategories(request: HttpRequest, category_id: int) -> JsonResponse:
     """
     API endpoint для получения подкатегорий по выбранной категории.
 
@@ -97,12 +278,16 @@ def get_subcategories(request: HttpRequest, category_id: int) -> JsonResponse:
     Returns:
         JsonResponse: Список подкатегорий в формате JSON
     """
-    subcategories = SubCategory.objects.filter(category_id=category_id).order_by("name")
-    data = [{"id": s.id, "name": s.name} for s in subcategories]
+    subcategories = (
+        SubCategory.objects.filter(category_id=category_id, owner=request.user)
+        .order_by("name")
+        .values("id", "name")
+    )
+    data = [s async for s in subcategories]
     return JsonResponse(data, safe=False)
 
 
-class CashFlowCreateView(CreateView):
+class CashFlowCreateView(OwnerFormMixin, BudgetFormMixin, CreateView):
     """Представление для создания новой записи ДДС"""
 
     model: CashFlow = CashFlow
@@ -110,23 +295,11 @@ class CashFlowCreateView(CreateView):
     template_name: str = "cashflow/cashflow_form.html"
     success_url: str = "/"
 
-    def form_valid(self, form: CashFlowForm) -> HttpResponse:
-        """
-        Обработка валидной формы.
 
-        Args:
-            form: Валидная форма CashFlowForm
-
-        Returns:
-            HttpResponse: Результат обработки формы
-        """
-        return super().form_valid(form)
-
-
-class CashFlowDeleteView(LoginRequiredMixin, SuccessMessageMixin, DeleteView):
+class CashFlowDeleteView(OwnerMixin, SuccessMessageMixin, DeleteView):
     """
     Представление для удаления записи о движении денежных средств.
-    Требует авторизации пользователя.
+    Требует авторизации пользователя; удалить можно только свою запись.
     """
 
     model: CashFlow = CashFlow
@@ -134,23 +307,14 @@ class CashFlowDeleteView(LoginRequiredMixin, SuccessMessageMixin, DeleteView):
     success_message: str = "Запись успешно удалена"
     template_name: str = "cashflow/cashflow_confirm_delete.html"
 
-    def get_queryset(self) -> QuerySet[CashFlow]:
-        """
-        Возвращает QuerySet с дополнительными проверками прав доступа.
 
-        Returns:
-            QuerySet[CashFlow]: Отфильтрованный queryset
-        """
-        queryset = super().get_queryset()
-        if not self.request.user.is_superuser:
-            queryset = queryset.filter(user=self.request.user)
-        return queryset
-
-
-class CashFlowUpdateView(LoginRequiredMixin, SuccessMessageMixin, UpdateView):
+class CashFlowUpdateView(
+    OwnerFormMixin, BudgetFormMixin, SuccessMessageMixin, UpdateView
+):
     """
     Представление для редактирования существующей записи ДДС.
-    Использует сервисный слой для валидации данных.
+    Использует сервисный слой для валидации данных; изменить можно только
+    свою запись.
     """
 
     model: CashFlow = CashFlow
@@ -165,13 +329,6 @@ class CashFlowUpdateView(LoginRequiredMixin, SuccessMessageMixin, UpdateView):
         initial["date"] = timezone.now().date()
         return initial
 
-    def get_queryset(self) -> QuerySet[CashFlow]:
-        """Ограничиваем доступ только к своим записям"""
-        queryset = super().get_queryset()
-        if not self.request.user.is_superuser:
-            queryset = queryset.filter(user=self.request.user)
-        return queryset
-
     def get_context_data(self, **kwargs: any) -> dict[str, any]:
         """Добавляем дополнительные данные в контекст"""
         context = super().get_context_data(**kwargs)
@@ -179,21 +336,146 @@ class CashFlowUpdateView(LoginRequiredMixin, SuccessMessageMixin, UpdateView):
         context["title"] = f"Редактирование записи #{self.object.id}"
         return context
 
-    def form_valid(self, form: CashFlowForm) -> HttpResponse:
-        """Дополнительная обработка перед сохранением"""
-        form.instance.user = self.request.user
+
+# Отчеты
+
+
+class PivotReportView(LoginRequiredMixin, TemplateView):
+    """
+    Сводный отчет «категории/подкатегории × месяцы» с итогами.
+
+    Параметры запроса: rows (category или subcategory), start_date, end_date,
+    status, operation_type и currency (валюта отчета, по умолчанию базовая).
+    Матрица строится одним группирующим запросом.
+    """
+
+    template_name: str = "cashflow/pivot_report.html"
+
+    def get_context_data(self, **kwargs: any) -> dict[str, any]:
+        """Добавляет в контекст сводную таблицу и справочники для фильтров"""
+        context = super().get_context_data(**kwargs)
+        params = self.request.GET
+        owner = self.request.user
+        row_type = params.get("rows", "category")
         try:
-            CashFlowValidator.validate_all(form.cleaned_data)
-        except ValidationError as e:
-            form.add_error(None, e)
-            return self.form_invalid(form)
-        return super().form_valid(form)
+            pivot = build_pivot(
+                filter_cashflows(CashFlow.objects.filter(owner=owner), params),
+                row_type,
+                parse_date(params.get("start_date")),
+                parse_date(params.get("end_date")),
+                params.get("currency"),
+                ArchiveFilter.from_params(params, owner=owner.pk),
+            )
+        except ValueError as e:
+            context["error"] = str(e)
+            pivot = None
+        context["pivot"] = pivot
+        context["table_rows"] = pivot.table_rows() if pivot else []
+        context["row_type"] = row_type
+        context["currency"] = pivot.currency if pivot else params.get("currency", "")
+        context["statuses"] = Status.objects.filter(owner=owner)
+        context["operation_types"] = OperationType.objects.filter(owner=owner)
+        return context
+
+
+def _forecast_params(params) -> tuple[tuple[int, ...], int]:
+    """
+    Горизонты и глубина истории прогноза из параметров запроса.
+
+    Raises:
+        ValueError: При некорректных значениях
+    """
+    from .services.forecast import HORIZONS
+
+    try:
+        horizons = tuple(int(value) for value in params.getlist("horizon")) or HORIZONS
+        history_days = int(params.get("history_days", 730))
+    except ValueError:
+        raise ValueError("Горизонт и глубина истории должны быть целыми числами")
+    if not all(0 < horizon <= 730 for horizon in horizons):
+        raise ValueError("Горизонт прогноза должен быть от 1 до 730 дней")
+    if not 28 <= history_days <= 3660:
+        raise ValueError("Глубина истории должна быть от 28 до 3660 дней")
+    return horizons, history_days
+
+
+def _forecast(params, owner) -> dict[str, any]:
+    """Прогноз владельца по параметрам запроса"""
+    from .services.forecast import get_forecast
+
+    return get_forecast(owner, *_forecast_params(params))
+
+
+class ForecastView(LoginRequiredMixin, TemplateView):
+    """
+    Прогноз остатка денежных средств на 30/90/180 дней.
+
+    Показывает прогнозный остаток на конец каждого горизонта и ожидаемые
+    суммы по типам операций и категориям. Прогноз берется из кэша и
+    пересчитывается только после изменения данных.
+    """
+
+    template_name: str = "cashflow/forecast.html"
+
+    def get_context_data(self, **kwargs: any) -> dict[str, any]:
+        """Добавляет в контекст прогноз"""
+        context = super().get_context_data(**kwargs)
+        try:
+            context["forecast"] = _forecast(self.request.GET, self.request.user)
+        except ValueError as e:
+            context["error"] = str(e)
+        return context
+
+
+class BudgetReportView(LoginRequiredMixin, TemplateView):
+    """
+    Бюджет и факт по категориям и подкатегориям за месяц.
+
+    Параметр запроса month (YYYY-MM, по умолчанию текущий месяц). Факт берется
+    из счетчиков бюджетов без суммирования таблицы ДДС.
+    """
+
+    template_name: str = "cashflow/budget_report.html"
+
+    def get_context_data(self, **kwargs: any) -> dict[str, any]:
+        """Добавляет в контекст месяц (YYYY-MM) и отчет по бюджетам"""
+        context = super().get_context_data(**kwargs)
+        context["month"] = self.request.GET.get("month", "")
+        try:
+            month = parse_month(context["month"]) or timezone.now().date()
+        except ValueError as e:
+            context["error"] = str(e)
+            return context
+        context["month"] = f"{month:%Y-%m}"
+        context["report"] = budget_report(month, self.request.user)
+        return context
 
 
 # CRUD для статуса операций
 
 
-class StatusListView(ListView):
+class UsageListMixin:
+    """
+    Число операций, сумма и дата последней операции для списков справочников.
+
+    Статистика считается одним группирующим запросом вместе со списком;
+    параметр sort (name, operations_count, operations_total, last_used,
+    «-» — по убыванию) задает сортировку.
+    """
+
+    def get_queryset(self) -> QuerySet:
+        queryset, self.sort = order_by_usage(
+            with_usage(super().get_queryset()), self.request.GET.get("sort")
+        )
+        return queryset
+
+    def get_context_data(self, **kwargs: any) -> dict[str, any]:
+        context = super().get_context_data(**kwargs)
+        context["sort"] = self.sort
+        return context
+
+
+class StatusListView(OwnerMixin, UsageListMixin, ListView):
     """Представление для отображения списка всех статусов.
 
     Attributes:
@@ -207,39 +489,39 @@ class StatusListView(ListView):
     context_object_name: str = "statuses"
 
 
-class StatusCreateView(CreateView):
+class StatusCreateView(OwnerFormMixin, CreateView):
     """Представление для создания нового статуса.
 
     Attributes:
         model: Модель Status для создания.
-        fields: Поля модели, доступные для редактирования.
+        form_class: Форма с проверкой уникальности названия у владельца.
         template_name: Путь к шаблону формы создания.
         success_url: URL для перенаправления после успешного создания.
     """
 
     model: Status = Status
-    fields: list[str] = ["name"]
+    form_class: StatusForm = StatusForm
     template_name: str = "cashflow/status_form.html"
     success_url: str = reverse_lazy("cashflow:status-list")
 
 
-class StatusUpdateView(UpdateView):
+class StatusUpdateView(OwnerFormMixin, UpdateView):
     """Представление для редактирования существующего статуса.
 
     Attributes:
         model: Модель Status для редактирования.
-        fields: Поля модели, доступные для редактирования.
+        form_class: Форма с проверкой уникальности названия у владельца.
         template_name: Путь к шаблону формы редактирования.
         success_url: URL для перенаправления после успешного обновления.
     """
 
     model: Status = Status
-    fields: list[str] = ["name"]
+    form_class: StatusForm = StatusForm
     template_name: str = "cashflow/status_form.html"
     success_url: str = reverse_lazy("cashflow:status-list")
 
 
-class StatusDeleteView(DeleteView):
+class StatusDeleteView(OwnerMixin, DeleteView):
     """Представление для удаления статуса.
 
     Attributes:
@@ -256,7 +538,7 @@ class StatusDeleteView(DeleteView):
 # CRUD для типа операций
 
 
-class OperationTypeListView(ListView):
+class OperationTypeListView(OwnerMixin, UsageListMixin, ListView):
     """Представление для отображения списка типов операций.
 
     Отображает все доступные типы операций (доходы/расходы) в систематизированном виде.
@@ -279,7 +561,7 @@ class OperationTypeListView(ListView):
     context_object_name: str = "operation_types"
 
 
-class OperationTypeCreateView(CreateView):
+class OperationTypeCreateView(OwnerFormMixin, CreateView):
     """Представление для создания нового типа операции.
 
     Обеспечивает валидацию уникальности имени типа операции через связанную форму.
@@ -302,7 +584,7 @@ class OperationTypeCreateView(CreateView):
     success_url: str = reverse_lazy("cashflow:operationtype-list")
 
 
-class OperationTypeUpdateView(UpdateView):
+class OperationTypeUpdateView(OwnerFormMixin, UpdateView):
     """Представление для редактирования существующего типа операции.
 
     Использует ту же форму валидации, что и при создании.
@@ -324,7 +606,7 @@ class OperationTypeUpdateView(UpdateView):
     success_url: str = reverse_lazy("cashflow:operationtype-list")
 
 
-class OperationTypeDeleteView(DeleteView):
+class OperationTypeDeleteView(OwnerMixin, DeleteView):
     """Представление для удаления типа операции.
 
     Выполняет проверку связанных объектов перед удалением.
@@ -353,7 +635,7 @@ class OperationTypeDeleteView(DeleteView):
 # CRUD для категорий
 
 
-class CategoryListView(ListView):
+class CategoryListView(OwnerMixin, UsageListMixin, ListView):
     """Представление для отображения списка категорий операций.
 
     Отображает иерархический список всех категорий, сгруппированных по типам операций.
@@ -378,7 +660,7 @@ class CategoryListView(ListView):
     context_object_name: str = "categories"
 
 
-class CategoryCreateView(CreateView):
+class CategoryCreateView(OwnerFormMixin, CreateView):
     """Представление для создания новой категории операций.
 
     Обеспечивает валидацию уникальности имени категории в рамках типа операции.
@@ -404,7 +686,7 @@ class CategoryCreateView(CreateView):
     success_url: str = reverse_lazy("cashflow:category-list")
 
 
-class CategoryUpdateView(UpdateView):
+class CategoryUpdateView(OwnerFormMixin, UpdateView):
     """Представление для редактирования существующей категории.
 
     Проверяет права доступа перед редактированием и валидирует уникальность имени.
@@ -430,7 +712,7 @@ class CategoryUpdateView(UpdateView):
     success_url: str = reverse_lazy("cashflow:category-list")
 
 
-class CategoryDeleteView(DeleteView):
+class CategoryDeleteView(OwnerMixin, DeleteView):
     """Представление для удаления категории операций.
 
     Выполняет каскадную проверку связанных объектов (подкатегории, транзакции).
@@ -454,11 +736,22 @@ class CategoryDeleteView(DeleteView):
     template_name: str = "cashflow/category_confirm_delete.html"
     success_url: str = reverse_lazy("cashflow:category-list")
 
+    def form_valid(self, form) -> HttpResponse:
+        """Используемую категорию предлагаем объединить с другой"""
+        try:
+            return super().form_valid(form)
+        except ProtectedError:
+            messages.error(
+                self.request,
+                "Категория используется в записях ДДС: выберите, куда их перенести",
+            )
+            return redirect("cashflow:category-merge", pk=self.object.pk)
+
 
 # CRUD для подкатегорий
 
 
-class SubCategoryListView(ListView):
+class SubCategoryListView(OwnerMixin, UsageListMixin, ListView):
     """
     Представление для отображения списка подкатегорий.
 
@@ -485,7 +778,7 @@ class SubCategoryListView(ListView):
         )
 
 
-class SubCategoryCreateView(CreateView):
+class SubCategoryCreateView(OwnerFormMixin, CreateView):
     """
     Представление для создания новой подкатегории.
 
@@ -501,7 +794,7 @@ class SubCategoryCreateView(CreateView):
     success_url: str = reverse_lazy("cashflow:subcategory-list")
 
 
-class SubCategoryUpdateView(UpdateView):
+class SubCategoryUpdateView(OwnerFormMixin, UpdateView):
     """
     Представление для редактирования существующей подкатегории.
 
@@ -517,7 +810,7 @@ class SubCategoryUpdateView(UpdateView):
     success_url: str = reverse_lazy("cashflow:subcategory-list")
 
 
-class SubCategoryDeleteView(DeleteView):
+class SubCategoryDeleteView(OwnerMixin, DeleteView):
     """
     Представление для удаления подкатегории.
 
@@ -531,11 +824,96 @@ class SubCategoryDeleteView(DeleteView):
     template_name: str = "cashflow/subcategory_confirm_delete.html"
     success_url: str = reverse_lazy("cashflow:subcategory-list")
 
+    def form_valid(self, form) -> HttpResponse:
+        """Используемую подкатегорию предлагаем объединить с другой"""
+        try:
+            return super().form_valid(form)
+        except ProtectedError:
+            messages.error(
+                self.request,
+                "Подкатегория используется в записях ДДС: выберите, куда их перенести",
+            )
+            return redirect("cashflow:subcategory-merge", pk=self.object.pk)
+
+
+class ReferenceMergeView(LoginRequiredMixin, FormView):
+    """
+    Объединение категории или подкатегории с другой.
+
+    На странице показывается, сколько записей ДДС, шаблонов, подкатегорий и
+    бюджетов будет перенесено; после подтверждения ссылки переносятся
+    массовыми UPDATE в одной транзакции, а исходный элемент удаляется.
+    Объединять можно только справочники текущего пользователя.
+    """
+
+    model = None
+    form_class: MergeForm = MergeForm
+    template_name: str = "cashflow/reference_merge.html"
+
+    def dispatch(self, request: HttpRequest, *args: any, **kwargs: any) -> HttpResponse:
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        self.object = get_object_or_404(self.model, pk=kwargs["pk"], owner=request.user)
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_form_kwargs(self) -> dict[str, any]:
+        return {**super().get_form_kwargs(), "source": self.object}
+
+    def get_context_data(self, **kwargs: any) -> dict[str, any]:
+        context = super().get_context_data(**kwargs)
+        context["object"] = self.object
+        context["preview"] = merge_preview(self.object)
+        context["cancel_url"] = self.success_url
+        return context
+
+    def form_valid(self, form: MergeForm) -> HttpResponse:
+        target = form.cleaned_data["target"]
+        try:
+            result = merge(self.object, target)
+        except ValueError as e:
+            form.add_error(None, str(e))
+            return self.form_invalid(form)
+        messages.success(
+            self.request,
+            f"«{self.object}» объединена с «{target}»: перенесено записей ДДС "
+            f"{result['cashflows']}, шаблонов {result['recurring']}",
+        )
+        return super().form_valid(form)
+
+
+class CategoryMergeView(ReferenceMergeView):
+    """Объединение категории с другой категорией того же типа операции"""
+
+    model: Category = Category
+    success_url: str = reverse_lazy("cashflow:category-list")
+
+
+class SubCategoryMergeView(ReferenceMergeView):
+    """Перенос записей подкатегории в другую подкатегорию и ее удаление"""
+
+    model: SubCategory = SubCategory
+    success_url: str = reverse_lazy("cashflow:subcategory-list")
+
 
 # ViewSets
 
 
-class CashFlowViewSet(ModelViewSet):
+class OwnerViewSetMixin:
+    """
+    Записи текущего пользователя; владельца новых записей задает сериализатор
+    """
+
+    def get_queryset(self) -> QuerySet:
+        queryset = super().get_queryset()
+        # Схема OpenAPI генерируется без запроса (см. generate_schema)
+        if getattr(self, "swagger_fake_view", False):
+            return queryset.none()
+        return queryset.filter(owner=self.request.user)
+
+
+@method_decorator(cashflow_conditional, name="list")
+@method_decorator(cashflow_conditional, name="retrieve")
+class CashFlowViewSet(OwnerViewSetMixin, ModelViewSet):
     """ViewSet для ДДС"""
 
     queryset: QuerySet[CashFlow] = CashFlow.objects.all()
@@ -543,6 +921,8 @@ class CashFlowViewSet(ModelViewSet):
 
     def get_queryset(self) -> QuerySet[CashFlow]:
         queryset = super().get_queryset()
+        if getattr(self, "swagger_fake_view", False):
+            return queryset
 
         # Получаем параметры периода из запроса
         start_date = self.request.query_params.get("start_date")
@@ -556,15 +936,97 @@ class CashFlowViewSet(ModelViewSet):
                     "Некорректный формат даты. Используйте YYYY-MM-DD"
                 )
 
-        return queryset.order_by("-date")
+        # Полные комментарии — из CashFlowNote в том же запросе (LEFT JOIN)
+        return queryset.select_related("note").order_by("-date")
+
+    def create(self, request, *args, **kwargs) -> Response:
+        """Создание записи; поддерживает заголовок Idempotency-Key"""
+        return run_idempotent(
+            request, "cashflow.create", lambda: self._create(request)
+        )
+
+    def initial(self, request, *args: any, **kwargs: any) -> None:
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            sync_ingested(request.user.pk)
+
+    def _create(self, request) -> Response:
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # Prefer: respond-async — запись принимается в буфер записи (если включен)
+        prefer = request.headers.get("Prefer", "")
+        if settings.CASHFLOW_INGEST_ENABLED and "respond-async" in prefer:
+            return self._ingest(serializer)
+        # Запись с внешним идентификатором (source_reference) создается не
+        # более одного раза: повтор возвращает уже сохраненную запись
+        fingerprint = None
+        if serializer.validated_data.get("source_reference"):
+            fingerprint = fingerprint_of(CashFlow(**serializer.validated_data))
+        try:
+            with transaction.atomic():
+                self.perform_create(serializer, fingerprint=fingerprint)
+        except IntegrityError:
+            existing = CashFlow.objects.filter(
+                owner=request.user, fingerprint=fingerprint
+            ).first()
+            if fingerprint is None or existing is None:
+                raise
+            return Response(self.get_serializer(existing).data, status=200)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=201, headers=headers)
+
+    def _ingest(self, serializer: Serializer) -> Response:
+        """
+        Проверенная запись принимается в буфер записи и фиксируется позже
+        пачкой; ответ 202 содержит ingest_token записи.
+        """
+        from .services.ingest import get_buffer
+
+        token = get_buffer().append(CashFlow(**serializer.validated_data))
+        return Response(
+            {**serializer.data, "ingest_token": str(token)},
+            status=202,
+            headers={"Preference-Applied": "respond-async"},
+        )
 
-    def perform_create(self, serializer: Serializer) -> None:
+    def perform_create(self, serializer: Serializer, **extra) -> None:
         validated_data = CashFlowValidator.validate_all(serializer.validated_data)
-        serializer.save(**validated_data)
+        serializer.save(**validated_data, **extra)
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request) -> Response:
+        """
+        Идемпотентная массовая загрузка записей ДДС.
+
+        Принимает список записей в формате создания. Записи, уже загруженные
+        ранее (совпадает отпечаток содержимого), пропускаются; в ответе —
+        число созданных записей и id для каждой записи списка.
+        Поддерживает заголовок Idempotency-Key.
+        """
+        return run_idempotent(request, "cashflow.bulk", lambda: self._bulk(request))
+
+    def _bulk(self, request) -> Response:
+        if not isinstance(request.data, list):
+            return Response({"error": "Ожидается список записей"}, status=400)
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        records = [CashFlow(**item) for item in serializer.validated_data]
+        try:
+            result = import_records(records)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response(result, status=201 if result["created"] else 200)
 
     @action(detail=False, methods=["get"])
+    @method_decorator(cashflow_conditional)
     def period_stats(self, request) -> Response:
-        """Дополнительный endpoint для статистики за период"""
+        """
+        Дополнительный endpoint для статистики за период.
+
+        У каждой записи converted_amount — сумма в валюте currency (по
+        умолчанию базовой), пересчитанная в том же запросе. Период с
+        архивными месяцами отклоняется (400): их записей в базе нет.
+        """
         start_date = request.query_params.get("start_date")
         end_date = request.query_params.get("end_date")
 
@@ -572,18 +1034,224 @@ class CashFlowViewSet(ModelViewSet):
             return Response(
                 {"error": "Необходимо указать start_date и end_date"}, status=400
             )
+        try:
+            currency = normalize_currency(request.query_params.get("currency"))
+            # Архивных записей в базе нет — неполный ответ хуже отказа
+            ensure_not_archived(parse_date(start_date), parse_date(end_date))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
 
         try:
             queryset = self.get_queryset().filter(
                 date__gte=start_date, date__lte=end_date
             )
+            queryset = queryset.annotate(converted_amount=converted_amount(currency))
             serializer = self.get_serializer(queryset, many=True)
             return Response(serializer.data)
         except (ValueError, TypeError):
             return Response({"error": "Некорректный формат даты"}, status=400)
 
+    @action(detail=False, methods=["get"])
+    def pivot(self, request) -> Response:
+        """
+        Сводная матрица «категории/подкатегории × месяцы».
 
-class StatusViewSet(ModelViewSet):
+        Параметры: rows (category или subcategory), start_date, end_date,
+        status, operation_type, currency (валюта отчета, по умолчанию базовая).
+        """
+        params = request.query_params
+        try:
+            pivot = build_pivot(
+                filter_cashflows(CashFlow.objects.filter(owner=request.user), params),
+                params.get("rows", "category"),
+                parse_date(params.get("start_date")),
+                parse_date(params.get("end_date")),
+                params.get("currency"),
+                ArchiveFilter.from_params(params, owner=request.user.pk),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response(pivot.as_dict())
+
+    @action(detail=False, methods=["get"])
+    def compare(self, request) -> Response:
+        """
+        Сравнение периода с базовыми периодами (MoM, YoY, произвольные).
+
+        Параметры: start_date и end_date (текущий период), baseline — один или
+        несколько раз: mom, yoy, prev или YYYY-MM-DD:YYYY-MM-DD (по умолчанию
+        mom), dimension (category, subcategory, operation_type, status),
+        status, operation_type, currency (валюта отчета).
+        """
+        params = request.query_params
+        try:
+            start_date = parse_date(params.get("start_date"))
+            end_date = parse_date(params.get("end_date"))
+            if not start_date or not end_date:
+                return Response(
+                    {"error": "Необходимо указать start_date и end_date"}, status=400
+                )
+            baselines = {
+                baseline: parse_baseline(baseline, start_date, end_date)
+                for baseline in params.getlist("baseline") or ["mom"]
+            }
+            filters = {
+                "status": params.get("status"),
+                "operation_type": params.get("operation_type"),
+            }
+            result = compare_periods(
+                filter_cashflows(CashFlow.objects.filter(owner=request.user), filters),
+                params.get("dimension", "category"),
+                (start_date, end_date),
+                baselines,
+                params.get("currency"),
+                ArchiveFilter.from_params(filters, owner=request.user.pk),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response(result)
+
+    @action(detail=False, methods=["get"])
+    def cube(self, request) -> Response:
+        """
+        Произвольный срез записей ДДС из колоночного куба в памяти.
+
+        Параметры: group_by (day, week, month или year и/или status,
+        operation_type, category, subcategory — через запятую), start_date,
+        end_date и фильтры status, operation_type, category, subcategory
+        (id через запятую). Суммы — в базовой валюте.
+        """
+        if not settings.CASHFLOW_CUBE_ENABLED:
+            return Response(
+                {"error": "Куб отключен (CASHFLOW_CUBE_ENABLED)"}, status=404
+            )
+        from .services.cube import CubeQuery, ledger_cube
+
+        try:
+            result = ledger_cube.query(
+                CubeQuery.from_params(request.query_params, owner=request.user.pk)
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response(result)
+
+    @action(detail=False, methods=["get"])
+    def anomalies(self, request) -> Response:
+        """
+        Аномальные суммы и всплески частоты операций по подкатегориям.
+
+        Параметры: method (mad или zscore), window, threshold, min_periods,
+        since_id (инкрементальная проверка новых записей), subcategory,
+        limit (число выбросов в ответе, по умолчанию 100).
+        """
+        from .services.anomalies import detect_anomalies
+
+        params = request.query_params
+        try:
+            queryset = CashFlow.objects.filter(owner=request.user)
+            if params.get("subcategory"):
+                queryset = queryset.filter(subcategory_id=int(params["subcategory"]))
+            result = detect_anomalies(
+                queryset,
+                method=params.get("method", "mad"),
+                window=int(params.get("window", 30)),
+                threshold=(
+                    float(params["threshold"]) if params.get("threshold") else None
+                ),
+                min_periods=int(params.get("min_periods", 5)),
+                since_id=int(params["since_id"]) if params.get("since_id") else None,
+            )
+            limit = int(params.get("limit", 100))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        result["outliers"] = result["outliers"][:limit]
+        return Response(result)
+
+    @action(detail=False, methods=["get"])
+    def budgets(self, request) -> Response:
+        """
+        Бюджет и факт за месяц.
+
+        Параметр: month (YYYY-MM, по умолчанию текущий месяц).
+        """
+        try:
+            month = parse_month(request.query_params.get("month"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response(budget_report(month or timezone.now().date(), request.user))
+
+    @action(detail=False, methods=["post"])
+    def reconcile(self, request) -> Response:
+        """
+        Сверка банковской выписки с записями ДДС.
+
+        Принимает CSV-файл в поле file (multipart) и параметры window (окно
+        дат, дней, по умолчанию 3), tolerance (допуск по сумме), currency,
+        delimiter, date_column, amount_column, description_column, limit
+        (число id несопоставленных записей ДДС в ответе, по умолчанию 1000).
+        """
+        from .services.reconciliation import load_statement, reconcile
+
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response({"error": "Необходимо передать файл выписки"}, status=400)
+        params = request.data
+        try:
+            lines = load_statement(
+                upload.read().decode("utf-8-sig"),
+                date_column=params.get("date_column", "date"),
+                amount_column=params.get("amount_column", "amount"),
+                description_column=params.get("description_column", "description"),
+                delimiter=params.get("delimiter") or None,
+            )
+            result = reconcile(
+                lines,
+                window=int(params.get("window", 3)),
+                tolerance=Decimal(params.get("tolerance", "0")),
+                currency=params.get("currency"),
+                queryset=CashFlow.objects.filter(owner=request.user),
+            )
+            limit = int(params.get("limit", 1000))
+        except UnicodeDecodeError:
+            return Response({"error": "Файл должен быть в кодировке UTF-8"}, status=400)
+        except (ValueError, InvalidOperation) as e:
+            return Response({"error": str(e)}, status=400)
+        result["unmatched_ledger"] = result["unmatched_ledger"][:limit]
+        return Response(result)
+
+    @action(detail=False, methods=["get"])
+    def forecast(self, request) -> Response:
+        """
+        Прогноз остатка и потоков по типам операций и категориям.
+
+        Параметры: horizon — один или несколько раз (по умолчанию 30, 90, 180
+        дней), history_days — глубина истории (по умолчанию 730 дней).
+        """
+        try:
+            forecast = _forecast(request.query_params, request.user)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response(forecast)
+
+
+class UsageViewSetMixin:
+    """
+    Поля operations_count, operations_total и last_used в списке и карточке
+    справочника и сортировка по ним (?ordering=-operations_count)
+    """
+
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    ordering_fields: list[str] = SORT_FIELDS
+    ordering: list[str] = ["name"]
+
+    def get_queryset(self) -> QuerySet:
+        queryset = super().get_queryset()
+        if self.action in ("list", "retrieve"):
+            queryset = with_usage(queryset)
+        return queryset
+
+
+class StatusViewSet(OwnerViewSetMixin, UsageViewSetMixin, ModelViewSet):
     """ViewSet для статуса операции"""
 
     queryset: QuerySet[Status] = Status.objects.all()
@@ -591,7 +1259,7 @@ class StatusViewSet(ModelViewSet):
     filterset_fields: list[str] = ["name"]
 
 
-class OperationTypeViewSet(ModelViewSet):
+class OperationTypeViewSet(OwnerViewSetMixin, UsageViewSetMixin, ModelViewSet):
     """ViewSet для типа операции"""
 
     queryset: QuerySet[OperationType] = OperationType.objects.all()
@@ -599,7 +1267,31 @@ class OperationTypeViewSet(ModelViewSet):
     filterset_fields: list[str] = ["name"]
 
 
-class CategoryViewSet(ModelViewSet):
+class MergeActionMixin:
+    """Действие объединения элемента справочника с другим"""
+
+    @action(detail=True, methods=["get", "post"], url_path="merge")
+    def merge_into(self, request, pk=None) -> Response:
+        """
+        GET — число записей ДДС, шаблонов, подкатегорий и бюджетов, которые
+        будут перенесены; POST с полем target (id) — перенос и удаление
+        исходного элемента.
+        """
+        source = self.get_object()
+        if request.method == "GET":
+            return Response(merge_preview(source))
+        target = self.get_queryset().filter(pk=request.data.get("target")).first()
+        if target is None:
+            return Response({"error": "Не найден элемент для объединения"}, status=400)
+        try:
+            return Response(merge(source, target))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+
+class CategoryViewSet(
+    OwnerViewSetMixin, UsageViewSetMixin, MergeActionMixin, ModelViewSet
+):
     """ViewSet для категории"""
 
     queryset: QuerySet[Category] = Category.objects.all().select_related(
@@ -609,7 +1301,9 @@ class CategoryViewSet(ModelViewSet):
     filterset_fields: list[str] = ["name", "operation_type"]
 
 
-class SubCategoryViewSet(ModelViewSet):
+class SubCategoryViewSet(
+    OwnerViewSetMixin, UsageViewSetMixin, MergeActionMixin, ModelViewSet
+):
     """ViewSet для подкатегории"""
 
     queryset: QuerySet[SubCategory] = SubCategory.objects.all().select_related(
@@ -617,3 +1311,276 @@ class SubCategoryViewSet(ModelViewSet):
     )
     serializer_class: Serializer = SubCategorySerializer
     filterset_fields: list[str] = ["name", "category"]
+
+
+# Асинхронные API (ASGI)
+
+
+def _parse_period(request: HttpRequest) -> tuple[date | None, date | None]:
+    """
+    Разбирает параметры start_date и end_date из строки запроса.
+
+    Raises:
+        ValueError: Если дата передана в некорректном формате
+    """
+    start_date = request.GET.get("start_date")
+    end_date = request.GET.get("end_date")
+    return (
+        datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None,
+        datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None,
+    )
+
+
+def _page_url(request: HttpRequest, page: int | None) -> str | None:
+    """Строит абсолютную ссылку на страницу выдачи (в формате DRF-пагинации)"""
+    if page is None:
+        return None
+    params = request.GET.copy()
+    params["page"] = page
+    return request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+
+
+@owner_required
+@cashflow_conditional
+async def cashflow_list_async(request: HttpRequest) -> JsonResponse:
+    """
+    Асинхронный аналог GET /api/cashflows/.
+
+    Фильтрует записи по start_date/end_date и возвращает страницу в том же
+    формате, что и PageNumberPagination DRF (count, next, previous, results).
+    """
+    try:
+        start_date, end_date = _parse_period(request)
+        page = int(request.GET.get("page", 1))
+    except ValueError:
+        return JsonResponse(
+            {"error": "Некорректный формат даты. Используйте YYYY-MM-DD"}, status=400
+        )
+
+    await sync_to_async(sync_ingested)(request.user.pk)
+    queryset = (
+        CashFlow.objects.filter(owner=request.user)
+        .select_related("note")
+        .order_by("-date")
+    )
+    if start_date and end_date:
+        queryset = queryset.filter(date__gte=start_date, date__lte=end_date)
+
+    page_size = settings.REST_FRAMEWORK["PAGE_SIZE"]
+    count = await queryset.acount()
+    offset = (page - 1) * page_size
+    if page < 1 or (offset >= count and page != 1):
+        return JsonResponse({"detail": "Неправильная страница."}, status=404)
+
+    objects = [obj async for obj in queryset[offset : offset + page_size]]
+    return JsonResponse(
+        {
+            "count": count,
+            "next": _page_url(request, page + 1 if offset + page_size < count else None),
+            "previous": _page_url(request, page - 1 if page > 1 else None),
+            "results": CashFlowSerializer(objects, many=True).data,
+        }
+    )
+
+
+@owner_required
+@cashflow_conditional
+async def cashflow_detail_async(request: HttpRequest, pk: int) -> JsonResponse:
+    """Асинхронный аналог GET /api/cashflows/<pk>/"""
+    await sync_to_async(sync_ingested)(request.user.pk)
+    try:
+        cashflow = await CashFlow.objects.select_related("note").aget(
+            pk=pk, owner=request.user
+        )
+    except CashFlow.DoesNotExist:
+        return JsonResponse({"detail": "Не найдено."}, status=404)
+    return JsonResponse(CashFlowSerializer(cashflow).data)
+
+
+@owner_required
+@cashflow_conditional
+async def period_stats_async(request: HttpRequest) -> JsonResponse:
+    """Асинхронный аналог GET /api/cashflows/period_stats/"""
+    try:
+        start_date, end_date = _parse_period(request)
+    except ValueError:
+        return JsonResponse({"error": "Некорректный формат даты"}, status=400)
+
+    if not start_date or not end_date:
+        return JsonResponse(
+            {"error": "Необходимо указать start_date и end_date"}, status=400
+        )
+
+    try:
+        currency = normalize_currency(request.GET.get("currency"))
+        await sync_to_async(ensure_not_archived)(start_date, end_date)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    await sync_to_async(sync_ingested)(request.user.pk)
+    queryset = (
+        CashFlow.objects.filter(
+            owner=request.user, date__gte=start_date, date__lte=end_date
+        )
+        .select_related("note")
+        .annotate(converted_amount=converted_amount(currency))
+        .order_by("-date")
+    )
+    objects = [obj async for obj in queryset]
+    return JsonResponse(CashFlowSerializer(objects, many=True).data, safe=False)
+
+
+@owner_required
+async def reference_tree_async(request: HttpRequest) -> JsonResponse:
+    """
+    Дерево справочников: типы операций -> категории -> подкатегории.
+
+    Собирается тремя запросами без N+1, используется формами и дашбордом
+    для загрузки всех справочников одним обращением.
+    """
+    owner = request.user
+    tree = {
+        operation_type["id"]: {**operation_type, "categories": []}
+        async for operation_type in OperationType.objects.filter(owner=owner)
+        .order_by("name")
+        .values("id", "name")
+    }
+    categories = {}
+    async for category in (
+        Category.objects.filter(owner=owner)
+        .order_by("name")
+        .values("id", "name", "operation_type_id")
+    ):
+        node = {"id": category["id"], "name": category["name"], "subcategories": []}
+        categories[category["id"]] = node
+        tree[category["operation_type_id"]]["categories"].append(node)
+    async for subcategory in (
+        SubCategory.objects.filter(owner=owner)
+        .order_by("name")
+        .values("id", "name", "category_id")
+    ):
+        categories[subcategory["category_id"]]["subcategories"].append(
+            {"id": subcategory["id"], "name": subcategory["name"]}
+        )
+    statuses = [
+        s
+        async for s in Status.objects.filter(owner=owner)
+        .order_by("name")
+        .values("id", "name")
+    ]
+    return JsonResponse(
+        {"statuses": statuses, "operation_types": list(tree.values())}
+    )
+
+
+@owner_required
+async def cashflow_events(request: HttpRequest) -> StreamingHttpResponse:
+    """
+    Server-Sent Events с изменениями ДДС для дашбордов.
+
+    Первым событием отправляется снимок итогов по типам операций в базовой
+    валюте (один агрегирующий запрос), дальше — только изменения: новые,
+    измененные и удаленные записи с приращением итогов и изменения справочников.
+    Пользователь получает только события своих записей.
+    """
+    broadcaster = events.get_broadcaster()
+    owner_id = request.user.pk
+
+    async def stream():
+        # Подписываемся до снимка, чтобы не потерять изменения между ними
+        subscription = broadcaster.subscribe()
+        try:
+            # Итоги в базовой валюте по курсу на дату операции, как в отчетах;
+            # записи без курса считаются в unconverted
+            totals = {
+                str(row["operation_type_id"]): {
+                    "total": row["total"] or Decimal("0"),
+                    "count": row["count"],
+                    "unconverted": row["unconverted"],
+                }
+                async for row in CashFlow.objects.filter(owner_id=owner_id)
+                .order_by()
+                .values("operation_type_id")
+                .annotate(
+                    total=amount_sum(),
+                    count=Count("id"),
+                    unconverted=Count("id", filter=IsNull(converted_amount(), True)),
+                )
+            }
+            # Архивные месяцы — по итогам архива (суммы уже в базовой валюте)
+            async for row in (
+                CashFlowRollup.objects.filter(owner_id=owner_id)
+                .order_by()
+                .values("operation_type_id")
+                .annotate(total=Sum("amount_base"), count=Sum("count"))
+            ):
+                current = totals.setdefault(
+                    str(row["operation_type_id"]),
+                    {"total": Decimal("0"), "count": 0, "unconverted": 0},
+                )
+                current["total"] += row["total"]
+                current["count"] += row["count"]
+            yield _sse_message(
+                {"type": "snapshot", "currency": base_currency(), "totals": totals}
+            )
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.get(), timeout=SSE_HEARTBEAT
+                    )
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if event.get("owner", owner_id) != owner_id:
+                    continue
+                yield _sse_message(event)
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def _sse_message(event: dict[str, any]) -> str:
+    """Форматирует событие в формате text/event-stream"""
+    return f"event: {event['type']}\ndata: {json.dumps(event, cls=DjangoJSONEncoder)}\n\n"
+
+
+def _schema_etag(request: HttpRequest, format: str) -> str | None:
+    fmt = format.lstrip(".")
+    return get_schema().etag(fmt) if fmt in SCHEMA_FORMATS else None
+
+
+@condition(etag_func=_schema_etag)
+def api_schema(request: HttpRequest, format: str) -> HttpResponse:
+    """
+    Схема OpenAPI (/swagger.json, /swagger.yaml) из заранее сгенерированного
+    файла; повторный запрос с If-None-Match получает 304.
+    """
+    fmt = format.lstrip(".")
+    if fmt not in SCHEMA_FORMATS:
+        raise Http404
+    response = HttpResponse(get_schema().content[fmt], content_type=SCHEMA_FORMATS[fmt])
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+@lru_cache(maxsize=None)
+def _schema_ui_view(renderer: str):
+    from drf_yasg.views import get_schema_view
+    from rest_framework import permissions
+
+    schema_view = get_schema_view(
+        api_info(), public=True, permission_classes=(permissions.AllowAny,)
+    )
+    return schema_view.with_ui(renderer, cache_timeout=0)
+
+
+def schema_ui(request: HttpRequest, renderer: str) -> HttpResponse:
+    """
+    Страница Swagger UI или ReDoc. drf_yasg импортируется при первом открытии
+    документации; схему страница загружает из api_schema (SPEC_URL в настройках).
+    """
+    return _schema_ui_view(renderer)(request)
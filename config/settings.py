@@ -9,6 +9,9 @@ load_dotenv(override=True)
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.getenv("SECRET_KEY")
+if not SECRET_KEY and "test" in sys.argv:
+    # Тестам не нужен настоящий ключ: запуск без .env не должен падать
+    SECRET_KEY = "insecure-test-key"
 
 DEBUG = os.getenv("DEBUG", False) == "True"
 
@@ -16,6 +19,12 @@ NULLABLE = {"blank": True, "null": True}
 
 ALLOWED_HOSTS = ["*"]
 
+# django.setup() импортирует пакет каждого приложения: от rest_framework —
+# пакет, apps и checks, от drf_yasg — только пакет. Остальные модули DRF (и
+# через rest_framework.compat — yaml и requests) загружаются вместе с URLconf
+# к первому запросу, генератор схемы drf_yasg — при первом открытии
+# документации. Админка и django_filters загружаются при старте целиком (см.
+# profile_startup): фильтры нужны первому же запросу к API
 INSTALLED_APPS = [
     "django.contrib.admin",
     "django.contrib.auth",
@@ -31,6 +40,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    # Сжатие ответов (gzip, brotli) — до остальных, чтобы получать готовые ответы
+    "cashflow.middleware.CompressionMiddleware",
+    # Собранная статика со сжатыми копиями и кэшированием навсегда
+    "cashflow.middleware.StaticFilesMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -92,15 +105,24 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# У каждого пользователя свой учет: страницы и API доступны после входа
+LOGIN_URL = "login"
+LOGIN_REDIRECT_URL = "cashflow:cashflow-list"
+LOGOUT_REDIRECT_URL = "login"
+
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
-        "rest_framework.permissions.AllowAny",
+        "rest_framework.permissions.IsAuthenticated",
     ],
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 20,
 }
 
+# Интерфейсы документации берут схему из заранее сгенерированного файла
+SWAGGER_SETTINGS = {"SPEC_URL": ("schema-json", {"format": ".json"})}
+REDOC_SETTINGS = {"SPEC_URL": ("schema-json", {"format": ".json"})}
+
 LANGUAGE_CODE = "ru"
 
 TIME_ZONE = "UTC"
@@ -113,7 +135,54 @@ STATIC_URL = "static/"
 STATICFILES_DIRS = (BASE_DIR / "static",)
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 
+# collectstatic добавляет в имена файлов отпечаток содержимого и создает сжатые копии
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "cashflow.storage.CompressedManifestStaticFilesStorage"},
+}
+if "test" in sys.argv:
+    # Тесты не требуют собранной статики
+    STORAGES["staticfiles"] = {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+    }
+
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Бэкенд рассылки событий для SSE: local (в пределах процесса) или postgres (LISTEN/NOTIFY)
+CASHFLOW_EVENTS_BACKEND = os.getenv("CASHFLOW_EVENTS_BACKEND", "local")
+
+# Базовая валюта учета: курсы ExchangeRate задаются в ней, отчеты по умолчанию строятся в ней
+CASHFLOW_BASE_CURRENCY = os.getenv("CASHFLOW_BASE_CURRENCY") or "RUB"
+
+# Каталог архивных файлов записей ДДС (Parquet), см. archive_cashflows
+CASHFLOW_ARCHIVE_DIR = os.getenv("CASHFLOW_ARCHIVE_DIR") or os.path.join(
+    BASE_DIR, "archive"
+)
+
+# Каталог сгенерированной схемы OpenAPI, см. generate_schema
+CASHFLOW_SCHEMA_DIR = os.getenv("CASHFLOW_SCHEMA_DIR") or os.path.join(
+    BASE_DIR, "schema"
+)
+
+# Колонка сумм ДДС для агрегатов: decimal (amount) или minor (amount_minor, целые копейки)
+CASHFLOW_AMOUNT_STORAGE = os.getenv("CASHFLOW_AMOUNT_STORAGE") or "decimal"
+
+# Колоночный куб записей ДДС в памяти процесса для /api/cashflows/cube/
+CASHFLOW_CUBE_ENABLED = os.getenv("CASHFLOW_CUBE_ENABLED", False) == "True"
+
+# Буфер записи для POST /api/cashflows/ с заголовком Prefer: respond-async
+CASHFLOW_INGEST_ENABLED = os.getenv("CASHFLOW_INGEST_ENABLED", False) == "True"
+
+# Каталог журнала буфера записи (локальный диск воркера)
+CASHFLOW_INGEST_DIR = os.getenv("CASHFLOW_INGEST_DIR") or os.path.join(
+    BASE_DIR, "ingest"
+)
+
+# Буфер фиксируется, когда в нем набирается столько записей...
+CASHFLOW_INGEST_BATCH_SIZE = int(os.getenv("CASHFLOW_INGEST_BATCH_SIZE") or 500)
+
+# ...или самая старая запись ждет дольше стольких секунд
+CASHFLOW_INGEST_MAX_DELAY = float(os.getenv("CASHFLOW_INGEST_MAX_DELAY") or 1)
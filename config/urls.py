@@ -1,33 +1,13 @@
 from django.contrib import admin
 from django.urls import include, path
-from drf_yasg import openapi
-from drf_yasg.views import get_schema_view
-from rest_framework import permissions
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Документация по API для ДДС",
-        default_version="v1",
-        description="",
-        terms_of_service="https://www.example.com/",
-        contact=openapi.Contact(email="mail@mail.ru"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
 
+from cashflow.views import api_schema, schema_ui
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("accounts/", include("django.contrib.auth.urls")),
     path("", include("cashflow.urls", namespace="cashflow")),
-    path(
-        "swagger<format>/", schema_view.without_ui(cache_timeout=0), name="schema-json"
-    ),
-    path(
-        "swagger/",
-        schema_view.with_ui("swagger", cache_timeout=0),
-        name="schema-swagger-ui",
-    ),
-    path("redoc/", schema_view.with_ui("redoc", cache_timeout=0), name="schema-redoc"),
+    path("swagger<format>/", api_schema, name="schema-json"),
+    path("swagger/", schema_ui, {"renderer": "swagger"}, name="schema-swagger-ui"),
+    path("redoc/", schema_ui, {"renderer": "redoc"}, name="schema-redoc"),
 ]